@@ -1,12 +1,11 @@
 from logging.config import fileConfig
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.pool import NullPool
 from alembic import context
 import asyncio
-import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Load settings from the environment and the .env file
+from app.config import get_settings
 
 # Import your Base and models here
 from app.database import Base
@@ -19,16 +18,16 @@ target_metadata = Base.metadata
 config = context.config
 
 # Set up logging
-fileConfig(config.config_file_name)
+fileConfig(config.config_file_name, disable_existing_loggers=False)  # Keep the app's loggers working
 
-# Load the DATABASE_URL from the .env file
-DATABASE_URL = os.getenv('DATABASE_URL')
+settings = get_settings()
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL is not set in the .env file")
+# Load the DATABASE_URL from the settings (raises if it is not set), unless the caller set
+# sqlalchemy.url on the Alembic config (e.g. the tests, or scripts migrating another database)
+DATABASE_URL = config.get_main_option("sqlalchemy.url") or settings.database_url
 
-# Create the async engine
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Create the async engine; migrations use a single short-lived connection, so no pool is kept
+engine = create_async_engine(DATABASE_URL, echo=settings.db_echo, poolclass=NullPool)
 
 def run_migrations_offline():
     """Run migrations in 'offline' mode."""
@@ -0,0 +1,36 @@
+"""Add catalog_versions table for quest catalog ETags
+
+Revision ID: 3b9e4d7a6c12
+Revises: 8d3f2b6c1a97
+Create Date: 2026-10-17 15:21:47.530981
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9e4d7a6c12'
+down_revision: Union[str, None] = '8d3f2b6c1a97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    catalog_versions = op.create_table(
+        'catalog_versions',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    # Start the quest catalog at version 1 so existing clients' caches are validated from now on
+    # (bulk_insert binds its values as parameters, so the timestamp must be a Python datetime, not now())
+    op.bulk_insert(catalog_versions, [{'name': 'quests', 'version': 1, 'updated_at': datetime.now(timezone.utc)}])
+
+
+def downgrade() -> None:
+    op.drop_table('catalog_versions')
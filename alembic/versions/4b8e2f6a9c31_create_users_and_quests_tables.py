@@ -0,0 +1,61 @@
+"""Create the users and quests tables
+
+Revision ID: 4b8e2f6a9c31
+Revises: dfb2a01958f0
+Create Date: 2026-10-17 21:02:44.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b8e2f6a9c31'
+down_revision: Union[str, None] = 'dfb2a01958f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The tables as first created with Base.metadata.create_all, so a fresh database can be built with
+    # `alembic upgrade head`; databases whose tables were created that way keep them as they are
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('quests'):
+        op.create_table(
+            'quests',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(), nullable=True),
+            sa.Column('description', sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_quests_id', 'quests', ['id'])
+        op.create_index('ix_quests_title', 'quests', ['title'])
+    if not inspector.has_table('users'):
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('tID', sa.Integer(), nullable=True),  # Widened to bigint by dae151c811f1
+            sa.Column('first_name', sa.String(), nullable=True),
+            sa.Column('last_name', sa.String(), nullable=True),
+            sa.Column('username', sa.String(), nullable=True),
+            sa.Column('language_code', sa.String(), nullable=True),
+            sa.Column('is_premium', sa.Boolean(), nullable=True),
+            sa.Column('allows_write_to_pm', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_users_id', 'users', ['id'])
+        op.create_index('ix_users_tID', 'users', ['tID'], unique=True)
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if inspector.has_table('users'):
+        op.drop_index('ix_users_tID', table_name='users')
+        op.drop_index('ix_users_id', table_name='users')
+        op.drop_table('users')
+    if inspector.has_table('quests'):
+        op.drop_index('ix_quests_title', table_name='quests')
+        op.drop_index('ix_quests_id', table_name='quests')
+        op.drop_table('quests')
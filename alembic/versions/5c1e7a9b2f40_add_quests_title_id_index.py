@@ -0,0 +1,27 @@
+"""Add quests (title, id) index for keyset pagination
+
+Revision ID: 5c1e7a9b2f40
+Revises: dae151c811f1
+Create Date: 2026-10-17 10:12:41.208315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e7a9b2f40'
+down_revision: Union[str, None] = 'dae151c811f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Composite index backing `WHERE (title, id) > (:title, :id) ORDER BY title, id`
+    op.create_index('ix_quests_title_id', 'quests', ['title', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_quests_title_id', table_name='quests')
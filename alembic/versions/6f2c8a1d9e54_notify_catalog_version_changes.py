@@ -0,0 +1,43 @@
+"""Notify catalog version changes for in-memory snapshots
+
+Revision ID: 6f2c8a1d9e54
+Revises: 3b9e4d7a6c12
+Create Date: 2026-10-17 16:02:13.884120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f2c8a1d9e54'
+down_revision: Union[str, None] = '3b9e4d7a6c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return  # LISTEN/NOTIFY is Postgres-only; other databases rely on the periodic version check
+    # NOTIFY catalog_<name> with the new version, delivered to listeners when the bumping transaction commits
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_catalog_version() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('catalog_' || NEW.name, NEW.version::text);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute(
+        "CREATE TRIGGER catalog_versions_notify AFTER INSERT OR UPDATE ON catalog_versions "
+        "FOR EACH ROW EXECUTE FUNCTION notify_catalog_version()"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP TRIGGER IF EXISTS catalog_versions_notify ON catalog_versions")
+    op.execute("DROP FUNCTION IF EXISTS notify_catalog_version()")
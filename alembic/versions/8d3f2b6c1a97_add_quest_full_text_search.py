@@ -0,0 +1,114 @@
+"""Add quest full-text search column and indexes
+
+Revision ID: 8d3f2b6c1a97
+Revises: 5c1e7a9b2f40
+Create Date: 2026-10-17 14:38:05.117402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f2b6c1a97'
+down_revision: Union[str, None] = '5c1e7a9b2f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# SQLite stand-in: an external-content FTS5 table kept in sync with quests by triggers
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE quests_fts USING fts5(title, description, content='quests', content_rowid='id')",
+    "CREATE TRIGGER quests_fts_ai AFTER INSERT ON quests BEGIN "
+    "INSERT INTO quests_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER quests_fts_ad AFTER DELETE ON quests BEGIN "
+    "INSERT INTO quests_fts(quests_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER quests_fts_au AFTER UPDATE ON quests BEGIN "
+    "INSERT INTO quests_fts(quests_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO quests_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO quests_fts(quests_fts) VALUES ('rebuild')",  # Index the existing quests
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS quests_fts_au",
+    "DROP TRIGGER IF EXISTS quests_fts_ad",
+    "DROP TRIGGER IF EXISTS quests_fts_ai",
+    "DROP TABLE IF EXISTS quests_fts",
+]
+
+
+# Postgres: the column is filled by a trigger, so adding it only touches the catalog (no table rewrite
+# under an ACCESS EXCLUSIVE lock, as a GENERATED ... STORED column would need)
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce({row}title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({row}description, '')), 'B')"
+)
+POSTGRES_UPGRADE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE quests ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""CREATE OR REPLACE FUNCTION quests_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS quests_search_vector ON quests",
+    "CREATE TRIGGER quests_search_vector BEFORE INSERT OR UPDATE OF title, description ON quests "
+    "FOR EACH ROW EXECUTE FUNCTION quests_search_vector()",
+]
+
+# Rows filled per backfill statement, each one committed on its own so row locks are short-lived
+BACKFILL_BATCH_SIZE = 10_000
+
+# GIN indexes built without blocking writes: name -> definition
+SEARCH_INDEXES = {
+    'ix_quests_search_vector': "quests USING gin (search_vector)",
+    'ix_quests_title_trgm': "quests USING gin (title gin_trgm_ops)",
+}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+        return
+
+    for statement in POSTGRES_UPGRADE:
+        op.execute(statement)
+
+    # CONCURRENTLY cannot run inside a transaction: the column and trigger are committed first, then
+    # the existing rows are filled in batches (new writes are already covered by the trigger)
+    with op.get_context().autocommit_block():
+        backfill = sa.text(
+            f"UPDATE quests SET search_vector = {SEARCH_VECTOR.format(row='')} WHERE id IN ("
+            "SELECT id FROM quests WHERE search_vector IS NULL ORDER BY id LIMIT :limit)"
+        )
+        while bind.execute(backfill, {"limit": BACKFILL_BATCH_SIZE}).rowcount:
+            pass
+        for name, definition in SEARCH_INDEXES.items():
+            # A failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind: drop it so a retry rebuilds it
+            invalid = bind.execute(sa.text(
+                "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+                "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+            ), {"name": name}).first()
+            if invalid:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
+        return
+
+    with op.get_context().autocommit_block():
+        for name in reversed(SEARCH_INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    op.execute("DROP TRIGGER IF EXISTS quests_search_vector ON quests")
+    op.execute("DROP FUNCTION IF EXISTS quests_search_vector()")
+    op.execute("ALTER TABLE quests DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,92 @@
+"""Add row_counts table with triggers keeping the quest count exact
+
+Revision ID: 9a4c7e2b5d18
+Revises: 6f2c8a1d9e54
+Create Date: 2026-10-17 18:40:05.217634
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4c7e2b5d18'
+down_revision: Union[str, None] = '6f2c8a1d9e54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'row_counts',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite stand-in: row-level triggers (SQLite has no statement-level ones)
+        op.execute(
+            "CREATE TRIGGER quests_count_ai AFTER INSERT ON quests BEGIN "
+            "INSERT INTO row_counts (name, count) VALUES ('quests', 1) "
+            "ON CONFLICT (name) DO UPDATE SET count = count + 1; END"
+        )
+        op.execute(
+            "CREATE TRIGGER quests_count_ad AFTER DELETE ON quests BEGIN "
+            "UPDATE row_counts SET count = count - 1 WHERE name = 'quests'; END"
+        )
+        op.execute("INSERT INTO row_counts (name, count) SELECT 'quests', count(*) FROM quests")
+        return
+
+    # Add each statement's inserted/deleted row count (from its transition table) to the counter
+    op.execute("""
+        CREATE OR REPLACE FUNCTION count_rows() RETURNS trigger AS $$
+        DECLARE
+            delta bigint;
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                UPDATE row_counts SET count = 0 WHERE name = TG_TABLE_NAME;
+                RETURN NULL;
+            ELSIF TG_OP = 'INSERT' THEN
+                SELECT count(*) INTO delta FROM new_rows;
+            ELSE
+                SELECT -count(*) INTO delta FROM old_rows;
+            END IF;
+            IF delta <> 0 THEN
+                INSERT INTO row_counts (name, count) VALUES (TG_TABLE_NAME, delta)
+                ON CONFLICT (name) DO UPDATE SET count = row_counts.count + EXCLUDED.count;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    # Block quest writes while the existing rows are counted, so none is missed or counted twice
+    op.execute("LOCK TABLE quests IN SHARE MODE")
+    op.execute(
+        "CREATE TRIGGER quests_count_insert AFTER INSERT ON quests REFERENCING NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION count_rows()"
+    )
+    op.execute(
+        "CREATE TRIGGER quests_count_delete AFTER DELETE ON quests REFERENCING OLD TABLE AS old_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION count_rows()"
+    )
+    op.execute(
+        "CREATE TRIGGER quests_count_truncate AFTER TRUNCATE ON quests "
+        "FOR EACH STATEMENT EXECUTE FUNCTION count_rows()"
+    )
+    op.execute("INSERT INTO row_counts (name, count) SELECT 'quests', count(*) FROM quests")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS quests_count_ad")
+        op.execute("DROP TRIGGER IF EXISTS quests_count_ai")
+        op.drop_table('row_counts')
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS quests_count_truncate ON quests")
+    op.execute("DROP TRIGGER IF EXISTS quests_count_delete ON quests")
+    op.execute("DROP TRIGGER IF EXISTS quests_count_insert ON quests")
+    op.execute("DROP FUNCTION IF EXISTS count_rows()")
+    op.drop_table('row_counts')
@@ -1,7 +1,7 @@
 """Change tID column type to bigint
 
 Revision ID: dae151c811f1
-Revises: dfb2a01958f0
+Revises: 4b8e2f6a9c31
 Create Date: 2024-08-25 12:05:29.380877
 
 """
@@ -13,21 +13,23 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision: str = 'dae151c811f1'
-down_revision: Union[str, None] = 'dfb2a01958f0'
+down_revision: Union[str, None] = '4b8e2f6a9c31'
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade():
-    # Alter the tID column to bigint
-    op.alter_column('users', 'tID',
-                    type_=sa.BigInteger(),
-                    existing_type=sa.Integer(),
-                    existing_nullable=False)
+    # Alter the tID column to bigint (a plain ALTER on Postgres, a table copy on SQLite)
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('tID',
+                              type_=sa.BigInteger(),
+                              existing_type=sa.Integer(),
+                              existing_nullable=True)
 
 def downgrade():
     # Revert the column type change if needed
-    op.alter_column('users', 'tID',
-                    type_=sa.Integer(),
-                    existing_type=sa.BigInteger(),
-                    existing_nullable=False)
\ No newline at end of file
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('tID',
+                              type_=sa.Integer(),
+                              existing_type=sa.BigInteger(),
+                              existing_nullable=True)
\ No newline at end of file
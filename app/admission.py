@@ -0,0 +1,204 @@
+from collections import OrderedDict
+import math
+import time
+
+from fastapi import HTTPException, Request
+
+from app.config import get_settings
+from app.metrics import route_template
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit adjusted from connection pool wait times (additive increase, multiplicative decrease).
+
+    - **initial**: Starting limit.
+    - **min_limit** / **max_limit**: Bounds of the limit.
+    - **target_wait**: Seconds of pool wait considered healthy; longer waits shrink the limit.
+    - **backoff**: Factor the limit is multiplied by when a wait exceeds the target.
+
+    Each healthy wait grows the limit by 1/limit, about +1 per limit's worth of requests. The limit
+    shrinks at most once per `target_wait` seconds, so one batch of slow checkouts counts once.
+    """
+
+    def __init__(self, initial: int = 50, min_limit: int = 5, max_limit: int = 500,
+                 target_wait: float = 0.05, backoff: float = 0.7):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_wait = target_wait
+        self.backoff = backoff
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self.wait_ewma = 0.0  # Smoothed pool wait in seconds, for reporting
+        self.decreases = 0
+        self._last_decrease = 0.0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def observe(self, wait: float):
+        """
+        Adjust the limit from one pool wait (seconds).
+        """
+        self.wait_ewma += 0.1 * (wait - self.wait_ewma)
+        if wait > self.target_wait:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.target_wait:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.decreases += 1
+        elif self.in_flight * 2 >= self.limit:
+            # Only grow while the limit is actually in use, an idle worker must not drift to max_limit
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class TokenBuckets:
+    """
+    One token bucket per key (e.g. per Telegram ID).
+
+    - **rate**: Tokens added per second.
+    - **burst**: Most tokens a bucket holds.
+    - **maxsize**: Buckets kept, the least recently used one is dropped beyond it (and starts full again).
+    """
+
+    def __init__(self, rate: float, burst: int, maxsize: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.limited = 0
+        self._buckets: "OrderedDict[object, tuple]" = OrderedDict()  # key -> (tokens, updated_at)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key) -> float:
+        """
+        Take a token from the bucket of `key`; return 0 when granted, else the seconds until one is available.
+        """
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+            self.limited += 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController:
+    """
+    Admit requests to database-backed routes, or shed them at once while the database is saturated.
+
+    - **limit**: AdaptiveLimit shared by every admitted request, fed with the primary's pool waits.
+    - **route_limits**: Fixed concurrency caps keyed by route, e.g. `{"POST /api/quests/": 20}`.
+    - **user_buckets**: TokenBuckets limiting logins per Telegram ID (None = unlimited).
+    - **retry_after**: Seconds sent in the Retry-After header of shed requests.
+    """
+
+    def __init__(self, limit: AdaptiveLimit, route_limits: dict = None, user_buckets: TokenBuckets = None,
+                 retry_after: int = 1):
+        self.limit = limit
+        self.route_limits = dict(route_limits or {})
+        self.user_buckets = user_buckets
+        self.retry_after = retry_after
+        self.route_in_flight = {}
+        self.admitted = 0
+        self.shed = 0
+        self.shed_by_route = {}
+
+    def acquire(self, route: str) -> bool:
+        """
+        Take a slot for a request to `route`; False when it must be shed.
+        """
+        cap = self.route_limits.get(route)
+        in_flight = self.route_in_flight.get(route, 0)
+        if (cap is not None and in_flight >= cap) or not self.limit.try_acquire():
+            self.shed += 1
+            self.shed_by_route[route] = self.shed_by_route.get(route, 0) + 1
+            return False
+        self.route_in_flight[route] = in_flight + 1
+        self.admitted += 1
+        return True
+
+    def release(self, route: str):
+        self.limit.release()
+        self.route_in_flight[route] -= 1
+
+    def report(self) -> dict:
+        limit = self.limit
+        return {
+            "limit": int(limit.limit),
+            "min_limit": limit.min_limit,
+            "max_limit": limit.max_limit,
+            "in_flight": limit.in_flight,
+            "target_wait_ms": round(limit.target_wait * 1000, 3),
+            "wait_ewma_ms": round(limit.wait_ewma * 1000, 3),
+            "decreases": limit.decreases,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "routes": {
+                route: {"limit": self.route_limits.get(route), "in_flight": self.route_in_flight.get(route, 0),
+                        "shed": self.shed_by_route.get(route, 0)}
+                for route in {**self.route_limits, **self.route_in_flight, **self.shed_by_route}
+            },
+            "logins_limited": self.user_buckets.limited if self.user_buckets else 0,
+        }
+
+
+def build_admission_controller(settings=None):
+    """
+    Create the admission controller configured by the settings, or None when it is disabled.
+    """
+    settings = settings or get_settings()
+    if not settings.admission_enabled:
+        return None
+    limit = AdaptiveLimit(settings.admission_initial_limit, settings.admission_min_limit,
+                          settings.admission_max_limit, settings.admission_target_wait)
+    user_buckets = None
+    if settings.login_rate_per_second > 0:
+        user_buckets = TokenBuckets(settings.login_rate_per_second, settings.login_burst)
+    return AdmissionController(limit, settings.admission_route_limits, user_buckets, settings.admission_retry_after)
+
+
+# Process-wide controller, used by apps whose lifespan has not run; an app's own controller is created by
+# its lifespan into app.state.admission_controller when ADMISSION_ENABLED is set
+admission_controller: AdmissionController = None
+
+# Dependency to get the admission controller of the app serving the request
+def request_admission_controller(request: Request) -> AdmissionController:
+    return getattr(request.app.state, "admission_controller", admission_controller)
+
+# Router dependency holding an admission slot for the whole request, or failing fast with 503
+async def admit(request: Request):
+    controller = request_admission_controller(request)
+    if controller is None:
+        yield
+        return
+    route = f"{request.method} {route_template(request.scope)}"
+    if not controller.acquire(route):
+        raise HTTPException(status_code=503, detail="Server is busy, retry shortly",
+                            headers={"Retry-After": str(controller.retry_after)})
+    try:
+        yield
+    finally:
+        controller.release(route)
+
+# Limit how often one Telegram user can log in, raises 429 + Retry-After beyond the rate
+def check_login_rate(controller: AdmissionController, tID: int):
+    if controller is None or controller.user_buckets is None:
+        return
+    wait = controller.user_buckets.take(tID)
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many logins for this user, retry shortly",
+                            headers={"Retry-After": str(math.ceil(wait))})
@@ -0,0 +1,80 @@
+# app/api/internal_routes.py
+
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query, Request
+
+from app import admission, cache, catalog, profiler
+from app.database import request_database
+
+# Create an APIRouter instance for internal (operations) routes
+router = APIRouter()
+
+# Endpoint to inspect the database connection pool
+@router.get("/pool")
+async def read_pool_stats(request: Request):
+    """
+    Report the connection pool state of this worker's primary database.
+
+    Returns checked-out, idle and overflow connections, the configured limits and
+    connection wait-time statistics in milliseconds.
+    """
+    return request_database(request).pool_monitor.snapshot()
+
+# Endpoint to inspect the in-memory quest catalog snapshot
+@router.get("/catalog")
+async def read_catalog_stats(quest_catalog: catalog.QuestCatalog = Depends(catalog.request_quest_catalog)):
+    """
+    Report the quest catalog snapshot of this worker.
+
+    Returns its version, row count and memory footprint, its age and staleness bound in seconds,
+    and notification / reload counters. Reports `enabled: false` when snapshots are turned off.
+    """
+    if quest_catalog is None:
+        return {"enabled": False}
+    return {"enabled": True, **quest_catalog.report()}
+
+# Endpoint to inspect the user cache
+@router.get("/user-cache")
+async def read_user_cache_stats(user_cache: cache.UserCache = Depends(cache.request_user_cache)):
+    """
+    Report the user cache counters of this worker.
+
+    Returns hits, negative hits (known-unknown tIDs), misses, coalesced lookups, invalidations,
+    evictions and current sizes. Reports `enabled: false` when the cache is turned off.
+    """
+    if user_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **user_cache.stats()}
+
+# Endpoint to inspect admission control
+@router.get("/admission")
+async def read_admission_stats(
+        controller: admission.AdmissionController = Depends(admission.request_admission_controller)):
+    """
+    Report the admission control state of this worker.
+
+    Returns the adaptive concurrency limit, in-flight requests, the smoothed pool wait, admitted and
+    shed request counts, per-route caps and rate-limited logins. Reports `enabled: false` when it is turned off.
+    """
+    if controller is None:
+        return {"enabled": False}
+    return {"enabled": True, **controller.report()}
+
+# Endpoint to inspect the query profiler
+@router.get("/queries")
+async def read_query_stats(limit: int = Query(20, ge=1, le=1000),
+                           sort: Literal["total_ms", "mean_ms", "p95_ms", "max_ms", "calls", "slow"] = "total_ms"):
+    """
+    Report the statements of this worker by shape (literals and parameters normalized away).
+
+    - **limit**: Number of statement shapes (and N+1 routes) returned.
+    - **sort**: Ranking of the statement shapes.
+
+    Returns per-shape calls, latency and rows with the last sampled plan of a slow execution, and the
+    routes flagged for running one read shape many times per request. Reports `enabled: false` when
+    the profiler is turned off.
+    """
+    if profiler.query_profiler is None:
+        return {"enabled": False}
+    return {"enabled": True, **profiler.query_profiler.report(limit, sort)}
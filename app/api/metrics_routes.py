@@ -0,0 +1,44 @@
+# app/api/metrics_routes.py
+
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from app import admission, cache, registration
+from app.database import request_database
+from app.metrics import registry
+
+# Create an APIRouter instance for the metrics endpoint
+router = APIRouter()
+
+# Endpoint exposing the request and pool metrics for Prometheus
+@router.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics(request: Request):
+    """
+    Return this worker's metrics in the Prometheus text exposition format.
+    """
+    pool = request_database(request).pool_monitor.snapshot()
+    gauges = {
+        "db_pool_checked_out": pool["checked_out"] or 0,
+        "db_pool_idle": pool["idle"] or 0,
+        "db_pool_overflow": pool["overflow"] or 0,
+        "db_pool_timeouts_total": pool["timeouts"],
+        "db_pool_wait_seconds_max": pool["wait_ms"]["max"] / 1000,
+    }
+    batcher = registration.request_registration_batcher(request)
+    if batcher is not None:
+        gauges["registration_queue_depth"] = batcher.queued
+        gauges["registration_rejected_total"] = batcher.rejected
+    user_cache = cache.request_user_cache(request)
+    if user_cache is not None:
+        gauges.update({f"user_cache_{name}": value for name, value in user_cache.stats().items()})
+    controller = admission.request_admission_controller(request)
+    if controller is not None:
+        report = controller.report()
+        gauges.update({
+            "admission_limit": report["limit"],
+            "admission_in_flight": report["in_flight"],
+            "admission_admitted_total": report["admitted"],
+            "admission_shed_total": report["shed"],
+            "admission_logins_limited_total": report["logins_limited"],
+        })
+    return PlainTextResponse(registry.render(gauges), media_type="text/plain; version=0.0.4")
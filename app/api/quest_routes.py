@@ -1,12 +1,26 @@
 # app/api/quest_routes.py
 
-from fastapi import APIRouter, Depends
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Literal, Optional
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
+import csv
+import io
+import time
 
-from app.schemas import QuestCreate, Quest
-from app.crud import create_quest, get_quests
-from app.database import get_db
+import orjson
+
+from app.schemas import QuestCreate, Quest, QuestBulkBatch, QuestBulkResult, QuestSearchResult
+from app.config import Settings, request_settings
+from app.crud import count_quests, create_quest, get_catalog_version, get_quests, insert_quests, stream_quests
+from app.database import get_db, get_read_db, request_database, client_key
+from app.utils.pagination import SORT_KEYS, SEARCH_KEYS, encode_cursor, decode_cursor
+from app.utils.bulk import NDJSON_MEDIA_TYPE, iter_json_items
+from app.utils.responses import ORJSONResponse
+from app.utils.conditional import catalog_headers, is_not_modified
+from app.search import search_quests
+from app import catalog
 
 # Create an APIRouter instance for quest-related routes
 router = APIRouter()
@@ -24,17 +38,215 @@ async def create_new_quest(quest: QuestCreate, db: AsyncSession = Depends(get_db
     """
     return await create_quest(quest, db)
 
+# Endpoint to create many quests at once with batched inserts
+@router.post(
+    "/quests/bulk",
+    response_model=QuestBulkResult,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/QuestCreate"}}},
+        NDJSON_MEDIA_TYPE: {"schema": {"$ref": "#/components/schemas/QuestCreate"}},
+    }}},
+)
+async def create_quests_bulk(request: Request, db: AsyncSession = Depends(get_db),
+                             batch_size: int = Query(1000, ge=1, le=10000), atomic: bool = True,
+                             method: Literal["auto", "insert", "copy"] = "auto"):
+    """
+    Create quests from a JSON array or a streamed NDJSON body (`Content-Type: application/x-ndjson`).
+
+    - **batch_size**: Number of quests written per statement.
+    - **atomic**: If true, all quests are stored in one transaction and any invalid item or failing batch
+      rolls everything back (422, or 400 for invalid JSON; nothing stored). If false, every batch is
+      committed on its own; failed batches are rolled back and reported while the others are kept, and
+      invalid JSON ends the upload with a failed batch after the committed ones.
+    - **method**: `insert` (multi-row INSERT ... RETURNING id), `copy` (Postgres COPY, asyncpg only)
+      or `auto` (COPY when available).
+
+    Returns the assigned ids and per-batch timing.
+    """
+    copy_available = db.bind.dialect.driver == "asyncpg"
+    if method == "copy" and not copy_available:
+        raise HTTPException(status_code=400, detail="COPY is only available on PostgreSQL (asyncpg)")
+    use_copy = method == "copy" or (method == "auto" and copy_available)
+
+    batches = []
+    position = 0  # Index of the first item of the current batch in the request
+
+    async def write_batch(items: list):
+        nonlocal position
+        batch = QuestBulkBatch(index=len(batches), size=len(items), status="pending", elapsed_ms=0)
+        start = time.perf_counter()
+        try:
+            quests = []
+            for offset, item in enumerate(items):
+                try:
+                    quests.append(QuestCreate.model_validate(item))
+                except ValidationError as exc:
+                    raise ValueError(f"item {position + offset}: {exc.errors()[0]['msg']}") from exc
+            batch.ids = await insert_quests(db, quests, use_copy)
+            if not atomic:
+                await db.commit()  # Per-batch mode: make this batch durable on its own
+                batch.status = "committed"
+        except Exception as exc:  # Any failure rolls back the batch (or the whole request)
+            await db.rollback()
+            if atomic:
+                raise HTTPException(status_code=422, detail={
+                    "message": "Bulk insert rolled back, no quests were stored",
+                    "batch": batch.index,
+                    "error": str(exc),
+                })
+            batch.status, batch.ids, batch.error = "failed", [], str(exc)
+        batch.elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+        batches.append(batch)
+        position += len(items)
+
+    items = []
+    try:
+        async for item in iter_json_items(request):
+            items.append(item)
+            if len(items) >= batch_size:
+                await write_batch(items)
+                items = []
+    except HTTPException as exc:
+        if atomic or exc.status_code != 400:
+            await db.rollback()
+            raise
+        # Per-batch mode: an unreadable item ends the upload, the committed batches stay and are reported
+        # along with the items read since the last batch, which are not stored
+        batches.append(QuestBulkBatch(index=len(batches), size=len(items), status="failed", elapsed_ms=0,
+                                      error=f"item {position + len(items)}: {exc.detail}"))
+        items = []
+    if items:
+        await write_batch(items)
+
+    if atomic:
+        await db.commit()  # All-or-nothing mode: every batch becomes durable together
+        for batch in batches:
+            batch.status = "committed"
+
+    ids = [id for batch in batches for id in batch.ids]
+    return QuestBulkResult(atomic=atomic, method="copy" if use_copy else "insert", inserted=len(ids),
+                           ids=ids, batches=batches)
+
+# Media types of the export formats
+EXPORT_MEDIA_TYPES = {"ndjson": NDJSON_MEDIA_TYPE, "csv": "text/csv"}
+
+async def export_chunks(format: str, chunk_size: int, database, key: str):
+    # The session lives as long as the stream, so it is opened here rather than through get_read_db
+    async with await database.open_read_session(key) as db:
+        if format == "csv":
+            yield "id,title,description\r\n"
+        async for rows in stream_quests(db, chunk_size):
+            # Serialize each chunk on its own so only one chunk is ever held in memory
+            if format == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield b"".join(
+                    orjson.dumps({"id": id, "title": title, "description": description}) + b"\n"
+                    for id, title, description in rows
+                )
+
+# Endpoint to export the whole quest catalog as a stream
+@router.get("/quests/export")
+async def export_quests(request: Request, format: Literal["ndjson", "csv"] = "ndjson",
+                        chunk_size: int = Query(1000, ge=1, le=50000)):
+    """
+    Export every quest, streamed from the database as it is read.
+
+    - **format**: `ndjson` (one JSON object per line) or `csv`.
+    - **chunk_size**: Number of rows fetched from the server-side cursor and written at a time.
+
+    Returns a streaming response ordered by quest id.
+    """
+    return StreamingResponse(
+        export_chunks(format, chunk_size, request_database(request), client_key(request)),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="quests.{format}"'},
+    )
+
+# Endpoint to search quests by title and description
+@router.get("/quests/search", response_model=List[QuestSearchResult])
+async def search_quest_catalog(q: str = Query(..., min_length=1, max_length=200),
+                               db: AsyncSession = Depends(get_read_db),
+                               limit: int = Query(10, ge=1, le=100), cursor: Optional[str] = None):
+    """
+    Full-text search over quests, best matches first.
+
+    - **q**: Search text; every word must match a word (or word prefix) of the title or description.
+    - **db**: Read-only database session (replica when configured), automatically provided by FastAPI.
+    - **limit**: Maximum number of results to return.
+    - **cursor**: Opaque cursor from the `X-Next-Cursor` header of the previous page.
+
+    Returns the ranked matches, with the cursor of the next page in the `X-Next-Cursor` header.
+    """
+    after = decode_cursor(cursor, SEARCH_KEYS)[1] if cursor else None
+    rows = await search_quests(db, q, limit, after)
+
+    response = ORJSONResponse([
+        {"id": id, "title": title, "description": description, "rank": rank}
+        for id, title, description, rank in rows
+    ])
+    if rows and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor("search", [rows[-1].rank, rows[-1].id])
+    return response
+
 # Endpoint to retrieve a list of quests with optional pagination
 @router.get("/quests/", response_model=List[Quest])
-async def read_quests(db: AsyncSession = Depends(get_db), skip: int = 0, limit: int = 10):
+async def read_quests(request: Request, skip: int = 0, limit: int = 10,
+                      cursor: Optional[str] = None, sort: Literal["id", "title"] = "id",
+                      count: Literal["exact", "estimated", "none"] = "none",
+                      settings: Settings = Depends(request_settings),
+                      quest_catalog: catalog.QuestCatalog = Depends(catalog.request_quest_catalog)):
     """
-    Retrieve a list of quests from the database.
+    Retrieve a list of quests from the in-memory catalog snapshot or the database.
+
+    Responses carry an `ETag` and `Last-Modified` derived from the catalog version; a request whose
+    `If-None-Match` (or `If-Modified-Since`) still matches gets an empty `304 Not Modified`.
     
-    - **db**: Database session dependency, automatically provided by FastAPI.
-    - **skip**: Number of quests to skip (for pagination).
+    - **skip**: Number of quests to skip (for offset pagination).
     - **limit**: Maximum number of quests to return.
+    - **cursor**: Opaque cursor from the `X-Next-Cursor` header of the previous page (keyset pagination).
+    - **sort**: Sort key (`id` or `title`), taken from the cursor when one is given.
+    - **count**: Total number of quests to return in the `X-Total-Count` header: `exact` (a counter
+      maintained by triggers), `estimated` (the planner's estimate on Postgres) or `none`.
     
-    Returns a list of quests.
+    Returns a list of quests, with the cursor of the next page in the `X-Next-Cursor` header.
     """
-    return await get_quests(db, skip, limit)
- 
+    after = None
+    if cursor:
+        sort, after = decode_cursor(cursor)
+    cache_control = settings.catalog_cache_control
+
+    # Pages by id are served from this worker's snapshot when one is loaded (title order follows
+    # the database collation, so it always comes from the database)
+    snapshot = quest_catalog.snapshot if quest_catalog else None
+    if snapshot is not None and sort == "id":
+        headers = catalog_headers(request, snapshot.version, snapshot.updated_at, cache_control)
+        if is_not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
+        rows = snapshot.page(skip, limit, after[0] if after else None)
+        total = len(snapshot)  # The snapshot holds the whole catalog, so its size is exact and free
+    else:
+        # Read-only session (replica when configured)
+        async with await request_database(request).open_read_session(client_key(request)) as db:
+            # The version is read before the page, so a concurrent write can only make the ETag older, never newer
+            version, updated_at = await get_catalog_version(db)
+            headers = catalog_headers(request, version, updated_at, cache_control)
+            if is_not_modified(request, headers):
+                return Response(status_code=304, headers=headers)
+            rows = await get_quests(db, skip, limit, sort, after)
+            total = await count_quests(db, count) if count != "none" else None
+
+    # The rows already have the Quest shape, so serialize them directly instead of re-validating
+    response = ORJSONResponse([{"id": id, "title": title, "description": description} for id, title, description in rows],
+                              headers=headers)
+
+    if count != "none":
+        response.headers["X-Total-Count"] = str(total)
+
+    # A full page means there may be more quests after the last one
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(sort, [getattr(last, name) for name in SORT_KEYS[sort]])
+    return response
@@ -1,29 +1,45 @@
-# Standard Library Imports
-import hashlib  # For hashing functions
-import hmac  # For HMAC (hash-based message authentication code)
-import json  # For JSON parsing
-import urllib.parse  # For URL parsing and decoding
-
 # Third-Party Imports
-from fastapi import APIRouter, HTTPException, Depends  # FastAPI components for routing and error handling
-from pydantic import BaseModel  # Pydantic for data validation
+from fastapi import APIRouter, HTTPException, Depends, Query, Request  # FastAPI components for routing and error handling
+from pydantic import BaseModel, ValidationError  # Pydantic for data validation
 from sqlalchemy.ext.asyncio import AsyncSession  # SQLAlchemy for asynchronous database operations
 
 # Local Application Imports
-from app.schemas import UserCreate  # User data validation schema
-from app.crud import get_user_by_tID, create_user, delete_user_by_id  # CRUD operations
-from app.database import get_db  # Database session dependency
-
-from dotenv import load_dotenv  # For loading environment variables from .env file
-import os  # For accessing environment variables
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Access environment variables using os.getenv
-bot_token = os.getenv("BOT_TOKEN")  # Retrieve the bot token from environment variables
+from app.schemas import User, UserCreate, UserLookup, UserLookupResult, UserBulkDeleteResult  # User data validation schemas
+from app.crud import (  # CRUD operations
+    upsert_user, delete_user_by_id, delete_users_by_tIDs, get_user_by_tID, get_users_by_tIDs, invalidate_user,
+)
+from app.database import get_db  # Database sessions
+from app.config import Settings, request_settings  # Settings from environment variables and the .env file
+from app.utils.validate import InitDataVerifier  # Telegram initData verification
+from app.utils.responses import ORJSONResponse  # Fast JSON serialization
+from app.utils.batcher import BatcherFull, WriteBatcher  # Registration batcher and its queue-full error
+from app.utils.bulk import NDJSON_MEDIA_TYPE, iter_json_items, batched  # Streamed bulk request bodies
+from app.registration import request_registration_batcher  # Optional write-behind registration batcher
+from app.admission import AdmissionController, check_login_rate, request_admission_controller  # Per-user login rate limit
+
+# Function to create the initData verifier of an app (deriving the secret key is the costly part)
+def build_init_data_verifier(settings: Settings) -> InitDataVerifier:
+    return InitDataVerifier(
+        settings.bot_token,
+        previous_tokens=settings.previous_bot_tokens,
+        max_age=settings.init_data_max_age,
+        cache_size=settings.init_data_cache_size,
+    )
+
+def get_init_data_verifier(request: Request) -> InitDataVerifier:
+    """
+    Dependency returning the initData verifier of the app serving the request.
 
-from app.utils.validate import validate_init_data
+    The lifespan creates it at startup; otherwise it is created on first use and kept in app.state,
+    so the secret key is derived only once per app.
+    """
+    verifier = getattr(request.app.state, "init_data_verifier", None)
+    if verifier is None:
+        settings = request_settings(request)
+        if not settings.bot_token:
+            raise HTTPException(status_code=500, detail="BOT_TOKEN is not configured")
+        verifier = request.app.state.init_data_verifier = build_init_data_verifier(settings)
+    return verifier
 
 router = APIRouter()  # Create an APIRouter instance for handling routes
 
@@ -31,6 +47,121 @@ router = APIRouter()  # Create an APIRouter instance for handling routes
 class InitData(BaseModel):
     initDataRaw: str  # Raw data received from the client
 
+# Resolve many tIDs with a single query, keeping the requested order and reporting the unknown ones
+async def lookup_users(db: AsyncSession, tids: list, max_ids: int):
+    if len(tids) > max_ids:
+        raise HTTPException(status_code=422, detail=f"At most {max_ids} tids can be looked up at once")
+    tids = list(dict.fromkeys(tids))  # Drop duplicates, keep the order
+    found = await get_users_by_tIDs(db, tids)
+    return ORJSONResponse({
+        "users": [found[tID].model_dump() for tID in tids if found[tID] is not None],
+        "missing": [tID for tID in tids if found[tID] is None],
+    })
+
+# Endpoint to look up many users at once
+# (the primary serves cache misses, so invalidated users are never re-cached from a lagging replica)
+@router.get("/users", response_model=UserLookupResult)
+async def read_users(tids: str = Query(..., description="Comma-separated Telegram IDs"),
+                     db: AsyncSession = Depends(get_db), settings: Settings = Depends(request_settings)):
+    """
+    Look up users by Telegram ID.
+
+    - **tids**: Comma-separated Telegram IDs, e.g. `?tids=1,2,3`.
+    - **db**: Database session dependency, automatically provided by FastAPI.
+    - **settings**: Settings of the app, automatically provided by FastAPI.
+
+    Returns the users found in the requested order and the tIDs without a user.
+    """
+    try:
+        tid_list = [int(tID) for tID in tids.split(",") if tID.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="tids must be comma-separated integers")
+    return await lookup_users(db, tid_list, settings.user_lookup_max_ids)
+
+# Endpoint to look up many users at once, for lists too long for a query string
+@router.post("/users/lookup", response_model=UserLookupResult)
+async def lookup_users_by_body(lookup: UserLookup, db: AsyncSession = Depends(get_db),
+                               settings: Settings = Depends(request_settings)):
+    """
+    Look up users by Telegram ID, with the IDs in the request body.
+
+    - **lookup**: The Telegram IDs to resolve.
+    - **db**: Database session dependency, automatically provided by FastAPI.
+    - **settings**: Settings of the app, automatically provided by FastAPI.
+
+    Returns the users found in the requested order and the tIDs without a user.
+    """
+    return await lookup_users(db, lookup.tids, settings.user_lookup_max_ids)
+
+# Endpoint to delete many users, e.g. for purge jobs
+@router.post(
+    "/users/bulk-delete",
+    response_model=UserBulkDeleteResult,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": {"type": "integer"}}},
+        NDJSON_MEDIA_TYPE: {"schema": {"type": "integer"}},
+    }}},
+)
+async def delete_users_bulk(request: Request, db: AsyncSession = Depends(get_db),
+                            chunk_size: int = Query(1000, ge=1, le=10000),
+                            commit_every: int = Query(1, ge=0)):
+    """
+    Delete the users with the Telegram IDs of a JSON array or a streamed NDJSON body (one tID per line).
+
+    - **chunk_size**: Number of tIDs deleted per statement.
+    - **commit_every**: Number of chunks per transaction; 1 commits after every chunk so large purges
+      never hold one long transaction, 0 deletes everything in a single transaction.
+
+    Returns the deleted tIDs, the tIDs without a user and how many statements and commits were used.
+    """
+    deleted, not_found, uncommitted = [], [], []
+    chunks = commits = 0
+
+    async def commit():
+        nonlocal commits, uncommitted
+        await db.commit()
+        commits += 1
+        for tID in uncommitted:
+            await invalidate_user(db, tID)
+        uncommitted = []
+
+    async for tIDs in batched(iter_json_items(request), chunk_size):
+        if not all(isinstance(tID, int) and not isinstance(tID, bool) for tID in tIDs):
+            await db.rollback()
+            raise HTTPException(status_code=422, detail={
+                "message": "Every item must be an integer tID, the uncommitted chunks were rolled back",
+                "chunk": chunks,
+                "committed": commits,
+            })
+        tIDs = list(dict.fromkeys(tIDs))
+        found = set(await delete_users_by_tIDs(db, tIDs))
+        deleted += [tID for tID in tIDs if tID in found]
+        not_found += [tID for tID in tIDs if tID not in found]
+        uncommitted += found
+        chunks += 1
+        if commit_every and chunks % commit_every == 0:
+            await commit()
+
+    if uncommitted:
+        await commit()
+    return ORJSONResponse({"deleted": deleted, "not_found": not_found, "chunks": chunks, "commits": commits})
+
+# Endpoint to read a user by ID (served from the user cache when it is enabled)
+@router.get("/users/{user_id}", response_model=User)
+async def read_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Read a user by their ID.
+
+    - **user_id**: The Telegram ID of the user to read.
+    - **db**: Database session dependency, automatically provided by FastAPI.
+
+    Returns the user, or raises a 404 error if not found.
+    """
+    user = await get_user_by_tID(db, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return ORJSONResponse(user.model_dump())
+
 # Endpoint to delete a user by ID
 @router.delete("/users/{user_id}")
 async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
@@ -50,34 +181,47 @@ async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
 
 # Endpoint to verify initial data and handle user authentication
 @router.post("/users")
-async def verify_init_data(init_data: InitData, db: AsyncSession = Depends(get_db)):
+async def verify_init_data(init_data: InitData, db: AsyncSession = Depends(get_db),
+                           verifier: InitDataVerifier = Depends(get_init_data_verifier),
+                           batcher: WriteBatcher = Depends(request_registration_batcher),
+                           admission: AdmissionController = Depends(request_admission_controller)):
     """
     Verify the initial data received from the client.
 
     - **init_data**: The raw data to verify.
     - **db**: Database session dependency, automatically provided by FastAPI.
+    - **verifier**: The app's initData verifier, automatically provided by FastAPI.
+    - **batcher**: The app's registration batcher (None when batching is off), automatically provided by FastAPI.
+    - **admission**: The app's admission controller (None when it is off), automatically provided by FastAPI.
 
-    Returns a redirect URL based on whether the user exists or is newly created.
+    Returns the stored user and a redirect URL based on whether the user exists or is newly created.
     """
   
-    # Validate the initial data (separate logic)
-    params = validate_init_data(init_data.initDataRaw, bot_token)
-
-    # Extract user data after validation
-    user_data_str = params.get('user', '')
-    user_data = json.loads(user_data_str) if user_data_str else {}
-
-
-    # Check if the user exists in the database
-    existing_user = await get_user_by_tID(db, user_data.get('id'))
-
-    if existing_user:
-        # If user exists, return redirect to the profile page
-        return {"user": existing_user, "redirect": "/profile", "message": "User already exists, user data from db"}
+    # Validate the initial data (separate logic), the user payload comes back already parsed
+    user_data = verifier.verify(init_data.initDataRaw).user
+    try:
+        user_data = UserCreate.model_validate(user_data)  # Create a UserCreate schema instance
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors(include_url=False, include_context=False))
+    check_login_rate(admission, user_data.id)  # Before any query
+
+    # Register the user or refresh the existing profile in a single statement
+    if batcher is not None:
+        # Written together with the other registrations of this burst, returns once the batch is committed
+        # (the batcher writes with its own connection, so this one goes back to the pool while waiting)
+        await db.close()
+        try:
+            user, created = await batcher.submit(user_data)
+        except BatcherFull:
+            raise HTTPException(status_code=503, detail="Too many registrations in progress, retry shortly",
+                                headers={"Retry-After": "1"})
     else:
-        # If user does not exist, create the user and return redirect to choose role page
-        user_data = UserCreate(**user_data)  # Create a UserCreate schema instance
-        await create_user(db, user_data)  # Create the user in the database
-        return {"user": user_data, "redirect": "/choose-role", "message": "A new user with the following data has just been created."}
-
+        user, created = await upsert_user(db, user_data)
 
+    if created:
+        # If user did not exist, return redirect to choose role page
+        # "id" is the key new users were reported under before the stored row was returned, kept for existing clients
+        return ORJSONResponse({"user": {**user.model_dump(), "id": user.tID}, "redirect": "/choose-role", "message": "A new user with the following data has just been created."})
+    else:
+        # If user exists, return redirect to the profile page
+        return ORJSONResponse({"user": user.model_dump(), "redirect": "/profile", "message": "User already exists, user data from db"})
@@ -0,0 +1,339 @@
+from collections import OrderedDict
+import asyncio
+import logging
+import time
+
+from fastapi import Request
+import orjson
+
+from app.config import get_settings
+from app.schemas import User as UserSchema
+
+logger = logging.getLogger(__name__)
+
+# Returned by cache backends when a key is absent (None is a valid cached value: "no such user")
+MISSING = object()
+
+# Compare-and-set run in the shared server: store KEYS[1] only if the generation KEYS[2] still is ARGV[3]
+SET_IF_GENERATION = """
+if (redis.call('get', KEYS[2]) or '0') == ARGV[3] then
+    return redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+end
+return false
+"""
+
+
+class LocalCache:
+    """
+    In-process LRU cache with a per-entry time to live.
+
+    - **maxsize**: Maximum number of entries, the least recently used one is evicted beyond it.
+    - **ttl**: Default seconds an entry stays valid.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[object, tuple]" = OrderedDict()  # key -> (value, expires_at)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        value, expires_at = entry
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    async def generations(self, keys) -> list:
+        return [0] * len(keys)  # One process: UserCache's own counter covers its invalidations
+
+    async def bump(self, key):
+        pass
+
+    async def set(self, key, value, ttl: float = None, generation: int = None):
+        self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key):
+        self._entries.pop(key, None)
+
+
+class SharedCache:
+    """
+    Cache stored in a shared key-value server (e.g. a `redis.asyncio.Redis` client), seen by every worker.
+
+    - **client**: Object with async `get(key)`, `mget(keys)`, `set(key, value, ex=seconds)`, `delete(key)`,
+      `incr(key)` and `eval(script, numkeys, *keys_and_args)`.
+    - **model**: Pydantic model of the cached values, serialized as JSON (None is stored as `null`).
+    - **prefix**: Prepended to every key.
+    - **ttl**: Default seconds an entry stays valid.
+    - **generation_prefix**: Prefix of the per-key generation counters bumped by every invalidation (defaults
+      to `<prefix>gen:`). Caches sharing it, e.g. users and unknown users, are invalidated together.
+
+    A value set with the generation read before loading it is only stored if no worker invalidated the key
+    in between, so a slow load in one worker cannot overwrite a newer write committed by another.
+    """
+
+    evictions = 0  # Evictions happen in the server and are reported there
+
+    def __init__(self, client, model, prefix: str = "cache:", ttl: float = 300.0, generation_prefix: str = None):
+        self.client = client
+        self.model = model
+        self.prefix = prefix
+        self.ttl = ttl
+        self.generation_prefix = generation_prefix or f"{prefix}gen:"
+
+    def __len__(self):
+        return 0  # Unknown without a round trip
+
+    async def get(self, key):
+        data = await self.client.get(f"{self.prefix}{key}")
+        if data is None:
+            return MISSING
+        return None if data == b"null" else self.model.model_validate_json(data)
+
+    async def generations(self, keys) -> list:
+        values = await self.client.mget([f"{self.generation_prefix}{key}" for key in keys])
+        return [int(value or 0) for value in values]
+
+    async def bump(self, key):
+        await self.client.incr(f"{self.generation_prefix}{key}")
+
+    async def set(self, key, value, ttl: float = None, generation: int = None):
+        seconds = max(1, int(self.ttl if ttl is None else ttl))
+        data = b"null" if value is None else orjson.dumps(value.model_dump())
+        if generation is None:
+            await self.client.set(f"{self.prefix}{key}", data, ex=seconds)
+        else:
+            await self.client.eval(SET_IF_GENERATION, 2, f"{self.prefix}{key}", f"{self.generation_prefix}{key}",
+                                   data, seconds, generation)
+
+    async def delete(self, key):
+        await self.client.delete(f"{self.prefix}{key}")
+
+
+class MemoryStore:
+    """
+    Local fake of a shared key-value server (the subset of the Redis API used by SharedCache).
+
+    Several SharedCache instances over one MemoryStore behave like workers sharing a server.
+    """
+
+    def __init__(self):
+        self.data = {}  # key -> (bytes, expires_at)
+
+    async def get(self, key):
+        entry = self.data.get(key)
+        if entry is None or time.monotonic() > entry[1]:
+            self.data.pop(key, None)
+            return None
+        return entry[0]
+
+    async def mget(self, keys) -> list:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key, value, ex: int = None):
+        self.data[key] = (value, time.monotonic() + ex if ex else float("inf"))
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def incr(self, key) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self.data[key] = (str(value).encode(), self.data.get(key, (None, float("inf")))[1])
+        return value
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        # Only the scripts SharedCache sends are understood
+        if script != SET_IF_GENERATION:
+            raise NotImplementedError("MemoryStore only runs SET_IF_GENERATION")
+        key, generation_key, value, ex, expected = keys_and_args
+        if int(await self.get(generation_key) or 0) != int(expected):
+            return None
+        await self.set(key, value, ex=int(ex))
+        return True
+
+
+class UserCache:
+    """
+    Read-through cache of users by tID with negative caching and request coalescing.
+
+    - **backend**: Cache holding the users found (LocalCache or SharedCache).
+    - **negative_maxsize**: Size of the separate local LRU remembering unknown tIDs, so a flood of
+      unknown tIDs only evicts other unknown tIDs, never cached users.
+    - **negative_ttl**: Seconds an unknown tID is remembered.
+    - **negative**: Cache remembering unknown tIDs instead of that local LRU, e.g. a SharedCache under
+      its own prefix, so registrations in one worker are not hidden by another worker's entries.
+
+    Concurrent lookups of a key that is not cached share a single load, run in its own task so that
+    cancelling one caller does not cancel the others. Writers call `invalidate` after committing; loads
+    that started before an invalidation, in this worker or (with a shared backend) in any other, are
+    not stored.
+    """
+
+    def __init__(self, backend, negative_maxsize: int = 1000, negative_ttl: float = 30.0, negative=None):
+        self.backend = backend
+        self.negative = negative if negative is not None else LocalCache(negative_maxsize, negative_ttl)
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self._inflight = {}  # key -> Task of the load in progress
+        self._generation = 0  # Bumped by every invalidation
+
+    async def get_or_load(self, key, loader):
+        """
+        Return the cached value for `key`, or await `loader()` once for all concurrent callers and cache it.
+        """
+        value = await self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        if await self.negative.get(key) is not MISSING:
+            self.negative_hits += 1
+            return None
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._load(key, loader))
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())  # Retrieved even if nobody waits
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        task = asyncio.current_task()
+        generation = self._generation
+        try:
+            [shared_generation] = await self.backend.generations([key])
+            value = await loader()
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+        # A write committed while loading may have made the value stale: return it, do not keep it
+        if generation == self._generation:
+            await self._store(key, value, shared_generation)
+        return value
+
+    async def _store(self, key, value, shared_generation):
+        if value is None:
+            await self.negative.set(key, None, generation=shared_generation)
+        else:
+            await self.backend.set(key, value, generation=shared_generation)
+
+    async def get_many_or_load(self, keys, loader) -> dict:
+        """
+        Return {key: value} for `keys` (None when unknown), loading every uncached key with one `loader(missing)` call.
+
+        `loader` takes the list of missing keys and returns a dict of the values it found.
+        """
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            value = await self.backend.get(key)
+            if value is not MISSING:
+                self.hits += 1
+                found[key] = value
+            elif await self.negative.get(key) is not MISSING:
+                self.negative_hits += 1
+                found[key] = None
+            else:
+                missing.append(key)
+
+        if missing:
+            self.misses += len(missing)
+            generation = self._generation
+            shared_generations = await self.backend.generations(missing)
+            loaded = await loader(missing)
+            for key, shared_generation in zip(missing, shared_generations):
+                value = found[key] = loaded.get(key)
+                if generation == self._generation:
+                    await self._store(key, value, shared_generation)
+        return found
+
+    async def invalidate(self, key):
+        """
+        Forget `key`; lookups from now on load it again.
+        """
+        self.invalidations += 1
+        self._generation += 1
+        self._inflight.pop(key, None)  # Later callers must not join a load that may predate the write
+        await self.backend.bump(key)  # Loads started before now, in any worker, will not be stored
+        await self.backend.delete(key)
+        await self.negative.delete(key)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "evictions": self.backend.evictions + self.negative.evictions,
+            "size": len(self.backend),
+            "negative_size": len(self.negative),
+        }
+
+
+def build_user_cache(settings=None, client=None):
+    """
+    Create the user cache configured by the settings, or None when it is disabled.
+
+    - **client**: Shared key-value client to use instead of connecting to USER_CACHE_URL (e.g. a MemoryStore).
+
+    A local cache is only built for a single worker: with several, a write in one worker could not
+    invalidate the copies held by the others.
+    """
+    settings = settings or get_settings()
+    if not settings.user_cache_enabled:
+        return None
+    backend = settings.user_cache_backend
+    if backend == "auto":
+        backend = "shared" if settings.web_workers > 1 else "local"
+    if backend == "local":
+        if settings.web_workers > 1:
+            raise ValueError("USER_CACHE_BACKEND=local cannot be invalidated across WEB_WORKERS > 1, "
+                             "use the shared backend")
+        return UserCache(LocalCache(settings.user_cache_size, settings.user_cache_ttl),
+                         settings.user_cache_negative_size, settings.user_cache_negative_ttl)
+
+    if client is None:
+        if not settings.user_cache_url:
+            raise ValueError("The shared user cache needs USER_CACHE_URL")
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError("The shared user cache needs the redis package (pip install redis)")
+        client = redis.from_url(settings.user_cache_url)
+
+    logger.info("User cache shared through %s", settings.user_cache_url or type(client).__name__)
+    return UserCache(
+        SharedCache(client, UserSchema, prefix="user:", ttl=settings.user_cache_ttl, generation_prefix="user-gen:"),
+        negative=SharedCache(client, UserSchema, prefix="user-unknown:", ttl=settings.user_cache_negative_ttl,
+                             generation_prefix="user-gen:"),
+    )
+
+
+# Process-wide user cache, used outside an application (scripts, benchmarks) and by apps whose lifespan
+# has not run; an app's own cache is built by its lifespan into app.state.user_cache
+user_cache: UserCache = None
+
+# Dependency to get the user cache of the app serving the request
+def request_user_cache(request: Request) -> UserCache:
+    return getattr(request.app.state, "user_cache", user_cache)
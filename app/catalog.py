@@ -0,0 +1,300 @@
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from contextlib import suppress
+import asyncio
+import contextvars
+import logging
+import sys
+import time
+
+from fastapi import Request
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+from app.models import Quest as QuestModel, CatalogVersion
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel notified (by a trigger on catalog_versions) whenever the quest catalog version changes
+CATALOG_CHANNEL = "catalog_quests"
+
+# Row shape served from the snapshot, the same fields (and attribute access) as a quest result row
+QuestRow = namedtuple("QuestRow", ("id", "title", "description"))
+
+
+class CatalogSnapshot:
+    """
+    Immutable copy of the quest catalog, sorted by id.
+
+    Ids live in a compact `array('q')` searched with bisect; titles and descriptions are tuples
+    aligned with it, so a page is a slice of three sequences.
+    """
+
+    __slots__ = ("version", "updated_at", "loaded_at", "ids", "titles", "descriptions", "nbytes")
+
+    def __init__(self, version: int, updated_at, rows):
+        self.version = version
+        self.updated_at = updated_at
+        self.loaded_at = time.monotonic()
+        self.ids = array("q", (row[0] for row in rows))
+        self.titles = tuple(row[1] for row in rows)
+        self.descriptions = tuple(row[2] for row in rows)
+        self.nbytes = (
+            sys.getsizeof(self.ids) + sys.getsizeof(self.titles) + sys.getsizeof(self.descriptions)
+            + sum(map(sys.getsizeof, self.titles)) + sum(map(sys.getsizeof, self.descriptions))
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def page(self, skip: int = 0, limit: int = 10, after_id: int = None) -> list:
+        """
+        Return quests ordered by id, the same page get_quests(sort="id") would return.
+        """
+        start = bisect_right(self.ids, after_id) if after_id is not None else max(skip, 0)
+        stop = min(start + limit, len(self.ids))
+        return [QuestRow(self.ids[i], self.titles[i], self.descriptions[i]) for i in range(start, stop)]
+
+
+class MemoryBroker:
+    """
+    In-process stand-in for Postgres LISTEN/NOTIFY: every subscriber sees every published version.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.subscribers = []
+
+    async def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    async def unsubscribe(self, callback):
+        with suppress(ValueError):
+            self.subscribers.remove(callback)
+
+    def publish(self, version: int):
+        for callback in list(self.subscribers):
+            callback(version)
+
+
+class PostgresBroker:
+    """
+    LISTEN on the catalog channel over a dedicated connection of the engine.
+
+    Publishing is done by the database: the trigger on catalog_versions NOTIFYs when the bumping
+    transaction commits, whichever worker (or script) wrote.
+    """
+
+    name = "postgres"
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.connection = None
+        self.listeners = {}
+
+    async def subscribe(self, callback):
+        if self.connection is None:
+            self.connection = await self.engine.connect()
+        raw_connection = await self.connection.get_raw_connection()
+
+        def listener(connection, pid, channel, payload):
+            callback(int(payload))
+
+        self.listeners[callback] = listener
+        await raw_connection.driver_connection.add_listener(CATALOG_CHANNEL, listener)
+
+    async def unsubscribe(self, callback):
+        listener = self.listeners.pop(callback, None)
+        if self.connection is not None and listener is not None:
+            raw_connection = await self.connection.get_raw_connection()
+            await raw_connection.driver_connection.remove_listener(CATALOG_CHANNEL, listener)
+        if self.connection is not None and not self.listeners:
+            await self.connection.close()
+            self.connection = None
+
+    def publish(self, version: int):
+        pass  # The catalog_versions trigger notifies on commit
+
+
+class QuestCatalog:
+    """
+    Serve quest pages from an in-memory snapshot, reloaded when the catalog version changes.
+
+    - **session_factory**: Session factory the snapshot is loaded with (the primary, so it is never behind).
+    - **check_interval**: Seconds between fallback version checks, the staleness bound if notifications are lost.
+    - **max_rows**: Catalogs larger than this are not snapshotted and are served from the database.
+
+    A notification or a failed version check drops the snapshot at once (requests go to the database)
+    and reloads it in the background, so the snapshot is never served once it is known to be stale.
+    """
+
+    def __init__(self, session_factory, check_interval: float = 5.0, max_rows: int = 100_000):
+        self.session_factory = session_factory
+        self.check_interval = check_interval
+        self.max_rows = max_rows
+        self.snapshot = None
+        self.broker = None
+        self.loaded_version = None  # Version of the last load (also when the catalog was too large to keep)
+        self.latest_version = None  # Highest version announced so far
+        self._generation = 0  # Bumped by every invalidation, a load that saw it change starts over
+        self.notifications = 0
+        self.reloads = 0
+        self.version_checks = 0
+        self.last_check_at = None
+        self.last_reload_ms = None
+        self._reload_task = None
+        self._check_task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    async def start(self, broker=None):
+        # Load the first snapshot, then follow notifications and check the version periodically
+        self.broker = broker
+        if broker is not None:
+            await broker.subscribe(self.invalidate)
+        await self.reload()
+        self._check_task = asyncio.create_task(self._check_periodically())
+
+    async def stop(self):
+        for task in (self._check_task, self._reload_task):
+            if task:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        if self.broker is not None:
+            await self.broker.unsubscribe(self.invalidate)
+        self.snapshot = self.loaded_version = None
+
+    async def reload(self):
+        """
+        Load a new snapshot from the database, again if the catalog changed while loading.
+        """
+        start = time.perf_counter()
+        while True:
+            generation = self._generation
+            async with self.session_factory() as db:
+                # Read the version first: a write in between can only make the snapshot look older than it is
+                row = (await db.execute(
+                    select(CatalogVersion.version, CatalogVersion.updated_at).where(CatalogVersion.name == "quests")
+                )).first()
+                version, updated_at = (row.version, row.updated_at) if row else (0, None)
+                query = select(QuestModel.id, QuestModel.title, QuestModel.description).order_by(QuestModel.id)
+                rows = (await db.execute(query.limit(self.max_rows + 1))).all()
+            self.reloads += 1
+            if generation == self._generation:
+                break
+
+        self.loaded_version = version
+        if len(rows) > self.max_rows:
+            logger.warning("Quest catalog exceeds %s rows, serving it from the database", self.max_rows)
+            self.snapshot = None
+        else:
+            self.snapshot = CatalogSnapshot(version, updated_at, rows)
+        self.last_reload_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    def invalidate(self, version: int = None, local: bool = False):
+        """
+        Drop the snapshot if `version` (None = unknown) is newer than it, and reload in the background.
+
+        - **local**: The write was committed by this worker (not counted as a notification).
+        """
+        if not local:
+            self.notifications += 1
+        if version is not None:
+            self.latest_version = max(version, self.latest_version or 0)
+            if self.loaded_version is not None and version <= self.loaded_version:
+                return  # Already loaded (e.g. our own write, seen again through the broker)
+        self._generation += 1
+        self.snapshot = None
+        self._schedule_reload()
+
+    def _schedule_reload(self):
+        if self._reload_task is None or self._reload_task.done():
+            # Fresh context: the reload's queries must not be attributed to the request that triggered it
+            self._reload_task = asyncio.get_running_loop().create_task(
+                self._reload_quietly(), context=contextvars.Context()
+            )
+
+    async def _reload_quietly(self):
+        try:
+            await self.reload()
+        except Exception:
+            self.loaded_version = None  # Retried by the next version check
+            logger.exception("Reloading the quest catalog snapshot failed")
+
+    async def check_version(self):
+        """
+        Compare the loaded version with the database, the fallback for lost notifications.
+        """
+        async with self.session_factory() as db:
+            version = (await db.execute(
+                select(CatalogVersion.version).where(CatalogVersion.name == "quests")
+            )).scalar() or 0
+        self.version_checks += 1
+        self.last_check_at = time.monotonic()
+        if version != self.loaded_version:
+            self.latest_version = max(version, self.latest_version or 0)
+            self._generation += 1
+            self.snapshot = None
+            self._schedule_reload()
+
+    async def _check_periodically(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check_version()
+            except Exception:
+                logger.exception("Checking the quest catalog version failed")
+
+    def report(self) -> dict:
+        """
+        Return the snapshot state, its memory footprint and staleness bounds.
+        """
+        now = time.monotonic()
+        snapshot = self.snapshot
+        return {
+            "ready": snapshot is not None,
+            "version": snapshot.version if snapshot else None,
+            "latest_version": self.latest_version,
+            "rows": len(snapshot) if snapshot else 0,
+            "bytes": snapshot.nbytes if snapshot else 0,
+            "age_seconds": round(now - snapshot.loaded_at, 3) if snapshot else None,
+            "broker": self.broker.name if self.broker else None,
+            # Notifications make changes visible as soon as they are delivered; without them the
+            # periodic check bounds how long a snapshot can be served after the catalog changed
+            "max_staleness_seconds": self.check_interval,
+            "last_check_age_seconds": round(now - self.last_check_at, 3) if self.last_check_at else None,
+            "notifications": self.notifications,
+            "reloads": self.reloads,
+            "version_checks": self.version_checks,
+            "last_reload_ms": self.last_reload_ms,
+        }
+
+
+# Process-wide catalog, used by apps whose lifespan has not run; an app's own catalog is started by its
+# lifespan into app.state.quest_catalog when CATALOG_SNAPSHOT_ENABLED is set
+quest_catalog: QuestCatalog = None
+
+# Dependency to get the quest catalog of the app serving the request
+def request_quest_catalog(request: Request) -> QuestCatalog:
+    return getattr(request.app.state, "quest_catalog", quest_catalog)
+
+# Writes made by this worker invalidate its own snapshot on commit and are announced to the broker
+@event.listens_for(Session, "after_commit")
+def _announce_catalog_write(session):
+    version = session.info.pop("quest_catalog_version", None)
+    catalog = getattr(session.info.get("app_state"), "quest_catalog", quest_catalog)
+    if version is not None and catalog is not None:
+        catalog.invalidate(version, local=True)
+        if catalog.broker is not None:
+            catalog.broker.publish(version)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_catalog_write(session):
+    session.info.pop("quest_catalog_version", None)
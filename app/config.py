@@ -0,0 +1,179 @@
+from functools import lru_cache
+from typing import Dict, Literal, Optional
+
+from fastapi import Request
+from pydantic import model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+# Engine and pool defaults for each deployment profile; explicit settings always win
+PROFILE_DEFAULTS = {
+    "dev": {
+        "db_echo": True,  # Log every SQL statement while developing
+        "db_pool_size": 5,
+        "db_max_overflow": 10,
+        "db_pool_timeout": 30.0,
+        "db_pool_recycle": -1,
+        "db_pool_pre_ping": True,
+        "db_statement_cache_size": 100,
+        "db_warmup_connections": 1,
+    },
+    "prod": {
+        "db_echo": False,
+        "db_pool_size": 10,
+        "db_max_overflow": 5,
+        "db_pool_timeout": 5.0,  # Fail fast instead of queueing requests for long
+        "db_pool_recycle": 1800,  # Stay below server/proxy idle timeouts
+        "db_pool_pre_ping": True,
+        "db_statement_cache_size": 500,
+        "db_warmup_connections": 10,  # The whole pool is connected and primed before serving
+    },
+    "test": {
+        "db_echo": False,
+        "db_pool_size": 5,
+        "db_max_overflow": 10,
+        "db_pool_timeout": 30.0,
+        "db_pool_recycle": -1,
+        "db_pool_pre_ping": False,
+        "db_statement_cache_size": 100,
+        "db_warmup_connections": 0,
+    },
+}
+
+# Database used by the test profile when DATABASE_URL is not set (SQLite stand-in)
+TEST_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
+
+
+class Settings(BaseSettings):
+    """
+    Application settings read from environment variables and the .env file.
+
+    Engine options left unset are filled in from the selected `db_profile`.
+    """
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    # Database connection
+    database_url: Optional[str] = None
+    db_profile: Literal["dev", "prod", "test"] = "dev"
+
+    # Read replicas (comma-separated URLs); read-only endpoints are routed to them
+    database_replica_urls: str = ""
+    db_replica_strategy: Literal["round_robin", "least_busy"] = "round_robin"
+    db_read_your_writes_seconds: float = 5.0  # Reads from a client go to the primary this long after its write
+    db_replica_retry_seconds: float = 30.0  # How long a failing replica is skipped before it is tried again
+    db_replica_health_interval: float = 10.0  # Seconds between background replica health checks
+
+    # Engine and pool knobs (None means "use the profile default")
+    db_echo: Optional[bool] = None  # Log every SQL statement
+    db_pool_size: Optional[int] = None  # Connections kept open in the pool
+    db_max_overflow: Optional[int] = None  # Extra connections allowed above pool_size
+    db_pool_timeout: Optional[float] = None  # Seconds to wait for a connection before failing
+    db_pool_recycle: Optional[int] = None  # Seconds after which connections are replaced (-1 disables)
+    db_pool_pre_ping: Optional[bool] = None  # Test connections for liveness on checkout
+    db_statement_cache_size: Optional[int] = None  # asyncpg prepared statement cache size (0 disables)
+    db_command_timeout: Optional[float] = None  # asyncpg per-statement timeout in seconds
+    db_warmup_connections: Optional[int] = None  # Pool connections opened and primed at startup (0 disables)
+
+    # Query profiler: per-statement stats, sampled EXPLAIN of slow statements, N+1 detection (/internal/queries)
+    query_profiler_enabled: bool = False
+    query_slow_ms: float = 100.0  # Executions slower than this are always recorded and may be explained
+    query_sample_rate: float = 1.0  # Fraction of the other executions recorded
+    query_explain_sample_rate: float = 0.1  # Fraction of slow executions whose plan is captured
+    query_explain_interval: float = 60.0  # Seconds between two plans of the same statement shape
+    query_explain_analyze: bool = False  # Postgres: EXPLAIN ANALYZE side-effect-free reads (runs them again)
+    query_n_plus_one_threshold: int = 10  # Same read shape this many times in one request is flagged
+    query_max_fingerprints: int = 1000  # Statement shapes tracked
+    query_log_enabled: bool = False  # Log slow statements and N+1 requests as JSON to the app.queries logger
+
+    # Multi-worker runner (python -m app.serve)
+    web_host: str = "0.0.0.0"
+    web_port: int = 8000
+    web_workers: int = 1
+    db_connection_budget: int = 0  # Connections to each database shared by all workers (0 = profile pool each)
+    web_backlog: int = 2048  # Pending connections queued by the kernel
+    web_keep_alive: int = 5  # Seconds an idle keep-alive connection stays open
+    web_graceful_timeout: int = 30  # Seconds workers get to finish their requests on shutdown
+    web_max_requests: int = 0  # Restart a worker after this many requests, bounding memory growth (0 = never)
+    web_max_requests_jitter: int = 0  # Random extra requests per worker, so workers do not restart together
+
+    # Request instrumentation
+    metrics_enabled: bool = True  # Record per-route metrics and serve them at /metrics
+    server_timing_enabled: bool = True  # Add a Server-Timing header with DB and app time
+
+    # HTTP caching of the quest catalog (ETag / Last-Modified are always sent)
+    catalog_cache_control: str = "no-cache"  # Cache-Control of catalog responses; no-cache = always revalidate
+
+    # In-memory quest catalog snapshot per worker (invalidated by LISTEN/NOTIFY on Postgres)
+    catalog_snapshot_enabled: bool = False
+    catalog_check_interval: float = 5.0  # Seconds between fallback version checks (staleness bound)
+    catalog_max_rows: int = 100_000  # Larger catalogs are served from the database
+
+    # Read-through cache of users by tID
+    user_cache_enabled: bool = False
+    # local: per-process LRU (single worker only, other workers would never see invalidations);
+    # shared: a Redis server at USER_CACHE_URL seen by every worker; auto: shared when WEB_WORKERS > 1
+    user_cache_backend: Literal["auto", "local", "shared"] = "auto"
+    user_cache_url: Optional[str] = None  # e.g. redis://localhost:6379/0
+    user_cache_size: int = 10_000  # Users kept per worker (LRU, local backend)
+    user_cache_ttl: float = 300.0  # Seconds a cached user stays valid
+    user_cache_negative_size: int = 1000  # Unknown tIDs remembered, in their own LRU (local backend)
+    user_cache_negative_ttl: float = 30.0  # Seconds an unknown tID is remembered
+
+    # Batched user lookups
+    user_lookup_max_ids: int = 1000  # Most tIDs accepted by GET /api/users and POST /api/users/lookup
+    user_loader_enabled: bool = True  # Coalesce concurrent get_user_by_tID misses of a session into one query
+    user_loader_max_batch: int = 500  # Most tIDs per coalesced query
+
+    # Write-behind batching of POST /api/users (each request still returns after its batch commits)
+    registration_batching_enabled: bool = False
+    registration_batch_size: int = 200  # Users written per statement and commit
+    registration_batch_delay: float = 0.01  # Seconds the first queued user waits for the batch to fill
+    registration_queue_max: int = 10_000  # Registrations queued beyond this get 503 + Retry-After
+
+    # Admission control of /api requests: shed load with 503 + Retry-After while the primary's pool is saturated
+    admission_enabled: bool = False
+    admission_target_wait: float = 0.05  # Seconds of pool wait above which the concurrency limit shrinks
+    admission_initial_limit: int = 50  # Concurrent /api requests admitted before any wait is observed
+    admission_min_limit: int = 5
+    admission_max_limit: int = 500
+    admission_route_limits: Dict[str, int] = {"POST /api/quests/": 20, "POST /api/users": 100}  # Fixed caps per route
+    admission_retry_after: int = 1  # Seconds in the Retry-After header of shed requests
+    login_rate_per_second: float = 1.0  # Logins per Telegram ID refilled per second (0 = unlimited)
+    login_burst: int = 5  # Logins per Telegram ID allowed back to back
+
+    # Telegram initData verification
+    bot_token: Optional[str] = None
+    bot_token_previous: str = ""  # Comma-separated tokens still accepted during rotation
+    init_data_max_age: int = 86400
+    init_data_cache_size: int = 4096
+
+    @model_validator(mode="after")
+    def apply_profile_defaults(self):
+        for name, value in PROFILE_DEFAULTS[self.db_profile].items():
+            if getattr(self, name) is None:
+                setattr(self, name, value)
+        if self.database_url is None and self.db_profile == "test":
+            self.database_url = TEST_DATABASE_URL
+        if self.database_url is None:
+            raise ValueError("DATABASE_URL is not set in the environment or the .env file")
+        return self
+
+    @property
+    def replica_urls(self) -> list:
+        return [url.strip() for url in self.database_replica_urls.split(",") if url.strip()]
+
+    @property
+    def previous_bot_tokens(self) -> list:
+        return [token for token in self.bot_token_previous.split(",") if token]
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """
+    Return the process-wide settings, loaded once.
+    """
+    return Settings()
+
+# Dependency to get the settings of the app serving the request (the process settings by default)
+def request_settings(request: Request) -> Settings:
+    return getattr(request.app.state, "settings", None) or get_settings()
@@ -1,8 +1,18 @@
-from sqlalchemy import select, insert
+from datetime import datetime, timezone
+import asyncio
+
+from sqlalchemy import select, insert, update, delete, literal_column, tuple_, text, any_, bindparam, BigInteger, event
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
-from app.models import User as UserModel, Quest as QuestModel
+from app import cache
+from app.config import get_settings
+from app.models import User as UserModel, Quest as QuestModel, CatalogVersion, RowCount
 from app.schemas import UserCreate, User as UserSchema, QuestCreate
+from app.utils.pagination import SORT_KEYS
+from app.utils.loader import BatchLoader
 
 # Function to create a new user in the database
 async def create_user(db: AsyncSession, user: UserCreate):
@@ -18,8 +28,145 @@ async def create_user(db: AsyncSession, user: UserCreate):
     )
     result = await db.execute(query)  # Execute the query asynchronously
     await db.commit()  # Commit the transaction
+    await invalidate_user(db, user.id)  # Drop a cached "unknown tID" entry
     # Return the user data with the newly inserted ID
-    return {**user.dict(), "id": result.inserted_primary_key[0]}
+    return {**user.model_dump(), "id": result.inserted_primary_key[0]}
+
+# Function to get the user cache of the app a session was opened for (the process cache outside an app)
+def session_user_cache(db: AsyncSession):
+    return getattr(db.info.get("app_state"), "user_cache", cache.user_cache)
+
+# Function to get the settings of the app a session was opened for (the process settings outside an app)
+def session_settings(db: AsyncSession):
+    return getattr(db.info.get("app_state"), "settings", None) or get_settings()
+
+# Function to forget the cached copy of a user after a committed write
+async def invalidate_user(db: AsyncSession, tID: int):
+    user_cache = session_user_cache(db)
+    if user_cache is not None:
+        await user_cache.invalidate(tID)
+
+
+# Profile fields refreshed from Telegram on every login
+USER_PROFILE_FIELDS = ("first_name", "last_name", "username", "language_code", "is_premium", "allows_write_to_pm")
+
+# Columns needed to build a UserSchema
+USER_SCHEMA_COLUMNS = [getattr(UserModel, name) for name in UserSchema.model_fields]
+
+# Columns needed to build a Quest response
+QUEST_COLUMNS = (QuestModel.id, QuestModel.title, QuestModel.description)
+
+# Function to build a UserSchema from a result row without re-validating it
+def user_from_row(row):
+    # The row comes straight from the users table, so its values already have the schema's types
+    mapping = row._mapping
+    return UserSchema.model_construct(**{name: mapping[name] for name in UserSchema.model_fields})
+
+# Function to build "the stored profile differs from these values", so unchanged logins write nothing
+def profile_changed(values):
+    columns = UserModel.__table__.c
+    return tuple_(*(columns[name] for name in USER_PROFILE_FIELDS)).is_distinct_from(
+        tuple_(*(values[name] for name in USER_PROFILE_FIELDS))
+    )
+
+# Function to register a user or refresh an existing one in a single statement
+async def upsert_user(db: AsyncSession, user: UserCreate):
+    """
+    Insert the user, or update the profile fields of the existing row with the same tID.
+
+    A login with an unchanged profile writes no row version and keeps the cached copy.
+
+    Returns a tuple of (UserSchema, created) where created is True if the row was new.
+    """
+    values = {"tID": user.id, **{name: getattr(user, name) for name in USER_PROFILE_FIELDS}}
+    columns = UserModel.__table__.c
+
+    if db.bind.dialect.name == "postgresql":
+        # INSERT ... ON CONFLICT DO UPDATE ... WHERE changed RETURNING, xmax is 0 only for freshly inserted rows
+        query = pg_insert(UserModel).values(**values)
+        query = query.on_conflict_do_update(
+            index_elements=[UserModel.tID],
+            set_={name: query.excluded[name] for name in USER_PROFILE_FIELDS},
+            where=profile_changed(query.excluded),
+        ).returning(*columns, literal_column("(xmax = 0)").label("created"))
+        row = (await db.execute(query)).first()
+        created = row is not None and row.created
+    else:
+        # Other dialects (SQLite stand-in) cannot tell inserts from updates, so try DO NOTHING first
+        query = sqlite_insert(UserModel).values(**values).on_conflict_do_nothing(
+            index_elements=[UserModel.tID]
+        ).returning(*columns)
+        row = (await db.execute(query)).first()
+        created = row is not None
+        if not created:
+            query = update(UserModel).where(UserModel.tID == user.id, profile_changed(values)).values(
+                **{name: values[name] for name in USER_PROFILE_FIELDS}
+            ).returning(*columns)
+            row = (await db.execute(query)).first()
+
+    await db.commit()  # Commit the transaction
+    if row is None:
+        # The stored profile already matched, nothing was written
+        return await select_user_by_tID(db, user.id), False
+    await invalidate_user(db, user.id)  # The profile changed (or a cached "unknown tID" entry is stale)
+    return user_from_row(row), created
+
+# Function to register or refresh many users with one multi-row statement and a single commit
+async def upsert_users(db: AsyncSession, users: list):
+    """
+    Upsert a batch of users like upsert_user does for one.
+
+    Returns a list of (UserSchema, created) in the order of `users`. When a tID appears more than
+    once, the last profile wins and only its first occurrence can be reported as created.
+    """
+    latest = {user.id: user for user in users}  # One row per tID: ON CONFLICT cannot touch a row twice
+    values = [{"tID": tID, **{name: getattr(user, name) for name in USER_PROFILE_FIELDS}}
+              for tID, user in latest.items()]
+    columns = UserModel.__table__.c
+
+    if db.bind.dialect.name == "postgresql":
+        # Multi-row INSERT ... ON CONFLICT DO UPDATE ... WHERE changed RETURNING, xmax is 0 only for
+        # freshly inserted rows; unchanged rows are not returned
+        query = pg_insert(UserModel).values(values)
+        query = query.on_conflict_do_update(
+            index_elements=[UserModel.tID],
+            set_={name: query.excluded[name] for name in USER_PROFILE_FIELDS},
+            where=profile_changed(query.excluded),
+        ).returning(*columns, literal_column("(xmax = 0)").label("created"))
+        rows = {row.tID: (user_from_row(row), row.created) for row in await db.execute(query)}
+        written = set(rows)
+        unchanged = await select_users_by_tIDs(db, [tID for tID in latest if tID not in written])
+        rows.update({tID: (user, False) for tID, user in unchanged.items()})
+    else:
+        # Insert the new users, then update the changed profiles of the existing ones in one executemany
+        query = sqlite_insert(UserModel).values(values).on_conflict_do_nothing(
+            index_elements=[UserModel.tID]
+        ).returning(UserModel.tID)
+        inserted = set((await db.execute(query)).scalars())
+        stored = await select_users_by_tIDs(db, [tID for tID in latest if tID not in inserted])
+        changed = [value for value in values if value["tID"] in stored and any(
+            getattr(stored[value["tID"]], name) != value[name] for name in USER_PROFILE_FIELDS
+        )]
+        if changed:
+            table = UserModel.__table__
+            query = update(table).where(table.c.tID == bindparam("b_tID")).values(
+                {name: bindparam(f"b_{name}") for name in USER_PROFILE_FIELDS}
+            )
+            await db.execute(query, [{f"b_{name}": value for name, value in row.items()} for row in changed])
+        written = inserted | {value["tID"] for value in changed}
+        found = await select_users_by_tIDs(db, list(latest))
+        rows = {tID: (user, tID in inserted) for tID, user in found.items()}
+
+    await db.commit()  # Commit the whole batch at once
+    for tID in written:
+        await invalidate_user(db, tID)
+
+    results, seen = [], set()
+    for user in users:
+        row, created = rows[user.id]
+        results.append((row, created and user.id not in seen))
+        seen.add(user.id)
+    return results
 
 
 # Function to retrieve a user by their Telegram ID (tID)
@@ -28,40 +175,242 @@ async def create_user(db: AsyncSession, user: UserCreate):
     # with tID = Column(BigInteger, unique=True, index=True)  # Telegram ID
 
 async def get_user_by_tID(db: AsyncSession, tID: int):
-    # Create a select query to find a user with the given tID
-    query = select(UserModel).where(UserModel.tID == tID)
+    """
+    Return the user with this Telegram ID as a UserSchema, or None if there is none.
+
+    The user is read in the caller's session (its transaction, its replica). Concurrent lookups in
+    one session share a single query through the session's loader.
+    """
+    if session_settings(db).user_loader_enabled:
+        load = lambda: session_user_loader(db).load(tID)
+    else:
+        load = lambda: select_user_by_tID(db, tID)
+    # Serve the user from the cache; concurrent misses for the same tID share one load
+    user_cache = session_user_cache(db)
+    if user_cache is not None and can_use_user_cache(db):
+        return await user_cache.get_or_load(tID, load)
+    return await load()
+
+# Function to get the batching loader of a session, created on its first lookup
+def session_user_loader(db: AsyncSession) -> BatchLoader:
+    loader = db.info.get("user_loader")
+    if loader is None:
+        lock = asyncio.Lock()
+
+        async def load_batch(tIDs: list) -> dict:
+            async with lock:  # A session runs one statement at a time, batches beyond max_batch queue up
+                return await select_users_by_tIDs(db, tIDs)
+
+        # The batches run in the context of the request that owns the session
+        loader = BatchLoader(load_batch, session_settings(db).user_loader_max_batch, detach_context=False)
+        db.info["user_loader"] = loader
+    return loader
+
+# Function to decide whether a session's user lookups may go through the shared user cache
+def can_use_user_cache(db: AsyncSession) -> bool:
+    """
+    The cache only holds committed rows from the primary: sessions on a replica (which may lag) or
+    with uncommitted writes to users (which the cache must neither hide nor share) bypass it.
+    """
+    return db.info.get("engine", "primary") == "primary" and not db.info.get("users_written")
+
+# Remember that a session's transaction wrote to the users table, until it commits or rolls back
+@event.listens_for(Session, "do_orm_execute")
+def _track_user_writes(state):
+    table = getattr(state.statement, "table", None)
+    if (state.is_insert or state.is_update or state.is_delete) and getattr(table, "name", None) == UserModel.__tablename__:
+        state.session.info["users_written"] = True
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _forget_user_writes(session):
+    session.info.pop("users_written", None)
+
+# Function to load a user by their Telegram ID from the database, bypassing the cache
+async def select_user_by_tID(db: AsyncSession, tID: int):
+    # Select only the schema's columns as a plain row, skipping ORM entity construction and tracking
+    query = select(*USER_SCHEMA_COLUMNS).where(UserModel.tID == tID)
     result = await db.execute(query)  # Execute the query asynchronously
-    user = result.scalars().first()  # Get the first result (or None if no user found)
+    row = result.first()  # Get the first result (or None if no user found)
     # Return the user as a UserSchema if found, otherwise None
-    return UserSchema.from_orm(user) if user else None
+    return user_from_row(row) if row else None
+
+# Function to build a "tID is one of tIDs" condition for the session's database
+def tID_in(db: AsyncSession, tIDs: list):
+    if db.bind.dialect.name == "postgresql":
+        # WHERE "tID" = ANY(:tids) uses the unique index with a single array parameter, so the
+        # prepared statement is the same for any number of ids
+        return UserModel.tID == any_(bindparam("tids", list(tIDs), type_=ARRAY(BigInteger)))
+    return UserModel.tID.in_(tIDs)
+
+# Function to load many users by their Telegram IDs with a single query, bypassing the cache
+async def select_users_by_tIDs(db: AsyncSession, tIDs: list) -> dict:
+    """
+    Return {tID: UserSchema} for the users found among `tIDs`.
+    """
+    if not tIDs:
+        return {}
+    result = await db.execute(select(*USER_SCHEMA_COLUMNS).where(tID_in(db, tIDs)))
+    return {row.tID: user_from_row(row) for row in result}
+
+# Function to retrieve many users by their Telegram IDs
+async def get_users_by_tIDs(db: AsyncSession, tIDs: list) -> dict:
+    """
+    Return {tID: UserSchema or None} for every requested tID, loading the uncached ones with one query.
+    """
+    user_cache = session_user_cache(db)
+    if user_cache is not None and can_use_user_cache(db):
+        return await user_cache.get_many_or_load(tIDs, lambda missing: select_users_by_tIDs(db, missing))
+    found = await select_users_by_tIDs(db, tIDs)
+    return {tID: found.get(tID) for tID in tIDs}
 
 # Function to delete a user by their ID(TelegramID)
 async def delete_user_by_id(db: AsyncSession, user_id: int):
-    # Create a select query to find a user with the given ID
-    query = select(UserModel).filter_by(tID=user_id)
-    result = await db.execute(query)  # Execute the query asynchronously
-    user = result.scalar_one_or_none()  # Get the single result (or None if no user found)q\q
-    
-    # If a user is found, delete it and commit the transaction
-    if user:
-        await db.delete(user)
-        await db.commit()
-        return True  # Return True if the deletion was successful
-    return False  # Return False if no user was found
+    # A single DELETE ... WHERE "tID" = :id RETURNING id, no SELECT or ORM instance needed
+    query = delete(UserModel).where(UserModel.tID == user_id).returning(UserModel.id)
+    deleted = (await db.execute(query)).first() is not None
+    await db.commit()  # Commit the transaction
+
+    if deleted:
+        await invalidate_user(db, user_id)
+    return deleted  # True if a user was found and deleted, False otherwise
+
+# Function to delete many users by their Telegram IDs with one statement, without committing
+async def delete_users_by_tIDs(db: AsyncSession, tIDs: list) -> list:
+    """
+    Delete the users among `tIDs` and return the tIDs that were found.
+
+    The caller owns the transaction (and invalidates the cached users once it commits).
+    """
+    if not tIDs:
+        return []
+    query = delete(UserModel).where(tID_in(db, tIDs)).returning(UserModel.tID)
+    return (await db.execute(query)).scalars().all()
+
+# Name of the quest catalog in the catalog_versions table
+QUEST_CATALOG = "quests"
+
+# Function to read the version of a catalog, used to derive ETags without querying the catalog itself
+async def get_catalog_version(db: AsyncSession, name: str = QUEST_CATALOG):
+    """
+    Return (version, updated_at) of the catalog, or (0, None) if it was never written.
+    """
+    query = select(CatalogVersion.version, CatalogVersion.updated_at).where(CatalogVersion.name == name)
+    row = (await db.execute(query)).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+# Function to bump the version of a catalog inside the caller's transaction
+async def bump_catalog_version(db: AsyncSession, name: str = QUEST_CATALOG):
+    """
+    Increment the catalog version, creating its row on first use. Returns the new version.
+
+    Runs in the same transaction as the write it tracks, so the new version is visible exactly
+    when the write is.
+    """
+    now = datetime.now(timezone.utc)
+    dialect_insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    query = dialect_insert(CatalogVersion).values(name=name, version=1, updated_at=now)
+    query = query.on_conflict_do_update(
+        index_elements=[CatalogVersion.name],
+        set_={"version": CatalogVersion.version + 1, "updated_at": now},
+    ).returning(CatalogVersion.version)
+    version = (await db.execute(query)).scalar_one()
+    db.info["quest_catalog_version"] = version  # Announced to the catalog snapshots once committed
+    return version
 
 # Function to create a new quest in the database
 async def create_quest(quest: QuestCreate, db: AsyncSession):
     # Create an insert query for the QuestModel table with the provided quest data
     query = QuestModel.__table__.insert().values(title=quest.title, description=quest.description)
     result = await db.execute(query)  # Execute the query asynchronously
+    await bump_catalog_version(db)  # Invalidate the catalog ETags in the same transaction
     await db.commit()  # Commit the transaction
     # Return the quest data with the newly inserted ID
     return {**quest.model_dump(), "id": result.inserted_primary_key[0]}
 
+# Function to insert a batch of quests with a single statement, without committing
+async def insert_quests(db: AsyncSession, quests: list, use_copy: bool = False):
+    """
+    Insert a batch of quests and return their ids in input order.
+
+    - **quests**: The QuestCreate items of the batch.
+    - **use_copy**: Load the rows with Postgres COPY (asyncpg only) instead of a multi-row INSERT.
+
+    The caller owns the transaction, so the batch can be committed alone or as part of a larger one.
+    The catalog version is bumped in that transaction too.
+    """
+    await bump_catalog_version(db)
+    if use_copy:
+        # COPY cannot return generated keys, so reserve the ids from the sequence first
+        ids = (await db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('quests', 'id')) FROM generate_series(1, :n)"),
+            {"n": len(quests)},
+        )).scalars().all()
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            QuestModel.__tablename__,
+            records=[(id, quest.title, quest.description) for id, quest in zip(ids, quests)],
+            columns=["id", "title", "description"],
+        )
+        return list(ids)
+
+    # Multi-row INSERT ... VALUES (...), (...) RETURNING id, ids sorted back into input order
+    query = insert(QuestModel).returning(QuestModel.id, sort_by_parameter_order=True)
+    result = await db.execute(query, [{"title": quest.title, "description": quest.description} for quest in quests])
+    return result.scalars().all()
+
+# Function to stream every quest in chunks using a server-side cursor
+async def stream_quests(db: AsyncSession, chunk_size: int = 1000):
+    """
+    Yield all quests ordered by id as lists of (id, title, description) rows.
+
+    Rows are fetched `chunk_size` at a time from a server-side cursor, so the full result set
+    is never held in memory.
+    """
+    query = select(*QUEST_COLUMNS).order_by(QuestModel.id)
+    result = await db.stream(query.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions():
+        yield rows
+
 # Function to retrieve a list of quests with optional pagination
-async def get_quests(db: AsyncSession, skip: int = 0, limit: int = 10):
-    # Create a select query to retrieve quests with pagination (offset and limit)
-    query = select(QuestModel).offset(skip).limit(limit)
+async def get_quests(db: AsyncSession, skip: int = 0, limit: int = 10, sort: str = "id", after: tuple = None):
+    """
+    Retrieve a page of quests ordered by the given sort key, as (id, title, description) rows.
+
+    - **skip**: Number of quests to skip (offset pagination, ignored when `after` is given).
+    - **limit**: Maximum number of quests to return.
+    - **sort**: Sort key, one of app.utils.pagination.SORT_KEYS.
+    - **after**: Ordering values of the last quest of the previous page (keyset pagination).
+    """
+    order = [getattr(QuestModel, name) for name in SORT_KEYS[sort]]
+    # Plain (id, title, description) rows: no ORM identity map or attribute instrumentation
+    query = select(*QUEST_COLUMNS).order_by(*order).limit(limit)
+    if after is not None:
+        # WHERE (key, id) > (:last_key, :last_id) walks the index instead of skipping rows
+        query = query.where(tuple_(*order) > tuple_(*after) if len(order) > 1 else order[0] > after[0])
+    else:
+        query = query.offset(skip)
     result = await db.execute(query)  # Execute the query asynchronously
-    # Return a list of quests
-    return result.scalars().all()
+    # Return a list of quest rows
+    return result.all()
+
+# Function to count the quests without scanning the table
+async def count_quests(db: AsyncSession, mode: str = "exact") -> int:
+    """
+    Return the number of quests.
+
+    - **mode**: `exact` reads the counter kept by the quests table's triggers (row_counts);
+      `estimated` reads the planner's estimate (Postgres pg_class.reltuples, refreshed by VACUUM
+      and ANALYZE). Without an estimate (other databases, or a table never analyzed) the exact
+      count is returned.
+    """
+    if mode == "estimated" and db.bind.dialect.name == "postgresql":
+        estimate = (await db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": QuestModel.__tablename__},
+        )).scalar()
+        if estimate is not None and estimate >= 0:  # -1: never analyzed
+            return estimate
+    query = select(RowCount.count).where(RowCount.name == QuestModel.__tablename__)
+    return (await db.execute(query)).scalar() or 0
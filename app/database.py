@@ -1,32 +1,359 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+from collections import deque
+import itertools
+import time
 
-from dotenv import load_dotenv
-import os
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
-# Load environment variables from .env file
-load_dotenv()
+from app.config import Settings, get_settings
 
-# Retrieve the database URL from environment variables
-database_url = os.getenv("DATABASE_URL")
 
-# Create an asynchronous SQLAlchemy engine connected to the database
-# 'echo=True' enables SQL statement logging for debugging
-engine = create_async_engine(database_url, echo=True)
+def engine_options(settings: Settings) -> dict:
+    """
+    Build the create_async_engine keyword arguments for the configured profile.
+    """
+    url = make_url(settings.database_url)
+    options = {"echo": settings.db_echo, "pool_pre_ping": settings.db_pool_pre_ping}
 
-# Create an asynchronous session factory for managing database sessions
-AsyncSessionLocal = sessionmaker(
-    bind=engine,  # Bind the session to the asynchronous engine
-    class_=AsyncSession,  # Use AsyncSession for asynchronous operations
-    expire_on_commit=False,  # Prevent automatic expiration of instances after commit
+    # In-memory SQLite uses a single static connection, so there is no pool to size
+    if not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+        )
+
+    # asyncpg driver knobs
+    if url.get_driver_name() == "asyncpg":
+        connect_args = {"prepared_statement_cache_size": settings.db_statement_cache_size}
+        if settings.db_command_timeout is not None:
+            connect_args["command_timeout"] = settings.db_command_timeout
+        options["connect_args"] = connect_args
+
+    return options
+
+
+class PoolMonitor:
+    """
+    Collect connection pool telemetry: checkouts, wait time for a connection and pool timeouts.
+    """
+
+    def __init__(self, engine: AsyncEngine, window: int = 1000):
+        self.engine = engine
+        self.waits = deque(maxlen=window)  # Most recent connection wait times in seconds
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.checkouts = 0
+        self.peak_connections = 0  # Most connections open at once (checked out + idle)
+        self.wait_listeners = []  # Called with every wait (and the time spent before a timeout), e.g. admission control
+        event.listen(engine.sync_engine.pool, "checkout", self._on_checkout)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        pool = self.engine.sync_engine.pool
+        opened = (_pool_stat(pool, "checkedout") or 0) + (_pool_stat(pool, "checkedin") or 0)
+        self.peak_connections = max(self.peak_connections, opened)
+
+    def record_wait(self, seconds: float):
+        self.waits.append(seconds)
+        self.wait_count += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        for listener in self.wait_listeners:
+            listener(seconds)
+
+    def record_timeout(self, seconds: float):
+        self.timeouts += 1
+        for listener in self.wait_listeners:
+            listener(seconds)
+
+    def snapshot(self) -> dict:
+        """
+        Return the current pool state and wait-time statistics (milliseconds).
+        """
+        pool = self.engine.sync_engine.pool
+        recent = sorted(self.waits)
+
+        def recent_percentile(pct):
+            return round(recent[min(len(recent) - 1, int(pct / 100 * len(recent)))] * 1000, 3) if recent else 0.0
+
+        return {
+            "pool": type(pool).__name__,
+            "size": _pool_stat(pool, "size"),
+            "checked_out": _pool_stat(pool, "checkedout"),
+            "idle": _pool_stat(pool, "checkedin"),
+            "overflow": _pool_stat(pool, "overflow"),
+            "max_overflow": getattr(pool, "_max_overflow", None),
+            "timeout": pool.timeout() if hasattr(pool, "timeout") else None,
+            "checkouts": self.checkouts,
+            "peak_connections": self.peak_connections,
+            "timeouts": self.timeouts,
+            "wait_ms": {
+                "count": self.wait_count,
+                "avg": round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                "max": round(self.wait_max * 1000, 3),
+                "p50": recent_percentile(50),
+                "p95": recent_percentile(95),
+                "p99": recent_percentile(99),
+            },
+        }
+
+
+class ReplicaRouter:
+    """
+    Pick the engine serving read-only work: a healthy replica, or the primary.
+
+    - **primary**: Engine of the primary database.
+    - **replicas**: Engines of the read replicas, in configuration order.
+    - **strategy**: `round_robin` or `least_busy` (fewest checked-out connections).
+    - **read_your_writes**: Seconds during which a client that just wrote reads from the primary.
+    - **retry_after**: Seconds a failing replica is skipped before it is tried again.
+    """
+
+    def __init__(self, primary: AsyncEngine, replicas: list = (), strategy: str = "round_robin",
+                 read_your_writes: float = 5.0, retry_after: float = 30.0):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.read_your_writes = read_your_writes
+        self.retry_after = retry_after
+        self.names = {primary: "primary", **{engine: f"replica-{i}" for i, engine in enumerate(self.replicas)}}
+        self._turn = itertools.count()
+        self._down_until = {}  # Failing replica -> time until which it is skipped
+        self._recent_writers = {}  # Client key -> time until which its reads go to the primary
+
+    def mark_write(self, client_key: str):
+        # Called after a client's transaction commits on the primary
+        if client_key and self.replicas:
+            now = time.monotonic()
+            self._recent_writers[client_key] = now + self.read_your_writes
+            if len(self._recent_writers) > 10000:
+                # Forget expired windows so the map stays bounded
+                self._recent_writers = {key: until for key, until in self._recent_writers.items() if until > now}
+
+    def mark_down(self, engine: AsyncEngine):
+        self._down_until[engine] = time.monotonic() + self.retry_after
+
+    def healthy_replicas(self) -> list:
+        now = time.monotonic()
+        return [engine for engine in self.replicas if self._down_until.get(engine, 0) <= now]
+
+    def choose(self, client_key: str = None) -> AsyncEngine:
+        """
+        Return the engine that should serve a read for the given client.
+        """
+        if client_key in self._recent_writers:
+            if self._recent_writers[client_key] > time.monotonic():
+                return self.primary  # Read-your-writes window
+            del self._recent_writers[client_key]
+
+        candidates = self.healthy_replicas()
+        if not candidates:
+            return self.primary
+        if self.strategy == "least_busy":
+            return min(candidates, key=lambda engine: _pool_stat(engine.sync_engine.pool, "checkedout") or 0)
+        return candidates[next(self._turn) % len(candidates)]
+
+    async def check_health(self):
+        """
+        Ping every replica, taking failing ones out of rotation and restoring recovered ones.
+        """
+        for engine in self.replicas:
+            try:
+                async with engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+            except (DBAPIError, OSError, PoolTimeoutError):
+                self.mark_down(engine)
+            else:
+                self._down_until.pop(engine, None)
+
+    async def dispose(self):
+        for engine in self.replicas:
+            await engine.dispose()
+
+
+def _pool_stat(pool, name):
+    # Not every pool class (e.g. StaticPool, NullPool) tracks every counter
+    method = getattr(pool, name, None)
+    return method() if callable(method) else None
+
+
+# Settings the engines, pools and replica routing are built from
+DATABASE_SETTINGS = (
+    "database_url", "database_replica_urls", "db_replica_strategy", "db_read_your_writes_seconds",
+    "db_replica_retry_seconds", "db_echo", "db_pool_size", "db_max_overflow", "db_pool_timeout",
+    "db_pool_recycle", "db_pool_pre_ping", "db_statement_cache_size", "db_command_timeout",
 )
 
+
+class Database:
+    """
+    The engines of one configuration: the primary, its pool telemetry, the replica router and the session factory.
+
+    - **settings**: Settings the engines are built from.
+
+    Nothing connects until a session is opened.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+
+        # Create an asynchronous SQLAlchemy engine configured from the selected profile
+        self.engine = create_async_engine(settings.database_url, **engine_options(settings))
+
+        # Route read-only work to the replicas, falling back to the primary
+        self.replica_router = ReplicaRouter(
+            self.engine,
+            [create_async_engine(url, **engine_options(settings)) for url in settings.replica_urls],
+            strategy=settings.db_replica_strategy,
+            read_your_writes=settings.db_read_your_writes_seconds,
+            retry_after=settings.db_replica_retry_seconds,
+        )
+
+        # Track the pool usage of every database so pools can be sized per worker
+        self.pool_monitors = {engine: PoolMonitor(engine) for engine in (self.engine, *self.replica_router.replicas)}
+        self.pool_monitor = self.pool_monitors[self.engine]  # The primary's, e.g. for admission control
+
+        # Create an asynchronous session factory for managing database sessions
+        self.session_factory = sessionmaker(
+            bind=self.engine,  # Bind the session to the asynchronous engine
+            class_=AsyncSession,  # Use AsyncSession for asynchronous operations
+            expire_on_commit=False,  # Prevent automatic expiration of instances after commit
+        )
+
+    # Acquire the session's connection up front so the time spent waiting on the engine's pool is measured
+    async def connect(self, session: AsyncSession, engine: AsyncEngine):
+        monitor = self.pool_monitors.get(engine)
+        start = time.perf_counter()
+        try:
+            await session.connection()
+        except PoolTimeoutError:
+            if monitor is not None:
+                monitor.record_timeout(time.perf_counter() - start)
+            raise
+        if monitor is not None:
+            monitor.record_wait(time.perf_counter() - start)
+
+    async def open_session(self, key: str = None) -> AsyncSession:
+        """
+        Open a session on the primary for the given client.
+        """
+        session = self.session_factory()
+        session.info["client_key"] = key
+        session.info["engine"] = "primary"
+        session.info["replica_router"] = self.replica_router
+        try:
+            await self.connect(session, self.engine)
+        except BaseException:
+            await session.close()
+            raise
+        return session
+
+    async def open_read_session(self, key: str = None) -> AsyncSession:
+        """
+        Open a session for read-only work on the engine picked by the replica router.
+        """
+        router = self.replica_router
+        read_engine = router.choose(key)
+        session = self.session_factory(bind=read_engine)
+        try:
+            await self.connect(session, read_engine)
+        except (DBAPIError, OSError, PoolTimeoutError):
+            await session.close()
+            if read_engine is router.primary:
+                raise
+            # The replica is unreachable: take it out of rotation and serve from the primary
+            router.mark_down(read_engine)
+            read_engine = router.primary
+            session = self.session_factory(bind=read_engine)
+            await self.connect(session, read_engine)
+        session.info["engine"] = router.names[read_engine]
+        return session
+
+    def pool_snapshots(self) -> dict:
+        """
+        Return {database name: PoolMonitor snapshot} for the primary and every replica.
+        """
+        names = self.replica_router.names
+        return {names.get(engine, str(engine.url)): monitor.snapshot() for engine, monitor in self.pool_monitors.items()}
+
+    async def dispose(self):
+        """
+        Close the pooled connections of every engine; they reconnect on next use.
+        """
+        await self.replica_router.dispose()
+        await self.engine.dispose()
+
+
+# Databases built so far, by their DATABASE_SETTINGS values
+_databases = {}
+
+def get_database(settings: Settings = None) -> Database:
+    """
+    Return the Database for the settings (defaults to the process settings), building it on first use.
+
+    Settings that only differ outside DATABASE_SETTINGS share the same engines.
+    """
+    settings = settings or get_settings()
+    key = tuple(getattr(settings, name) for name in DATABASE_SETTINGS)
+    database = _databases.get(key)
+    if database is None:
+        database = _databases[key] = Database(settings)
+    return database
+
+# `engine`, `pool_monitor`, `replica_router` and `AsyncSessionLocal` of the process database, built on
+# first access rather than at import
+def __getattr__(name):
+    if name in ("engine", "pool_monitor", "replica_router"):
+        return getattr(get_database(), name)
+    if name == "AsyncSessionLocal":
+        return get_database().session_factory
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # Create a base class for declarative models
 Base = declarative_base()
 
+# Identify the client for read-your-writes routing
+def client_key(request: Request) -> str:
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "")
+
+# Once a client's transaction commits on the primary, its reads stay on the primary for a while
+@event.listens_for(Session, "after_commit")
+def _route_reads_after_write(session):
+    key = session.info.get("client_key")
+    router = session.info.get("replica_router")
+    if key is not None and router is not None:
+        router.mark_write(key)
+
+# Get the Database serving a request: the one its app was created with
+def request_database(request: Request) -> Database:
+    return getattr(request.app.state, "database", None) or get_database()
+
+# Open a session on the primary of the process database for the given client
+async def open_session(key: str = None) -> AsyncSession:
+    return await get_database().open_session(key)
+
 # Dependency to get a database session
 # Uses asynchronous context manager to ensure proper session handling
-async def get_db():
-    async with AsyncSessionLocal() as session:
+async def get_db(request: Request):
+    async with await request_database(request).open_session(client_key(request)) as session:
+        session.info["app_state"] = request.app.state  # The user cache, catalog, ... of the app serving it
         yield session  # Provide the session to the caller, ensuring it's properly closed
+
+# Open a session for read-only work on the process database
+async def open_read_session(key: str = None) -> AsyncSession:
+    return await get_database().open_read_session(key)
+
+# Dependency to get a database session for read-only endpoints
+async def get_read_db(request: Request):
+    session = await request_database(request).open_read_session(client_key(request))
+    session.info["app_state"] = request.app.state  # The user cache, catalog, ... of the app serving it
+    async with session:
+        yield session
@@ -0,0 +1,239 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+import time
+import weakref
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+# Histogram bucket upper bounds in seconds (Prometheus `le` labels)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Quantiles reported for every histogram
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with quantiles estimated by interpolating inside the matching bucket.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot counts observations above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class RequestStats:
+    """
+    Database work attributed to the request being served.
+    """
+
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+# Stats of the request handled by the current task (None outside of a request)
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+
+class MetricsRegistry:
+    """
+    In-process request metrics: latency and DB-time histograms, status counters and in-flight gauge.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.in_flight = 0
+        self.latency = {}  # (method, route) -> Histogram of request durations
+        self.db_time = {}  # (method, route) -> Histogram of DB time per request
+        self.db_queries = {}  # (method, route) -> total number of queries
+        self.statuses = {}  # (method, route, status) -> number of responses
+        self.histograms = {}  # name -> (help text, Histogram) of other components (batch sizes, ...)
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        """
+        Return the histogram registered under `name`, creating it on first use.
+        """
+        if name not in self.histograms:
+            self.histograms[name] = (help_text, Histogram(buckets))
+        return self.histograms[name][1]
+
+    def observe(self, method: str, route: str, status: int, elapsed: float, stats: RequestStats):
+        key = (method, route)
+        if key not in self.latency:
+            self.latency[key], self.db_time[key], self.db_queries[key] = Histogram(), Histogram(), 0
+        self.latency[key].observe(elapsed)
+        self.db_time[key].observe(stats.db_time)
+        self.db_queries[key] += stats.queries
+        status_key = (method, route, status)
+        self.statuses[status_key] = self.statuses.get(status_key, 0) + 1
+
+    def render(self, extra_gauges: dict = None) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_requests_total Responses by route and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self.statuses.items()):
+            lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+        for name, help_text, histograms in (
+            ("http_request_duration_seconds", "Request latency by route.", self.latency),
+            ("http_request_db_seconds", "Database time per request by route.", self.db_time),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (method, route), histogram in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(method=method, route=route)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_labels(method=method, route=route)} {histogram.count}")
+            lines += [f"# HELP {name}_quantile Estimated quantiles of {name}.", f"# TYPE {name}_quantile gauge"]
+            for (method, route), histogram in sorted(histograms.items()):
+                for q in QUANTILES:
+                    value = histogram.quantile(q)
+                    lines.append(f"{name}_quantile{_labels(method=method, route=route, quantile=q)} {value:.6f}")
+
+        lines += ["# HELP db_queries_total Database queries issued by route.", "# TYPE db_queries_total counter"]
+        for (method, route), count in sorted(self.db_queries.items()):
+            lines.append(f"db_queries_total{_labels(method=method, route=route)} {count}")
+
+        for name, (help_text, histogram) in sorted(self.histograms.items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(le=bound)} {cumulative}")
+            lines += [f"{name}_sum {histogram.sum:.6f}", f"{name}_count {histogram.count}"]
+
+        for name, value in (extra_gauges or {}).items():
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    # Escape a Prometheus label value
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+# Process-wide registry used by the middleware and the /metrics endpoint
+registry = MetricsRegistry()
+
+
+# Engines already attributing their queries to requests
+_instrumented_engines = weakref.WeakSet()
+
+def instrument_engine(engine):
+    """
+    Attribute the query count and cursor execution time of an engine to the current request.
+
+    Instrumenting an engine again (e.g. from a second app built by create_app) does nothing.
+    """
+    sync_engine = engine.sync_engine
+    if sync_engine in _instrumented_engines:
+        return
+    _instrumented_engines.add(sync_engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += time.perf_counter() - conn.info.pop("query_start", time.perf_counter())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route metrics and adding a `Server-Timing` header.
+
+    - **app**: The wrapped ASGI application.
+    - **metrics**: Registry receiving the observations.
+    - **server_timing**: Whether to add the `Server-Timing` header to responses.
+    """
+
+    def __init__(self, app, metrics: MetricsRegistry = registry, server_timing: bool = True):
+        self.app = app
+        self.metrics = metrics
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.metrics.enabled:
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status = 500  # Reported if the app fails before sending a response
+        self.metrics.in_flight += 1
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing",
+                        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries", app;dur={elapsed_ms:.2f}',
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            self.metrics.in_flight -= 1
+            current_request.reset(token)
+            self.metrics.observe(scope["method"], route_template(scope), status, time.perf_counter() - start, stats)
+
+
+def route_template(scope) -> str:
+    """
+    Return the path template of the matched route (e.g. `/api/users/{user_id}`) to keep labels bounded.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    template = route.path
+    # Routes of included routers may not carry the router prefix; take it from the concrete path,
+    # which has one segment per template segment after the prefix
+    extra_segments = scope["path"].count("/") - template.count("/")
+    if extra_segments > 0:
+        template = "/".join(scope["path"].split("/")[:extra_segments + 1]) + template
+    return template
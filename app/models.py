@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, BigInteger, DateTime, Index, DDL, event
 from app.database import Base  # Import the base class for declarative table definitions from your database module
 
 # Define the Quest model for the "quests" table
@@ -9,6 +9,54 @@ class Quest(Base):
     title = Column(String, index=True)
     description = Column(String)
 
+    __table_args__ = (
+        Index("ix_quests_title_id", "title", "id"),  # Keyset pagination ordered by title
+    )
+
+# Text search configuration used for the tsvector column ('simple' does not stem, users write in many languages)
+SEARCH_CONFIG = "simple"
+
+# Postgres: a tsvector column (title weighted above description) filled by a trigger, its GIN index and a
+# trigram index on title for prefix/typo matches. Alembic applies the same DDL, backfills existing rows in
+# batches and builds the indexes with CREATE INDEX CONCURRENTLY.
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE quests ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"""CREATE OR REPLACE FUNCTION quests_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.title, '')), 'A') ||
+                             setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "CREATE TRIGGER quests_search_vector BEFORE INSERT OR UPDATE OF title, description ON quests "
+    "FOR EACH ROW EXECUTE FUNCTION quests_search_vector()",
+    "CREATE INDEX IF NOT EXISTS ix_quests_search_vector ON quests USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_quests_title_trgm ON quests USING gin (title gin_trgm_ops)",
+]
+
+# SQLite stand-in: an external-content FTS5 table kept in sync with quests by triggers
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS quests_fts USING fts5("
+    "title, description, content='quests', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS quests_fts_ai AFTER INSERT ON quests BEGIN "
+    "INSERT INTO quests_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS quests_fts_ad AFTER DELETE ON quests BEGIN "
+    "INSERT INTO quests_fts(quests_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS quests_fts_au AFTER UPDATE ON quests BEGIN "
+    "INSERT INTO quests_fts(quests_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO quests_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+
+# Create the full-text search structures whenever the quests table is created through metadata.create_all
+for statement in POSTGRES_SEARCH_DDL:
+    event.listen(Quest.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Quest.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Quest.__table__, "before_drop", DDL("DROP TABLE IF EXISTS quests_fts").execute_if(dialect="sqlite"))
+
 # Define the User model for the "users" table
 class User(Base):
     __tablename__ = 'users' # The table name in the database
@@ -21,3 +69,79 @@ class User(Base):
     language_code = Column(String)
     is_premium = Column(Boolean)
     allows_write_to_pm = Column(Boolean)
+
+# Define the CatalogVersion model for the "catalog_versions" table
+class CatalogVersion(Base):
+    __tablename__ = "catalog_versions" # The table name in the database
+
+    name = Column(String, primary_key=True)  # Catalog name, e.g. "quests"
+    version = Column(BigInteger, nullable=False, default=0)  # Bumped on every write to the catalog
+    updated_at = Column(DateTime(timezone=True))  # Time of the last bump
+
+# Postgres: NOTIFY the catalog's channel (e.g. "catalog_quests") with the new version whenever it is
+# bumped, so every worker's in-memory snapshot learns about writes from any process on commit
+POSTGRES_CATALOG_NOTIFY_DDL = [
+    """CREATE OR REPLACE FUNCTION notify_catalog_version() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('catalog_' || NEW.name, NEW.version::text);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "CREATE TRIGGER catalog_versions_notify AFTER INSERT OR UPDATE ON catalog_versions "
+    "FOR EACH ROW EXECUTE FUNCTION notify_catalog_version()",
+]
+
+for statement in POSTGRES_CATALOG_NOTIFY_DDL:
+    event.listen(CatalogVersion.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+# Define the RowCount model for the "row_counts" table
+class RowCount(Base):
+    __tablename__ = "row_counts" # The table name in the database
+
+    name = Column(String, primary_key=True)  # Counted table, e.g. "quests"
+    count = Column(BigInteger, nullable=False, default=0)  # Rows in the table, kept exact by its triggers
+
+# Postgres: statement-level triggers add the size of each statement's transition table to the counter,
+# so a COPY or multi-row INSERT costs one counter update rather than one per row. Concurrent writers
+# queue on the counter row until they commit, as they already do on catalog_versions.
+POSTGRES_ROW_COUNT_DDL = [
+    """CREATE OR REPLACE FUNCTION count_rows() RETURNS trigger AS $$
+    DECLARE
+        delta bigint;
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            UPDATE row_counts SET count = 0 WHERE name = TG_TABLE_NAME;
+            RETURN NULL;
+        ELSIF TG_OP = 'INSERT' THEN
+            SELECT count(*) INTO delta FROM new_rows;
+        ELSE
+            SELECT -count(*) INTO delta FROM old_rows;
+        END IF;
+        IF delta <> 0 THEN
+            INSERT INTO row_counts (name, count) VALUES (TG_TABLE_NAME, delta)
+            ON CONFLICT (name) DO UPDATE SET count = row_counts.count + EXCLUDED.count;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "CREATE TRIGGER quests_count_insert AFTER INSERT ON quests REFERENCING NEW TABLE AS new_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION count_rows()",
+    "CREATE TRIGGER quests_count_delete AFTER DELETE ON quests REFERENCING OLD TABLE AS old_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION count_rows()",
+    "CREATE TRIGGER quests_count_truncate AFTER TRUNCATE ON quests FOR EACH STATEMENT EXECUTE FUNCTION count_rows()",
+]
+
+# SQLite stand-in: row-level triggers (SQLite has no statement-level ones)
+SQLITE_ROW_COUNT_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS quests_count_ai AFTER INSERT ON quests BEGIN "
+    "INSERT INTO row_counts (name, count) VALUES ('quests', 1) "
+    "ON CONFLICT (name) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS quests_count_ad AFTER DELETE ON quests BEGIN "
+    "UPDATE row_counts SET count = count - 1 WHERE name = 'quests'; END",
+]
+
+# Count the quests from the moment their table is created through metadata.create_all
+for statement in POSTGRES_ROW_COUNT_DDL:
+    event.listen(Quest.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_ROW_COUNT_DDL:
+    event.listen(Quest.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
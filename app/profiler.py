@@ -0,0 +1,364 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+import asyncio
+import contextvars
+import hashlib
+import logging
+import random
+import re
+import time
+import weakref
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import get_settings
+from app.metrics import Histogram, route_template
+
+logger = logging.getLogger(__name__)
+
+# JSON lines describing slow statements (with their plans) and N+1 requests, when QUERY_LOG_ENABLED is set
+query_log = logging.getLogger("app.queries")
+
+# Literal and placeholder shapes replaced by `?` when fingerprinting
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<![:\w]):\w+|\?")
+_CAST = re.compile(r"\?::\w+(?:\[\])?")  # asyncpg renders $1::VARCHAR
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")  # (?, ?, ?) of any length
+_ROWS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")  # VALUES (...), (...) of any length
+_WHITESPACE = re.compile(r"\s+")
+_WRITE = re.compile(r"\b(?:INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+_LOCKING = re.compile(r"\bFOR\s+(?:UPDATE|NO\s+KEY\s+UPDATE|SHARE|KEY\s+SHARE)\b", re.IGNORECASE)
+_CALL = re.compile(r"\b(\w+)\s*\(")  # A function call, or a keyword followed by a parenthesis
+
+# Functions (and keywords followed by a parenthesis) that a read can use and still be safe to run again
+# under EXPLAIN ANALYZE; any other call, e.g. nextval() or a user-defined function, may have side effects
+_READ_ONLY_CALLS = frozenset((
+    "select", "from", "where", "and", "or", "not", "in", "any", "all", "exists", "as", "on", "using", "over",
+    "partition", "filter", "within", "values", "join", "cast", "case", "when", "then", "else", "lateral",
+    "count", "sum", "min", "max", "avg", "array_agg", "string_agg", "json_agg", "jsonb_agg", "bool_and",
+    "bool_or", "coalesce", "nullif", "greatest", "least", "lower", "upper", "length", "char_length",
+    "substring", "trim", "concat", "abs", "round", "floor", "ceil", "row_number", "rank", "dense_rank",
+    "unnest", "plainto_tsquery", "to_tsquery", "websearch_to_tsquery", "to_tsvector", "ts_rank",
+    "ts_rank_cd", "varchar", "integer", "bigint", "text", "numeric", "timestamp",
+))
+
+
+def calls_only_read_only_functions(statement: str) -> bool:
+    """
+    Return True if every function called by the statement is known to be free of side effects.
+    """
+    text = _STRING.sub("''", statement)  # Parentheses inside literals are not calls
+    return all(name.lower() in _READ_ONLY_CALLS for name in _CALL.findall(text))
+
+
+def normalize(statement: str) -> str:
+    """
+    Return the shape of a statement: literals and bound parameters become `?`, lists and multi-row VALUES collapse.
+    """
+    text = _STRING.sub("?", statement)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _CAST.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _LIST.sub("(...)", text)
+    text = _ROWS.sub("(...)", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def explain_prefix(dialect: str, statement: str, analyze: bool = False):
+    """
+    Return the EXPLAIN prefix for a statement on the dialect, or None if it cannot be explained.
+
+    Plain EXPLAIN only plans the statement. With `analyze`, Postgres reads are run again under
+    EXPLAIN ANALYZE, except those that write, lock rows or call a function that may have side
+    effects (e.g. the `nextval` of a COPY or INSERT ... SELECT path): these keep the plain EXPLAIN.
+    """
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    if verb not in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+        return None
+    if dialect == "postgresql":
+        if (analyze and verb in ("SELECT", "WITH") and not _WRITE.search(statement)
+                and not _LOCKING.search(statement) and calls_only_read_only_functions(statement)):
+            return "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+        return "EXPLAIN (FORMAT JSON) "
+    if dialect == "sqlite":
+        return "EXPLAIN QUERY PLAN "
+    return None
+
+
+class QueryStats:
+    """
+    Rolling statistics of one statement shape.
+    """
+
+    __slots__ = ("fingerprint", "statement", "calls", "rows", "slow", "latency", "max", "plan", "plan_at",
+                 "plan_ms")
+
+    def __init__(self, fingerprint: str, statement: str):
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.calls = 0
+        self.rows = 0
+        self.slow = 0
+        self.latency = Histogram()
+        self.max = 0.0
+        self.plan = None  # Last sampled plan of a slow execution
+        self.plan_at = None  # time.monotonic() of the last EXPLAIN
+        self.plan_ms = None  # Duration of the execution that was explained
+
+    def report(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "statement": self.statement,
+            "calls": self.calls,
+            "total_ms": round(self.latency.sum * 1000, 3),
+            "mean_ms": round(self.latency.sum / self.calls * 1000, 3) if self.calls else 0.0,
+            "p95_ms": round(self.latency.quantile(0.95) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "rows": self.rows,
+            "slow": self.slow,
+            "plan": self.plan,
+            "plan_ms": self.plan_ms,
+        }
+
+
+# Fingerprint counts of the request handled by the current task (None outside of a request)
+current_queries: ContextVar = ContextVar("current_queries", default=None)
+
+
+class QueryProfiler:
+    """
+    Per-statement-shape query statistics with sampled EXPLAIN plans of slow statements and N+1 detection.
+
+    - **slow_threshold**: Seconds above which an execution is slow (always recorded, may be explained).
+    - **sample_rate**: Fraction of the other executions recorded in the statistics.
+    - **explain_sample_rate**: Fraction of slow executions whose plan is captured.
+    - **explain_interval**: Seconds between two plans of the same statement shape.
+    - **explain_analyze**: Capture Postgres plans of side-effect-free reads with EXPLAIN ANALYZE, which
+      runs them a second time; otherwise plans are estimates and nothing is executed.
+    - **n_plus_one_threshold**: A request running one read shape this many times is flagged as N+1.
+    - **max_fingerprints**: Statement shapes kept, the least recently seen one is dropped beyond it.
+    - **log**: Write slow statements and N+1 requests as JSON lines to the `app.queries` logger.
+
+    Plans are captured in the background on a separate connection, never on the request's.
+    """
+
+    def __init__(self, slow_threshold: float = 0.1, sample_rate: float = 1.0, explain_sample_rate: float = 0.1,
+                 explain_interval: float = 60.0, n_plus_one_threshold: int = 10, max_fingerprints: int = 1000,
+                 log: bool = False, explain_analyze: bool = False):
+        self.slow_threshold = slow_threshold
+        self.sample_rate = sample_rate
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_interval = explain_interval
+        self.explain_analyze = explain_analyze
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.max_fingerprints = max_fingerprints
+        self.log = log
+        self.statements = 0
+        self.sampled = 0
+        self.explains = 0
+        self.evicted = 0
+        self.stats: "OrderedDict[str, QueryStats]" = OrderedDict()
+        self.n_plus_one = OrderedDict()  # (route, fingerprint) -> {"statement", "requests", "max_repeats"}
+        self._fingerprints = {}  # Statement text -> (fingerprint, normalized text)
+        self._listeners = weakref.WeakKeyDictionary()  # Instrumented sync engine -> its event listeners
+        self._explaining = 0
+
+    def fingerprint(self, statement: str) -> tuple:
+        cached = self._fingerprints.get(statement)
+        if cached is None:
+            normalized = normalize(statement)
+            cached = (hashlib.sha1(normalized.encode()).hexdigest()[:16], normalized)
+            if len(self._fingerprints) >= 10 * self.max_fingerprints:
+                self._fingerprints.clear()  # Statement texts are few; only unparameterized SQL grows this
+            self._fingerprints[statement] = cached
+        return cached
+
+    def instrument(self, engine: AsyncEngine):
+        """
+        Profile every statement executed by the engine (instrumenting it again does nothing).
+        """
+        sync_engine = engine.sync_engine
+        if sync_engine in self._listeners:
+            return
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info["profiler_start"] = time.perf_counter()
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info.pop("profiler_start", time.perf_counter())
+            self.record(engine, statement, parameters, executemany, elapsed, cursor.rowcount)
+
+        self._listeners[sync_engine] = {"before_cursor_execute": before_cursor_execute,
+                                        "after_cursor_execute": after_cursor_execute}
+        for name, listener in self._listeners[sync_engine].items():
+            event.listen(sync_engine, name, listener)
+
+    def uninstrument(self, engine: AsyncEngine):
+        """
+        Stop profiling the engine's statements.
+        """
+        for name, listener in self._listeners.pop(engine.sync_engine, {}).items():
+            event.remove(engine.sync_engine, name, listener)
+
+    def record(self, engine: AsyncEngine, statement: str, parameters, executemany: bool, elapsed: float,
+               rowcount: int):
+        if statement.startswith("EXPLAIN"):
+            return  # Our own plan captures
+        self.statements += 1
+        fingerprint, normalized = self.fingerprint(statement)
+
+        counts = current_queries.get()
+        if counts is not None:
+            seen = counts.get(fingerprint)
+            if seen is None:
+                counts[fingerprint] = [1, normalized]
+            else:
+                seen[0] += 1
+
+        slow = elapsed > self.slow_threshold
+        if not slow and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self.sampled += 1
+        stats = self.stats.get(fingerprint)
+        if stats is None:
+            stats = self.stats[fingerprint] = QueryStats(fingerprint, normalized)
+            if len(self.stats) > self.max_fingerprints:
+                self.stats.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.stats.move_to_end(fingerprint)
+        stats.calls += 1
+        stats.rows += max(rowcount, 0)
+        stats.latency.observe(elapsed)
+        stats.max = max(stats.max, elapsed)
+        if slow:
+            stats.slow += 1
+            if not executemany:
+                self._maybe_explain(engine, stats, statement, parameters, elapsed)
+
+    def _maybe_explain(self, engine: AsyncEngine, stats: QueryStats, statement: str, parameters, elapsed: float):
+        now = time.monotonic()
+        if self._explaining or random.random() >= self.explain_sample_rate:
+            return
+        if stats.plan_at is not None and now - stats.plan_at < self.explain_interval:
+            return
+        prefix = explain_prefix(engine.dialect.name, statement, self.explain_analyze)
+        if prefix is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Synchronous use of the engine, nothing to run the capture on
+        stats.plan_at = now
+        self._explaining += 1
+        # Fresh context: the capture's query belongs to no request
+        loop.create_task(self._explain(engine, stats, prefix + statement, parameters, elapsed),
+                         context=contextvars.Context())
+
+    async def _explain(self, engine: AsyncEngine, stats: QueryStats, explain: str, parameters, elapsed: float):
+        try:
+            async with engine.connect() as connection:  # Rolled back when closed
+                rows = (await connection.exec_driver_sql(explain, parameters)).all()
+            if engine.dialect.name == "postgresql":
+                plan = rows[0][0]
+                stats.plan = orjson.loads(plan) if isinstance(plan, (str, bytes)) else plan
+            else:
+                stats.plan = [row[-1] for row in rows]  # SQLite: the detail column of each step
+            stats.plan_ms = round(elapsed * 1000, 3)
+            self.explains += 1
+            if self.log:
+                query_log.warning(orjson.dumps({
+                    "event": "slow_query", "fingerprint": stats.fingerprint, "statement": stats.statement,
+                    "duration_ms": stats.plan_ms, "plan": stats.plan,
+                }).decode())
+        except Exception:
+            logger.warning("Capturing the plan of %s failed", stats.fingerprint, exc_info=True)
+        finally:
+            self._explaining -= 1
+
+    def finish_request(self, route: str, counts: dict):
+        """
+        Flag the read shapes a request ran at least `n_plus_one_threshold` times.
+
+        - **counts**: {fingerprint: [executions, normalized statement]} of the request.
+        """
+        for fingerprint, (repeats, statement) in counts.items():
+            if repeats < self.n_plus_one_threshold or _WRITE.search(statement):
+                continue  # Repeated writes are batching opportunities, not N+1 reads
+            key = (route, fingerprint)
+            entry = self.n_plus_one.pop(key, None) or {"statement": statement, "requests": 0, "max_repeats": 0}
+            entry["requests"] += 1
+            entry["max_repeats"] = max(entry["max_repeats"], repeats)
+            self.n_plus_one[key] = entry
+            if len(self.n_plus_one) > self.max_fingerprints:
+                self.n_plus_one.popitem(last=False)
+            if self.log:
+                query_log.warning(orjson.dumps({
+                    "event": "n_plus_one", "route": route, "fingerprint": fingerprint,
+                    "statement": statement, "repeats": repeats,
+                }).decode())
+
+    def report(self, limit: int = 20, sort: str = "total_ms") -> dict:
+        """
+        Return the counters, the `limit` statement shapes ranking highest by `sort`, and the N+1 routes.
+        """
+        shapes = sorted((stats.report() for stats in self.stats.values()), key=lambda shape: shape[sort],
+                        reverse=True)
+        return {
+            "statements": self.statements,
+            "sampled": self.sampled,
+            "fingerprints": len(self.stats),
+            "evicted": self.evicted,
+            "explains": self.explains,
+            "slow_threshold_ms": round(self.slow_threshold * 1000, 3),
+            "queries": shapes[:limit],
+            "n_plus_one": [
+                {"route": route, "fingerprint": fingerprint, **entry}
+                for (route, fingerprint), entry in reversed(self.n_plus_one.items())
+            ][:limit],
+        }
+
+
+class QueryProfilerMiddleware:
+    """
+    ASGI middleware counting the statement shapes of each request for N+1 detection.
+
+    - **app**: The wrapped ASGI application.
+    - **profiler**: QueryProfiler receiving the counts.
+    """
+
+    def __init__(self, app, profiler: QueryProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        counts = {}
+        token = current_queries.set(counts)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_queries.reset(token)
+            if counts:
+                self.profiler.finish_request(f"{scope['method']} {route_template(scope)}", counts)
+
+
+def build_query_profiler(settings=None):
+    """
+    Create the query profiler configured by the settings, or None when it is disabled.
+    """
+    settings = settings or get_settings()
+    if not settings.query_profiler_enabled:
+        return None
+    return QueryProfiler(settings.query_slow_ms / 1000, settings.query_sample_rate,
+                         settings.query_explain_sample_rate, settings.query_explain_interval,
+                         settings.query_n_plus_one_threshold, settings.query_max_fingerprints,
+                         settings.query_log_enabled, settings.query_explain_analyze)
+
+
+# Process-wide profiler, created by create_app when QUERY_PROFILER_ENABLED is set
+query_profiler: QueryProfiler = None
@@ -0,0 +1,48 @@
+from fastapi import Request
+
+from app.config import Settings, get_settings
+from app.crud import upsert_users
+from app.database import Database, get_database
+from app.metrics import registry
+from app.utils.batcher import WriteBatcher
+
+# Buckets of the registration batch size histogram (users per flush)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+# Write one batch of registrations on the primary with a single statement and commit
+async def flush_registrations(users: list, database: Database = None, state=None) -> list:
+    async with (database or get_database()).session_factory() as db:
+        if state is not None:
+            db.info["app_state"] = state  # Invalidate the user cache of the app the batcher belongs to
+        return await upsert_users(db, users)
+
+
+def build_registration_batcher(settings: Settings = None, database: Database = None, state=None) -> WriteBatcher:
+    """
+    Create the write-behind batcher of POST /api/users configured by the settings.
+
+    - **database**: Database the registrations are written to (defaults to the process database).
+    - **state**: State of the app the batcher serves (`app.state`), whose user cache is invalidated.
+    """
+    settings = settings or get_settings()
+    database = database or get_database()
+    return WriteBatcher(
+        lambda users: flush_registrations(users, database, state),
+        max_size=settings.registration_batch_size,
+        max_delay=settings.registration_batch_delay,
+        max_queue=settings.registration_queue_max,
+        size_histogram=registry.histogram("registration_batch_size", "Users written per registration batch.",
+                                          BATCH_SIZE_BUCKETS),
+        latency_histogram=registry.histogram("registration_flush_seconds",
+                                             "Time to write and commit a registration batch."),
+    )
+
+
+# Process-wide batcher, used by apps whose lifespan has not run; an app's own batcher is started by its
+# lifespan into app.state.registration_batcher when REGISTRATION_BATCHING_ENABLED is set
+registration_batcher: WriteBatcher = None
+
+# Dependency to get the registration batcher of the app serving the request
+def request_registration_batcher(request: Request) -> WriteBatcher:
+    return getattr(request.app.state, "registration_batcher", registration_batcher)
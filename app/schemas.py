@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 # Base model for Quest data used for validation and serialization
@@ -15,11 +15,32 @@ class QuestCreate(QuestBase):
 class Quest(QuestBase):
     id: int  # Unique identifier for the quest
 
+# Model representing a quest search hit, inherits from Quest
+class QuestSearchResult(Quest):
+    rank: float  # Relevance of the match, higher is better
+
+# Outcome of one batch of a bulk quest insert
+class QuestBulkBatch(BaseModel):
+    index: int  # Position of the batch in the request
+    size: int  # Number of quests in the batch
+    status: str  # "committed", "pending" (atomic mode, committed with the request) or "failed"
+    elapsed_ms: float  # Time spent inserting the batch
+    ids: List[int] = []  # Ids assigned to the quests of the batch
+    error: Optional[str] = None  # Reason the batch failed
+
+# Result of a bulk quest insert
+class QuestBulkResult(BaseModel):
+    atomic: bool  # Whether the request was committed as a single transaction
+    method: str  # "insert" (multi-row INSERT ... RETURNING) or "copy" (Postgres COPY)
+    inserted: int  # Number of quests stored
+    ids: List[int]  # Ids of the stored quests in input order
+    batches: List[QuestBulkBatch]  # Per-batch outcome and timing
+
 # Base model for User data used for validation and serialization
 class UserBase(BaseModel):
     first_name: str  # User's first name
-    last_name: str  # User's last name
-    username: str  # User's username
+    last_name: Optional[str] = None  # User's last name (Telegram users may have none)
+    username: Optional[str] = None  # User's username (Telegram users may have none)
     language_code: str  # Language code for the user
     is_premium: Optional[bool] = False  # Indicates if the user has a premium account
     allows_write_to_pm: bool  # Indicates if the user allows receiving private messages
@@ -34,3 +55,19 @@ class User(UserBase):  # Inherit from UserBase to avoid duplication
 
     class Config:
         from_attributes = True  # Enable reading from attributes in Pydantic V2
+
+# Request body of a batched user lookup
+class UserLookup(BaseModel):
+    tids: List[int]  # Telegram IDs to resolve
+
+# Result of a batched user lookup
+class UserLookupResult(BaseModel):
+    users: List[User]  # Users found, in the requested order
+    missing: List[int]  # Requested Telegram IDs without a user
+
+# Result of a bulk user deletion
+class UserBulkDeleteResult(BaseModel):
+    deleted: List[int]  # Telegram IDs whose user was deleted
+    not_found: List[int]  # Telegram IDs without a user
+    chunks: int  # DELETE statements issued
+    commits: int  # Transactions committed
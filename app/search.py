@@ -0,0 +1,68 @@
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import SEARCH_CONFIG
+
+# Ranked matches, best first; the outer query applies the (rank, id) cursor
+CURSOR_FILTER = "WHERE rank < :after_rank OR (rank = :after_rank AND id > :after_id)"
+
+POSTGRES_SEARCH_QUERY = """
+SELECT id, title, description, rank FROM (
+    SELECT id, title, description,
+           ts_rank_cd(search_vector, to_tsquery('{config}', :tsquery)) + similarity(title, :q) AS rank
+    FROM quests
+    WHERE search_vector @@ to_tsquery('{config}', :tsquery) OR title % :q
+) AS hits
+{cursor_filter}
+ORDER BY rank DESC, id
+LIMIT :limit
+"""
+
+SQLITE_SEARCH_QUERY = """
+SELECT id, title, description, rank FROM (
+    SELECT quests.id, quests.title, quests.description, -bm25(quests_fts, 10.0, 1.0) AS rank
+    FROM quests_fts JOIN quests ON quests.id = quests_fts.rowid
+    WHERE quests_fts MATCH :match
+) AS hits
+{cursor_filter}
+ORDER BY rank DESC, id
+LIMIT :limit
+"""
+
+
+def search_terms(q: str) -> list:
+    """
+    Split a user query into search terms, dropping any query-syntax characters.
+    """
+    return re.findall(r"\w+", q.lower())
+
+
+async def search_quests(db: AsyncSession, q: str, limit: int = 10, after: tuple = None):
+    """
+    Return quests matching `q` as (id, title, description, rank) rows, best match first.
+
+    - **q**: The user's search text; every term must match, as a whole word or a word prefix.
+    - **limit**: Maximum number of results.
+    - **after**: (rank, id) of the last result of the previous page.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return []
+    params = {"limit": limit}
+    cursor_filter = ""
+    if after:
+        cursor_filter = CURSOR_FILTER
+        params.update(after_rank=after[0], after_id=after[1])
+
+    if db.bind.dialect.name == "postgresql":
+        # Every term as a prefix (`term:*`), plus trigram similarity on the title for typos
+        query = text(POSTGRES_SEARCH_QUERY.format(config=SEARCH_CONFIG, cursor_filter=cursor_filter))
+        params.update(tsquery=" & ".join(f"{term}:*" for term in terms), q=" ".join(terms))
+    else:
+        query = text(SQLITE_SEARCH_QUERY.format(cursor_filter=cursor_filter))
+        params.update(match=" ".join(f'"{term}"*' for term in terms))
+
+    result = await db.execute(query, params)
+    return result.all()
@@ -0,0 +1,242 @@
+# app/serve.py
+#
+# Production runner: python -m app.serve [--workers 4 --db-connections 60 --max-requests 10000]
+#
+# The parent binds the listening socket once and supervises the worker processes (uvicorn servers
+# sharing that socket). It splits the connection budget of each database between them, restarts workers
+# that exit (e.g. after --max-requests), collects their stats and drains them gracefully on SIGTERM.
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+import uvicorn
+
+from app.config import get_settings
+
+logger = logging.getLogger("app.serve")
+
+# Worker processes are started fresh (no state inherited from the parent) and receive the socket
+multiprocessing.allow_connection_pickling()
+spawn = multiprocessing.get_context("spawn")
+
+
+def pool_budget(connections: int, workers: int) -> tuple:
+    """
+    Split a database connection budget between workers; return each worker's (pool_size, max_overflow).
+
+    About two thirds of a worker's share stay open in its pool, the rest is overflow for bursts.
+    """
+    share = connections // workers
+    if share < 1:
+        raise ValueError(f"A budget of {connections} connections cannot serve {workers} workers")
+    pool_size = max(1, share * 2 // 3)
+    return pool_size, share - pool_size
+
+
+def _report_stats(stats_queue, index: int, server: uvicorn.Server, interval: float, stop: threading.Event):
+    # Worker thread: send this process's stats to the parent every `interval` seconds, and once more at exit
+    while True:
+        stopping = stop.wait(interval)
+        stats = {"worker": index, "pid": os.getpid(), "requests": server.server_state.total_requests,
+                 "connections": len(server.server_state.connections), "exiting": stopping}
+        if server.started:
+            from app.database import get_database  # Imported by the app by now
+            stats["pools"] = get_database().pool_snapshots()  # The primary's and every replica's
+        try:
+            import resource
+            stats["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except ImportError:  # Not available on Windows
+            pass
+        stats_queue.put(stats)
+        if stopping:
+            return
+
+
+def _run_worker(config_kwargs: dict, sockets: list, stats_queue, index: int, stats_interval: float):
+    # Worker process: serve the app on the inherited socket until told to stop or the request limit is hit
+    config = uvicorn.Config(**config_kwargs)
+    config.configure_logging()
+    server = uvicorn.Server(config)
+    stop = threading.Event()
+    reporter = threading.Thread(target=_report_stats, args=(stats_queue, index, server, stats_interval, stop),
+                                daemon=True)
+    reporter.start()
+    try:
+        server.run(sockets=sockets)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        reporter.join(timeout=5)
+
+
+class Supervisor:
+    """
+    Run and supervise the worker processes.
+
+    - **config_kwargs**: uvicorn.Config arguments shared by every worker.
+    - **workers**: Number of worker processes.
+    - **stats_interval**: Seconds between worker stats reports.
+    - **stats_file**: JSON file rewritten with the latest stats of every worker (optional).
+    - **graceful_timeout**: Seconds a worker gets to finish its requests on shutdown before it is killed.
+    """
+
+    def __init__(self, config_kwargs: dict, workers: int, stats_interval: float = 5.0, stats_file: str = None,
+                 graceful_timeout: float = 30.0, budget: dict = None):
+        self.config_kwargs = config_kwargs
+        self.workers = workers
+        self.stats_interval = stats_interval
+        self.stats_file = stats_file
+        self.graceful_timeout = graceful_timeout
+        self.budget = budget
+        self.stats_queue = spawn.Queue()
+        self.processes = {}  # Worker index -> Process
+        self.stats = {}  # Worker index -> latest report
+        self.peak_connections = {}  # Database name -> {worker index: most connections any of its processes had open}
+        self.retired_requests = 0  # Requests served by worker processes that have exited
+        self.restarts = 0
+        self.should_exit = threading.Event()
+        self.socket = None
+
+    def spawn_worker(self, index: int):
+        process = spawn.Process(target=_run_worker, name=f"worker-{index}",
+                                args=(self.config_kwargs, [self.socket], self.stats_queue, index, self.stats_interval))
+        process.start()
+        self.processes[index] = process
+
+    def run(self):
+        self.socket = uvicorn.Config(**self.config_kwargs).bind_socket()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame: self.should_exit.set())
+        for index in range(self.workers):
+            self.spawn_worker(index)
+        logger.info("Started %s workers on port %s", self.workers, self.port)
+
+        while not self.should_exit.is_set():
+            self.collect_stats(timeout=0.5)
+            for index, process in list(self.processes.items()):
+                if not process.is_alive() and not self.should_exit.is_set():
+                    # Exited on its own: the request limit was reached, or it crashed
+                    logger.info("Worker %s (pid %s) exited with code %s, restarting", index, process.pid, process.exitcode)
+                    process.join()
+                    self.restarts += 1
+                    self.spawn_worker(index)
+            self.write_stats()
+
+        self.shutdown()
+
+    def shutdown(self):
+        # SIGTERM makes every uvicorn worker stop accepting, finish its requests and run the lifespan shutdown
+        logger.info("Draining %s workers", len(self.processes))
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        for process in self.processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in time, killing it", process.pid)
+                process.kill()
+                process.join()
+        self.collect_stats(timeout=0.5)
+        self.write_stats()
+        self.socket.close()
+
+    @property
+    def port(self) -> int:
+        return self.socket.getsockname()[1]
+
+    def collect_stats(self, timeout: float):
+        try:
+            report = self.stats_queue.get(timeout=timeout)
+            while True:
+                index = report["worker"]
+                if report["exiting"]:
+                    self.retired_requests += report["requests"]
+                for name, pool in report.get("pools", {}).items():
+                    peaks = self.peak_connections.setdefault(name, {})
+                    peaks[index] = max(pool["peak_connections"], peaks.get(index, 0))
+                self.stats[index] = report
+                report = self.stats_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def report(self) -> dict:
+        live_requests = sum(stats["requests"] for stats in self.stats.values() if not stats["exiting"])
+        return {"port": self.port, "workers": self.workers, "restarts": self.restarts, "budget": self.budget,
+                "requests": self.retired_requests + live_requests, "peak_connections": self.peak_connections,
+                "peak_connections_total": {name: sum(peaks.values()) for name, peaks in self.peak_connections.items()},
+                "processes": {index: self.stats.get(index) for index in range(self.workers)}}
+
+    def write_stats(self):
+        if self.stats_file:
+            temporary = f"{self.stats_file}.tmp"
+            with open(temporary, "w") as file:
+                json.dump(self.report(), file)
+            os.replace(temporary, self.stats_file)  # Readers never see a half-written file
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes")
+    parser.add_argument("--host", default=settings.web_host)
+    parser.add_argument("--port", type=int, default=settings.web_port, help="0 picks a free port")
+    parser.add_argument("--workers", type=int, default=settings.web_workers)
+    parser.add_argument("--db-connections", type=int, default=settings.db_connection_budget,
+                        help="connections to each database shared by all workers (0 = profile pool per worker)")
+    parser.add_argument("--backlog", type=int, default=settings.web_backlog)
+    parser.add_argument("--keep-alive", type=int, default=settings.web_keep_alive, help="idle keep-alive seconds")
+    parser.add_argument("--graceful-timeout", type=int, default=settings.web_graceful_timeout)
+    parser.add_argument("--max-requests", type=int, default=settings.web_max_requests,
+                        help="restart a worker after this many requests (0 = never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=settings.web_max_requests_jitter)
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    parser.add_argument("--stats-file", help="JSON file kept up to date with every worker's stats")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    # Read by each worker's settings, e.g. to pick a user cache shared by all of them
+    os.environ["WEB_WORKERS"] = str(args.workers)
+
+    # Every worker has a pool per database: the primary and each read replica
+    databases = 1 + len(settings.replica_urls)
+    budget = None
+    if args.db_connections:
+        pool_size, max_overflow = pool_budget(args.db_connections, args.workers)
+        # Read by each worker's settings when it builds its engines (the same for every database)
+        os.environ["DB_POOL_SIZE"] = str(pool_size)
+        os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+        budget = {"connections": args.db_connections, "pool_size": pool_size, "max_overflow": max_overflow,
+                  "databases": databases, "total": args.db_connections * databases}
+        logger.info("Each worker gets %s pooled + %s overflow connections to each of %s database(s): "
+                    "at most %s connections per database, %s in total",
+                    pool_size, max_overflow, databases, args.db_connections, budget["total"])
+    else:
+        per_worker = settings.db_pool_size + settings.db_max_overflow
+        logger.info("No --db-connections budget: up to %s connections per database across %s workers, "
+                    "%s in total for %s database(s)", per_worker * args.workers, args.workers,
+                    per_worker * args.workers * databases, databases)
+
+    config_kwargs = {
+        "app": "main:create_app",
+        "factory": True,
+        "host": args.host,
+        "port": args.port,
+        "backlog": args.backlog,
+        "timeout_keep_alive": args.keep_alive,
+        "timeout_graceful_shutdown": args.graceful_timeout,
+        "limit_max_requests": args.max_requests or None,
+        "limit_max_requests_jitter": args.max_requests_jitter,
+    }
+    Supervisor(config_kwargs, args.workers, args.stats_interval, args.stats_file,
+               args.graceful_timeout, budget).run()
+
+
+if __name__ == "__main__":
+    main()
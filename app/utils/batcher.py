@@ -0,0 +1,113 @@
+from contextlib import suppress
+import asyncio
+import contextvars
+import time
+
+
+class BatcherFull(Exception):
+    """
+    Raised by WriteBatcher.submit when the queue already holds `max_queue` items.
+    """
+
+
+class WriteBatcher:
+    """
+    Queue items from many callers and write them in batches, resolving each caller once its batch is written.
+
+    - **flush_fn**: Async function writing a list of items and returning one result per item, in order.
+    - **max_size**: A batch is flushed as soon as it has this many items.
+    - **max_delay**: Seconds the first item of a batch waits for others before the batch is flushed anyway.
+    - **max_queue**: Items waiting beyond this are rejected with BatcherFull (backpressure).
+    - **size_histogram** / **latency_histogram**: Optional app.metrics histograms of flushed batch sizes
+      and flush durations in seconds.
+    """
+
+    def __init__(self, flush_fn, max_size: int = 200, max_delay: float = 0.01, max_queue: int = 10_000,
+                 size_histogram=None, latency_histogram=None):
+        self.flush_fn = flush_fn
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.size_histogram = size_histogram
+        self.latency_histogram = latency_histogram
+        self.flushes = 0
+        self.rejected = 0
+        self._pending = []  # (item, future) waiting for a flush
+        self._wakeup = asyncio.Event()  # Set while items are pending
+        self._full = asyncio.Event()  # Set while a full batch is pending
+        self._stopping = False
+        self._task = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        # Fresh context: flushes serve many requests, their queries belong to none of them
+        self._task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    async def stop(self):
+        """
+        Stop the background flusher after writing everything still queued.
+        """
+        # Let the flusher finish the batch in progress (cancelling it could interrupt a commit)
+        self._stopping = True
+        self._wakeup.set()
+        self._full.set()
+        if self._task:
+            await self._task
+            self._task = None
+        while self._pending:
+            await self._flush_next()
+
+    async def submit(self, item):
+        """
+        Queue `item` and return its result once the batch containing it has been written.
+        """
+        if len(self._pending) >= self.max_queue:
+            self.rejected += 1
+            raise BatcherFull(f"{len(self._pending)} items already queued")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        self._wakeup.set()
+        if len(self._pending) >= self.max_size:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if self._stopping and not self._pending:
+                return
+            if len(self._pending) < self.max_size:
+                # Give other callers up to max_delay to fill the batch
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+            await self._flush_next()
+
+    async def _flush_next(self):
+        batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+        if len(self._pending) < self.max_size and not self._stopping:
+            self._full.clear()
+        if not self._pending and not self._stopping:
+            self._wakeup.clear()
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        try:
+            results = await self.flush_fn([item for item, future in batch])
+        except Exception as exc:
+            for item, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+                    future.exception()  # Waiters re-raise it; a cancelled waiter must not leave it unretrieved
+        else:
+            for (item, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        self.flushes += 1
+        if self.size_histogram is not None:
+            self.size_histogram.observe(len(batch))
+        if self.latency_histogram is not None:
+            self.latency_histogram.observe(time.perf_counter() - start)
@@ -0,0 +1,53 @@
+import json
+
+from fastapi import HTTPException, Request
+
+# Media type of newline-delimited JSON request bodies
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def iter_json_items(request: Request):
+    """
+    Yield the items of a JSON array body, or of an NDJSON body as it streams in.
+
+    Raises an HTTPException if the body is not valid JSON.
+    """
+    if request.headers.get("content-type", "").split(";")[0].strip() == NDJSON_MEDIA_TYPE:
+        # Parse one line at a time so large uploads are never held in memory as a whole
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _loads(line)
+        if buffer.strip():
+            yield _loads(buffer)
+        return
+
+    items = _loads(await request.body())
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array")
+    for item in items:
+        yield item
+
+
+async def batched(items, size: int):
+    """
+    Group an async iterable into lists of at most `size` items.
+    """
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _loads(data: bytes):
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
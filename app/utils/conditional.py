@@ -0,0 +1,55 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request
+
+
+def catalog_etag(version: int, request: Request) -> str:
+    """
+    Build a strong ETag for a catalog response from the catalog version and the request's query.
+
+    Every page, sort and limit of the same catalog version gets its own tag.
+    """
+    query = "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+    digest = hashlib.blake2b(f"{request.url.path}?{query}".encode(), digest_size=8).hexdigest()
+    return f'"{version}-{digest}"'
+
+
+def http_date(moment: datetime) -> str:
+    # SQLite hands timezone-aware columns back as naive datetimes, which are stored in UTC
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+def catalog_headers(request: Request, version: int, updated_at: datetime, cache_control: str) -> dict:
+    """
+    Return the validator and caching headers of a catalog response.
+    """
+    headers = {"ETag": catalog_etag(version, request), "Cache-Control": cache_control}
+    if updated_at is not None:
+        headers["Last-Modified"] = http_date(updated_at)
+    return headers
+
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    """
+    Evaluate the request's If-None-Match (or, without it, If-Modified-Since) against the response headers.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # If-None-Match uses the weak comparison, so a W/ prefix added by a proxy still matches
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return headers["ETag"] in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and "Last-Modified" in headers:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return parsedate_to_datetime(headers["Last-Modified"]) <= since
+    return False
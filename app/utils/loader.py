@@ -0,0 +1,67 @@
+import asyncio
+import contextvars
+
+
+class BatchLoader:
+    """
+    Coalesce concurrent single-key lookups into batched calls (the "dataloader" pattern).
+
+    - **batch_fn**: Async function taking a list of keys and returning a dict of the values found.
+    - **max_batch_size**: A batch is dispatched at once when it reaches this many keys.
+    - **detach_context**: Run every batch in a fresh context, for loaders serving many requests. When
+      False, a batch runs in the context of the caller that started it (e.g. a loader of one session).
+
+    Keys requested during the same event loop tick are collected and resolved by one `batch_fn`
+    call; keys missing from its result resolve to None.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 500, detach_context: bool = True):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.detach_context = detach_context
+        self.batches = 0
+        self.keys = 0
+        self.largest_batch = 0
+        self._pending = {}  # key -> Future, for the batch being collected
+        self._scheduled = None  # Handle of the dispatch callback of that batch
+
+    async def load(self, key):
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._dispatch()
+            elif self._scheduled is None:
+                # Runs after every callback already queued, i.e. once the current tick's callers have asked
+                self._scheduled = asyncio.get_running_loop().call_soon(self._dispatch)
+        return await asyncio.shield(future)
+
+    def _dispatch(self):
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            # Fresh context: the batch serves many requests, its queries belong to none of them
+            context = contextvars.Context() if self.detach_context else contextvars.copy_context()
+            asyncio.get_running_loop().create_task(self._run(batch), context=context)
+
+    async def _run(self, batch: dict):
+        self.batches += 1
+        self.keys += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            values = await self.batch_fn(list(batch))
+        except Exception as exc:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(exc)
+                    future.exception()  # Waiters re-raise it; a cancelled waiter must not leave it unretrieved
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(values.get(key))
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "keys": self.keys, "largest_batch": self.largest_batch}
@@ -0,0 +1,39 @@
+import base64
+import json
+
+from fastapi import HTTPException
+
+# Sort keys supported by keyset pagination, mapped to the columns of the ordering tuple
+SORT_KEYS = {
+    "id": ("id",),
+    "title": ("title", "id"),  # id breaks ties so the ordering is total
+}
+
+# Ordering of search results (rank descending, then id)
+SEARCH_KEYS = {"search": ("rank", "id")}
+
+
+def encode_cursor(sort: str, values) -> str:
+    """
+    Encode the sort key and the last row's ordering values into an opaque cursor.
+    """
+    payload = json.dumps([sort, *values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kinds: dict = SORT_KEYS) -> tuple:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    - **kinds**: The sort keys the endpoint accepts (cursors of other endpoints are rejected).
+
+    Returns a tuple of (sort, values), raises an HTTPException if the cursor is malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        sort, *values = payload
+        if len(values) != len(kinds[sort]):
+            raise ValueError(cursor)
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return sort, tuple(values)
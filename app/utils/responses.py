@@ -0,0 +1,16 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response serialized straight to bytes with orjson.
+
+    Returning it from an endpoint skips FastAPI's response_model validation, so only use it where
+    the content already has the documented shape (plain dicts, lists, str/int/bool/None values).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
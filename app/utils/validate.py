@@ -2,9 +2,160 @@ import hmac
 import hashlib
 import urllib.parse
 import json
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterable, Optional
 from fastapi import HTTPException
 import time
 
+# Maximum age of initData before it is considered outdated (24 hours)
+DEFAULT_MAX_AGE = 86400
+
+# Default number of verified payloads kept in the cache
+DEFAULT_CACHE_SIZE = 4096
+
+
+def derive_secret_key(bot_token: str) -> bytes:
+    """
+    Derive the HMAC secret key used to sign Telegram WebApp initData.
+
+    - **bot_token**: The bot token the initData was signed for.
+
+    Returns the raw secret key bytes.
+    """
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+def build_init_data(user: dict, bot_token: str, auth_date: Optional[int] = None, **extra: str) -> str:
+    """
+    Build a signed initData string the same way Telegram does (used by tests and benchmarks).
+
+    - **user**: The user payload to embed in the `user` field.
+    - **bot_token**: The bot token used for signing.
+    - **auth_date**: Unix timestamp of the authorization, defaults to now.
+    - **extra**: Any additional fields (e.g. `query_id`, `chat_type`).
+
+    Returns the URL-encoded initData string including its `hash`.
+    """
+    fields = {"user": json.dumps(user, separators=(",", ":")), **extra}
+    fields["auth_date"] = str(auth_date if auth_date is not None else int(time.time()))
+    data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    fields["hash"] = hmac.new(derive_secret_key(bot_token), data_check_string.encode(), hashlib.sha256).hexdigest()
+    return "&".join(f"{key}={urllib.parse.quote(value, safe='')}" for key, value in fields.items())
+
+
+@dataclass(frozen=True)
+class VerifiedInitData:
+    params: dict  # Parsed initData fields ('user' URL-decoded once, as signed)
+    user: dict = field(default_factory=dict)  # Parsed user JSON payload
+    auth_date: int = 0  # Authorization timestamp from the payload
+
+
+class InitDataVerifier:
+    """
+    Verify Telegram WebApp initData with precomputed secret keys and a cache of verified payloads.
+
+    - **bot_token**: The current bot token.
+    - **previous_tokens**: Tokens still accepted during a key rotation.
+    - **max_age**: Seconds after `auth_date` during which the data stays valid.
+    - **cache_size**: Maximum number of verified payloads kept (0 disables the cache).
+    """
+
+    def __init__(self, bot_token: str, previous_tokens: Iterable[str] = (), max_age: int = DEFAULT_MAX_AGE,
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, tuple]" = OrderedDict()  # sha256 of the raw payload -> (result, expires_at)
+        self.rotate(bot_token, previous_tokens)
+
+    def rotate(self, bot_token: str, previous_tokens: Iterable[str] = ()) -> None:
+        """
+        Replace the accepted bot tokens, deriving each secret key once.
+
+        The cache is cleared so payloads signed with a dropped token are verified again.
+        """
+        self._secret_keys = [derive_secret_key(token) for token in (bot_token, *previous_tokens) if token]
+        self._cache.clear()
+
+    def verify(self, init_data_raw: str) -> VerifiedInitData:
+        """
+        Validate the initial data received from the client.
+
+        - **init_data_raw**: The raw data to verify.
+
+        Returns the verified payload, raises an HTTPException otherwise.
+        """
+        now = int(time.time())
+
+        # Short-circuit repeated verifications of the exact same payload: entries are keyed on a digest
+        # of the whole raw string, so another payload reusing a known hash never reaches them
+        cache_key = hashlib.sha256(init_data_raw.encode()).digest() if self.cache_size else None
+        cached = self._cache.get(cache_key) if self.cache_size else None
+        if cached is not None:
+            result, expires_at = cached
+            if now <= expires_at:
+                self._cache.move_to_end(cache_key)
+                return result
+            del self._cache[cache_key]  # This very payload has expired
+
+        # Parse initDataRaw into a dictionary in a single pass
+        try:
+            params = dict(x.split('=', 1) for x in init_data_raw.split('&'))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid init data format")
+        received_hash = params.get("hash", "")
+
+        # Decode the 'user' field from URL encoding (the signed value)
+        user_data_str = urllib.parse.unquote(params.get('user', ''))
+        params['user'] = user_data_str
+
+        # Create the data_check_string for HMAC validation
+        data_check_string = '\n'.join(
+            f"{key}={value}" for key, value in sorted(params.items()) if key != "hash"
+        ).encode()
+
+        # Compare the calculated hash with the provided hash for every accepted key
+        if not any(
+            hmac.compare_digest(hmac.new(key, data_check_string, hashlib.sha256).hexdigest(), received_hash)
+            for key in self._secret_keys
+        ):
+            raise HTTPException(status_code=400, detail="Invalid hash")
+
+        # Validate auth_date for outdated data
+        try:
+            auth_date = int(params["auth_date"])
+        except (KeyError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid auth_date")
+        if now - auth_date > self.max_age:
+            raise HTTPException(status_code=400, detail="Outdated data")
+
+        # Parse the user JSON; some clients encode it twice, so decode again only when needed
+        try:
+            if '%' in user_data_str:
+                user_data_str = urllib.parse.unquote(user_data_str)
+            user_data = json.loads(user_data_str) if user_data_str else {}
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid user data format")
+
+        result = VerifiedInitData(params=params, user=user_data, auth_date=auth_date)
+
+        # Remember the verified payload until its auth_date expires, evicting the least recently used
+        # (only reached once the HMAC matched)
+        if self.cache_size:
+            self._cache[cache_key] = (result, auth_date + self.max_age)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return result
+
+
+@lru_cache(maxsize=8)
+def _get_verifier(bot_token: str) -> InitDataVerifier:
+    # One verifier per token so the secret key is only derived once
+    return InitDataVerifier(bot_token, cache_size=0)
+
+
 def validate_init_data(init_data_raw: str, bot_token: str) -> dict:
     """
     Validate the initial data received from the client.
@@ -14,42 +165,4 @@ def validate_init_data(init_data_raw: str, bot_token: str) -> dict:
 
     Returns the parsed parameters if validation succeeds, raises an HTTPException otherwise.
     """
-    # Parse initDataRaw into a dictionary
-    params = dict(x.split('=', 1) for x in init_data_raw.split('&'))
-
-    # Decode the 'user' field from URL encoding
-    params['user'] = urllib.parse.unquote(params.get('user', ''))
-
-    # Extract and decode user data
-    user_data_str = params.get('user', '')
-    try:
-        user_data_str = urllib.parse.unquote(user_data_str)  # URL-decode the user data string
-        user_data = json.loads(user_data_str) if user_data_str else {}  # Parse JSON data
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid user data format")
-
-    # Create the data_check_string for HMAC validation
-    data_check_string = '\n'.join(f"{key}={value}" for key, value in sorted(params.items()) if key != "hash")
-
-    # Create the secret key with HMAC
-    secret_key = hmac.new("WebAppData".encode(), bot_token.encode(), hashlib.sha256).digest()
-
-    # Generate the HMAC hash for validation
-    calculated_hash = hmac.new(
-        key=secret_key,
-        msg=data_check_string.encode(),
-        digestmod=hashlib.sha256
-    ).hexdigest()
-
-    # Compare the calculated hash with the provided hash
-    if calculated_hash != params.get("hash", ""):
-        raise HTTPException(status_code=400, detail="Invalid hash")
-    
-    # Uncomment if needed to validate auth_date for outdated data
-    current_time = int(time.time())
-    if current_time - int(params["auth_date"]) > 86400:  # Check if it's older than 24 hours
-        raise HTTPException(status_code=400, detail="Outdated data")
-    
-    # Everyting is good otherwise!
-
-    return params
+    return _get_verifier(bot_token).verify(init_data_raw).params
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.crud import get_catalog_version, get_quests, select_user_by_tID, select_users_by_tIDs
+from app.database import Database, _pool_stat, get_database
+
+logger = logging.getLogger(__name__)
+
+
+# Run the read queries of the hot routes once, so the connection has them prepared (asyncpg caches
+# prepared statements and type introspection per connection, SQLAlchemy its compiled SQL per engine).
+# Writes are left out: priming them would need a transaction that writes.
+async def run_hot_queries(db):
+    await select_user_by_tID(db, 0)
+    await select_users_by_tIDs(db, [0])
+    await get_quests(db, 0, 10)
+    await get_quests(db, 0, 10, "id", (0,))
+    await get_catalog_version(db)
+
+
+async def warm_up_engine(engine: AsyncEngine, connections: int) -> dict:
+    """
+    Open up to `connections` connections of the engine's pool at once and run the hot queries on each.
+
+    The number is capped at the pool size: overflow connections would be closed when returned.
+    Returns the number of connections warmed and the time it took in milliseconds.
+    """
+    size = _pool_stat(engine.sync_engine.pool, "size")
+    connections = min(connections, size) if size else 1  # Pools without a size hold a single connection
+    start = time.perf_counter()
+    sessions = [AsyncSession(bind=engine) for _ in range(connections)]
+    try:
+        # Hold them all together, a connection returned early would be handed out again
+        await asyncio.gather(*(session.connection() for session in sessions))
+        await asyncio.gather(*(run_hot_queries(session) for session in sessions))
+    finally:
+        for session in sessions:
+            await session.close()
+    return {"connections": connections, "ms": round((time.perf_counter() - start) * 1000, 3)}
+
+
+async def warm_up(connections: int, database: Database = None) -> dict:
+    """
+    Warm the primary's and every replica's pool; a database that cannot be warmed is logged and skipped.
+
+    - **database**: Database to warm (defaults to the process database).
+
+    Returns {engine name: warm_up_engine result}.
+    """
+    replica_router = (database or get_database()).replica_router
+    report = {}
+    for engine in (replica_router.primary, *replica_router.replicas):
+        name = replica_router.names[engine]
+        try:
+            report[name] = await warm_up_engine(engine, connections)
+        except Exception:
+            logger.exception("Warming up the %s database failed, its connections open on first use", name)
+    logger.info("Database warm-up: %s", report)
+    return report
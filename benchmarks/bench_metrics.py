@@ -0,0 +1,65 @@
+# benchmarks/bench_metrics.py
+#
+# Measure the overhead of the metrics middleware and SQL instrumentation on POST /api/users.
+# Run from the project root: python -m benchmarks.bench_metrics
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from benchmarks.common import use_database, create_schema
+
+
+async def run(args):
+    use_database(args.database_url)
+    os.environ.setdefault("BOT_TOKEN", "123456:benchmark-token")
+    await create_schema()
+
+    import httpx
+    from main import app
+    from app.metrics import registry
+    from app.utils.validate import build_init_data
+
+    payloads = [
+        {"initDataRaw": build_init_data({"id": 10_000 + i, "first_name": "Bench", "last_name": "User",
+                                         "username": f"bench{i}", "language_code": "en", "is_premium": False,
+                                         "allows_write_to_pm": True}, os.environ["BOT_TOKEN"])}
+        for i in range(args.users)
+    ]
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one_round() -> float:
+            start = time.perf_counter()
+            for payload in payloads:
+                response = await client.post("/api/users", json=payload)
+                assert response.status_code == 200
+            return (time.perf_counter() - start) / len(payloads)
+
+        await one_round()  # Register the users and warm up
+        per_request = {True: [], False: []}
+        for _ in range(args.rounds):
+            # Alternate so drift (cache warm-up, WAL growth) affects both modes equally
+            for enabled in (False, True):
+                registry.enabled = enabled
+                per_request[enabled].append(await one_round())
+
+    off, on = statistics.median(per_request[False]), statistics.median(per_request[True])
+    overhead = (on - off) / off * 100
+    print(f"POST /api/users: {off * 1e6:.0f} us without metrics, {on * 1e6:.0f} us with metrics "
+          f"({overhead:+.2f}%)")
+    print(json.dumps({"without_metrics_us": off * 1e6, "with_metrics_us": on * 1e6, "overhead_pct": overhead}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark metrics middleware overhead")
+    parser.add_argument("--database-url", help="database to use (defaults to a temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
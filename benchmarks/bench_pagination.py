@@ -0,0 +1,63 @@
+# benchmarks/bench_pagination.py
+#
+# Compare offset vs keyset latency for a deep page of GET /api/quests.
+# Run from the project root: python -m benchmarks.bench_pagination [--quests 1000000]
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from benchmarks.common import use_database, create_schema, seed_quests
+
+
+async def run(args):
+    use_database(args.database_url)
+    engine = await create_schema()
+    await seed_quests(engine, args.quests)
+
+    from app.database import AsyncSessionLocal
+    from app.crud import get_quests
+    from app.utils.pagination import SORT_KEYS
+
+    skip = (args.page - 1) * args.page_size
+    results = {}
+    for sort in ("id", "title"):
+        async with AsyncSessionLocal() as db:
+            # Ordering values of the last quest on the previous page, as carried by the cursor
+            previous = await get_quests(db, skip - 1, 1, sort)
+            after = tuple(getattr(previous[0], name) for name in SORT_KEYS[sort])
+
+            timings = {"offset": [], "keyset": []}
+            for _ in range(args.repeat):
+                for mode in timings:
+                    start = time.perf_counter()
+                    if mode == "offset":
+                        page = await get_quests(db, skip, args.page_size, sort)
+                    else:
+                        page = await get_quests(db, 0, args.page_size, sort, after)
+                    timings[mode].append((time.perf_counter() - start) * 1000)
+                    db.expunge_all()
+            assert len(page) == args.page_size
+
+        results[sort] = {mode: round(statistics.median(samples), 3) for mode, samples in timings.items()}
+        print(f"sort={sort:<6} page {args.page}: offset {results[sort]['offset']:.2f} ms, "
+              f"keyset {results[sort]['keyset']:.2f} ms (median of {args.repeat})")
+
+    await engine.dispose()
+    print(json.dumps({"quests": args.quests, "page": args.page, "page_size": args.page_size, "median_ms": results}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offset vs keyset pagination")
+    parser.add_argument("--database-url", help="database to seed (defaults to a temporary SQLite file)")
+    parser.add_argument("--quests", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
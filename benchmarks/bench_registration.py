@@ -0,0 +1,108 @@
+# benchmarks/bench_registration.py
+#
+# Registration burst: many first-time users hitting POST /api/users at once, with and without
+# write-behind batching.
+# Run from the project root: python -m benchmarks.bench_registration [--users 5000 --concurrency 500]
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.common import use_database, create_schema, percentile
+from benchmarks.loadtest import synthetic_user
+
+
+async def burst(client, payloads: list, concurrency: int) -> list:
+    # Send every payload with at most `concurrency` requests in flight, returning the latencies in ms
+    latencies, errors = [], 0
+    next_payload = iter(payloads)
+
+    async def worker():
+        nonlocal errors
+        for payload in next_payload:
+            start = time.perf_counter()
+            response = await client.post("/api/users", json=payload)
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += response.status_code != 200
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    assert not errors, f"{errors} failed registrations"
+    return latencies
+
+
+async def run(args):
+    use_database(args.database_url)
+    os.environ.setdefault("BOT_TOKEN", "123456:bench-token")
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_POOL_TIMEOUT"] = "120"  # Unbatched requests queue for connections; measure, do not fail
+    engine = await create_schema()
+
+    import httpx
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    from app import registration
+    from app.config import get_settings
+    from app.utils.validate import build_init_data
+    from main import app
+
+    commits = 0
+
+    def count_commit(session):
+        nonlocal commits
+        commits += 1
+
+    event.listen(Session, "after_commit", count_commit)
+
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 limits=httpx.Limits(max_connections=None)) as client:
+        for index, mode in enumerate(("unbatched", "batched")):
+            # Fresh users for every mode, so each registration is a first login
+            payloads = [{"initDataRaw": build_init_data(synthetic_user(index * args.users + i), os.environ["BOT_TOKEN"])}
+                        for i in range(args.users)]
+            if mode == "batched":
+                settings = get_settings().model_copy(update={"registration_batch_size": args.batch_size,
+                                                             "registration_batch_delay": args.batch_delay})
+                registration.registration_batcher = registration.build_registration_batcher(settings)
+                registration.registration_batcher.start()
+
+            commits = 0
+            start = time.perf_counter()
+            latencies = await burst(client, payloads, args.concurrency)
+            elapsed = time.perf_counter() - start
+
+            if mode == "batched":
+                await registration.registration_batcher.stop()
+                registration.registration_batcher = None
+            results[mode] = {
+                "registrations_per_s": round(args.users / elapsed, 1),
+                "commits": commits,
+                "commits_per_s": round(commits / elapsed, 1),
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+            }
+            print(f"{mode:<10} {results[mode]['registrations_per_s']:>8.1f} reg/s  {commits:>6} commits "
+                  f"({results[mode]['commits_per_s']:.1f}/s)  p50 {results[mode]['p50_ms']:.1f} ms  "
+                  f"p99 {results[mode]['p99_ms']:.1f} ms")
+
+    await engine.dispose()
+    print(json.dumps({"users": args.users, "concurrency": args.concurrency, "batch_size": args.batch_size,
+                      "results": results}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a registration burst with and without batching")
+    parser.add_argument("--database-url", help="database to use (defaults to a temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, default=5, help="SQLite has a single writer, raise it for Postgres")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--batch-delay", type=float, default=0.01)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# benchmarks/bench_search.py
+#
+# Measure GET /api/quests/search query latency over a large catalog.
+# Run from the project root: python -m benchmarks.bench_search [--quests 1000000]
+
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import use_database, create_schema, seed_quests, percentile
+
+# Queries of increasing selectivity against the seeded vocabulary
+QUERIES = ("dragon", "drag", "storm castle", "ember relic 4242", "frost river 99999")
+
+
+async def run(args):
+    use_database(args.database_url)
+    engine = await create_schema()
+    await seed_quests(engine, args.quests)
+
+    from app.database import AsyncSessionLocal
+    from app.search import search_quests
+
+    results = {}
+    async with AsyncSessionLocal() as db:
+        for q in QUERIES:
+            timings, after = [], None
+            for i in range(args.repeat):
+                start = time.perf_counter()
+                rows = await search_quests(db, q, args.limit, after)
+                timings.append((time.perf_counter() - start) * 1000)
+                # Alternate between the first page and the page after it
+                after = (rows[-1].rank, rows[-1].id) if rows and i % 2 == 0 else None
+            results[q] = {"p50": round(percentile(timings, 50), 3), "p95": round(percentile(timings, 95), 3)}
+            print(f"q={q!r:<22} p50 {results[q]['p50']:.2f} ms  p95 {results[q]['p95']:.2f} ms")
+
+    await engine.dispose()
+    print(json.dumps({"quests": args.quests, "limit": args.limit, "latency_ms": results}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full-text quest search")
+    parser.add_argument("--database-url", help="database to seed (defaults to a temporary SQLite file)")
+    parser.add_argument("--quests", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/bench_serialization.py
+#
+# Per-request CPU time of 100-item quest pages: ORM entities + response_model validation (before)
+# vs column rows serialized straight to bytes (after).
+# Run from the project root: python -m benchmarks.bench_serialization
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+from benchmarks.common import use_database, create_schema, seed_quests
+
+
+async def run(args):
+    use_database(args.database_url)
+    engine = await create_schema()
+    await seed_quests(engine, args.quests)
+
+    import httpx
+    from fastapi import Depends, FastAPI
+    from sqlalchemy import select
+    from main import app
+    from app.database import get_read_db
+    from app.models import Quest as QuestModel
+    from app.schemas import Quest
+
+    # The previous read path: ORM entities re-validated through response_model
+    legacy = FastAPI()
+
+    @legacy.get("/api/quests/", response_model=List[Quest])
+    async def legacy_read_quests(db=Depends(get_read_db), skip: int = 0, limit: int = 10):
+        result = await db.execute(select(QuestModel).order_by(QuestModel.id).offset(skip).limit(limit))
+        return result.scalars().all()
+
+    results = {}
+    for label, target in (("before", legacy), ("after", app)):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=target), base_url="http://bench") as client:
+            cpu = []
+            for i in range(args.requests):
+                params = {"skip": (i * args.page_size) % max(1, args.quests - args.page_size), "limit": args.page_size}
+                start = time.process_time()
+                response = await client.get("/api/quests/", params=params)
+                cpu.append((time.process_time() - start) * 1e6)
+                assert len(response.json()) == args.page_size
+        # The first requests include warm-up (statement compilation, caches)
+        results[label] = round(statistics.median(cpu[args.requests // 10:]), 1)
+        print(f"{label:<7} {results[label]:>8.0f} us CPU per {args.page_size}-item page (median)")
+
+    await engine.dispose()
+    print(json.dumps({"page_size": args.page_size, "cpu_us_per_request": results,
+                      "speedup": round(results["before"] / results["after"], 2)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quest page serialization")
+    parser.add_argument("--database-url", help="database to use (defaults to a temporary SQLite file)")
+    parser.add_argument("--quests", type=int, default=10_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
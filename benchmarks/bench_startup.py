@@ -0,0 +1,99 @@
+# benchmarks/bench_startup.py
+#
+# Cold start: import time, time to the first served request and first-request latency of the hot
+# routes, with and without the lifespan warm-up. Every run is a fresh interpreter.
+# Run from the project root: python -m benchmarks.bench_startup [--runs 5 --warmup-connections 10]
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import use_database, create_schema, seed_quests
+
+
+async def first_requests(spawned_at: float) -> dict:
+    # Child process: import, build and start the app, then time the first request of each hot route
+    start = time.perf_counter()
+    import main
+    import_ms = (time.perf_counter() - start) * 1000
+
+    import httpx
+    from app.utils.validate import build_init_data
+    from benchmarks.loadtest import synthetic_user
+
+    start = time.perf_counter()
+    app = main.create_app()
+    create_ms = (time.perf_counter() - start) * 1000
+
+    login = {"initDataRaw": build_init_data(synthetic_user(0), os.environ["BOT_TOKEN"])}
+    requests = [
+        ("GET /api/quests/", lambda client: client.get("/api/quests/")),
+        ("POST /api/users", lambda client: client.post("/api/users", json=login)),
+        ("GET /api/users", lambda client: client.get("/api/users", params={"tids": "5000000000"})),
+    ]
+    result = {"import_ms": import_ms, "create_app_ms": create_ms}
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        result["startup_ms"] = (time.perf_counter() - start) * 1000
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for name, send in requests:
+                for attempt in ("first", "second"):
+                    request_start = time.perf_counter()
+                    response = await send(client)
+                    result[f"{name} {attempt}_ms"] = (time.perf_counter() - request_start) * 1000
+                    assert response.status_code == 200, (name, response.status_code, response.text)
+                    if "time_to_first_request_ms" not in result:
+                        # From the parent spawning the interpreter to the first response
+                        result["time_to_first_request_ms"] = (time.time() - spawned_at) * 1000
+    return result
+
+
+def run_child(warmup_connections: int) -> dict:
+    env = {**os.environ, "DB_WARMUP_CONNECTIONS": str(warmup_connections)}
+    spawned_at = time.time()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", str(spawned_at)],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+async def prepare(args):
+    use_database(args.database_url)
+    os.environ.setdefault("BOT_TOKEN", "123456:bench-token")
+    os.environ["USER_CACHE_ENABLED"] = "false"  # Every first request reaches the database
+    engine = await create_schema()
+    await seed_quests(engine, args.quests)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold start with and without the pool warm-up")
+    parser.add_argument("--database-url", help="database to use (defaults to a temporary SQLite file)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per mode")
+    parser.add_argument("--quests", type=int, default=1000)
+    parser.add_argument("--warmup-connections", type=int, default=10)
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)  # Spawn time, set by the parent
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(asyncio.run(first_requests(args.child))))
+        return
+
+    asyncio.run(prepare(args))
+    results = {}
+    for mode, connections in (("cold", 0), ("warmed", args.warmup_connections)):
+        runs = [run_child(connections) for _ in range(args.runs)]
+        results[mode] = {name: round(statistics.median(run[name] for run in runs), 2) for name in runs[0]}
+        print(f"{mode:<7} " + "  ".join(f"{name} {value:.1f}" for name, value in results[mode].items()))
+    print(json.dumps({"runs": args.runs, "warmup_connections": args.warmup_connections,
+                      "median_ms": results}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_user_lookup.py
+#
+# Compare resolving 500 users one query at a time with the batched lookups.
+# Run from the project root: python -m benchmarks.bench_user_lookup [--users 100000 --lookups 500]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+
+from benchmarks.common import use_database, create_schema
+
+
+async def run(args):
+    use_database(args.database_url)
+    os.environ["USER_CACHE_ENABLED"] = "false"  # Measure the queries, not the cache
+    engine = await create_schema()
+
+    from app.crud import get_user_by_tID, get_users_by_tIDs, select_user_by_tID
+    from app.database import AsyncSessionLocal
+    from app.models import User
+
+    async with engine.begin() as conn:
+        for offset in range(0, args.users, 10000):
+            await conn.execute(User.__table__.insert(), [
+                {"tID": 1_000_000 + n, "first_name": f"User{n}", "last_name": "Bench", "username": f"user{n}",
+                 "language_code": "en", "is_premium": False, "allows_write_to_pm": True}
+                for n in range(offset, min(offset + 10000, args.users))
+            ])
+    tids = [1_000_000 + n for n in random.Random(7).sample(range(args.users), args.lookups)]
+
+    async def individual(db):
+        return [await select_user_by_tID(db, tID) for tID in tids]
+
+    async def coalesced(db):
+        # Concurrent get_user_by_tID calls, merged by the batching loader
+        return await asyncio.gather(*(get_user_by_tID(db, tID) for tID in tids))
+
+    async def batched(db):
+        return await get_users_by_tIDs(db, tids)
+
+    results = {}
+    for name, lookup in (("individual", individual), ("coalesced", coalesced), ("batched", batched)):
+        timings = []
+        for _ in range(args.repeat):
+            async with AsyncSessionLocal() as db:
+                start = time.perf_counter()
+                found = await lookup(db)
+                timings.append((time.perf_counter() - start) * 1000)
+            assert len(found) == args.lookups
+        results[name] = round(statistics.median(timings), 3)
+        print(f"{name:<11} {results[name]:8.2f} ms for {args.lookups} users (median of {args.repeat})")
+
+    await engine.dispose()
+    print(json.dumps({"users": args.users, "lookups": args.lookups, "median_ms": results,
+                      "speedup_batched": round(results["individual"] / results["batched"], 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark individual vs batched user lookups")
+    parser.add_argument("--database-url", help="database to seed (defaults to a temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/bench_validate.py
+#
+# Micro-benchmark for initData verification.
+# Run from the project root: python -m benchmarks.bench_validate
+
+import argparse
+import hashlib
+import hmac
+import json
+import time
+import urllib.parse
+
+from app.utils.validate import InitDataVerifier, build_init_data
+
+BOT_TOKEN = "123456:benchmark-token"
+USER = {"id": 99281932, "first_name": "Andrew", "last_name": "Rogue", "username": "rogue",
+        "language_code": "en", "is_premium": True, "allows_write_to_pm": True}
+
+
+def legacy_validate_init_data(init_data_raw: str, bot_token: str) -> dict:
+    # Previous implementation (validate_init_data + json.loads in the route), kept for comparison
+    params = dict(x.split('=', 1) for x in init_data_raw.split('&'))
+    params['user'] = urllib.parse.unquote(params.get('user', ''))
+    user_data = json.loads(urllib.parse.unquote(params['user']))
+    data_check_string = '\n'.join(f"{key}={value}" for key, value in sorted(params.items()) if key != "hash")
+    secret_key = hmac.new("WebAppData".encode(), bot_token.encode(), hashlib.sha256).digest()
+    calculated_hash = hmac.new(key=secret_key, msg=data_check_string.encode(), digestmod=hashlib.sha256).hexdigest()
+    if calculated_hash != params.get("hash", ""):
+        raise ValueError("Invalid hash")
+    if int(time.time()) - int(params["auth_date"]) > 86400:
+        raise ValueError("Outdated data")
+    json.loads(params['user'])  # The route parsed the user blob a second time
+    return user_data
+
+
+def measure(label: str, fn, payloads, rounds: int) -> float:
+    # Run fn over all payloads `rounds` times and report verifications/sec
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for payload in payloads:
+            fn(payload)
+    elapsed = time.perf_counter() - start
+    rate = rounds * len(payloads) / elapsed
+    print(f"{label:<32} {rate:>12,.0f} verifications/sec")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark initData verification")
+    parser.add_argument("--users", type=int, default=1000, help="distinct initData payloads")
+    parser.add_argument("--rounds", type=int, default=20, help="times each payload is re-sent")
+    args = parser.parse_args()
+
+    payloads = [build_init_data({**USER, "id": USER["id"] + i}, BOT_TOKEN, query_id=f"AAH{i}")
+                for i in range(args.users)]
+
+    before = measure("legacy", lambda p: legacy_validate_init_data(p, BOT_TOKEN), payloads, args.rounds)
+    cold = InitDataVerifier(BOT_TOKEN, cache_size=0)
+    after_cold = measure("verifier (no cache)", cold.verify, payloads, args.rounds)
+    warm = InitDataVerifier(BOT_TOKEN, cache_size=args.users)
+    after_warm = measure("verifier (cached repeats)", warm.verify, payloads, args.rounds)
+
+    print(json.dumps({"legacy": before, "verifier": after_cold, "verifier_cached": after_warm,
+                      "speedup_cached": after_warm / before}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# benchmarks/common.py
+#
+# Shared helpers for benchmarks that need a database.
+
+import os
+import random
+import tempfile
+import time
+
+
+def use_database(database_url: str = None) -> str:
+    """
+    Point the application at the benchmark database; must run before importing app.database.
+
+    Defaults to a throwaway SQLite file so benchmarks never touch the database from .env.
+    """
+    url = database_url or f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("DB_PROFILE", "prod")  # Measure with production engine settings (no echo)
+    return url
+
+
+async def create_schema():
+    # Recreate all tables on the benchmark database
+    from app.database import engine, Base
+    import app.models  # noqa: F401  Register the models on Base.metadata
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+async def seed_quests(engine, count: int, batch_size: int = 20000, seed: int = 42):
+    # Insert `count` quests in multi-row batches, printing progress
+    from app.models import Quest
+
+    rng = random.Random(seed)
+    words = ["dragon", "forest", "castle", "river", "shadow", "crystal", "storm", "ember", "frost", "relic"]
+    start = time.perf_counter()
+    async with engine.begin() as conn:
+        for offset in range(0, count, batch_size):
+            rows = [
+                {"title": f"{rng.choice(words).title()} {rng.choice(words)} {n}",
+                 "description": " ".join(rng.choices(words, k=12))}
+                for n in range(offset, min(offset + batch_size, count))
+            ]
+            await conn.execute(Quest.__table__.insert(), rows)
+    print(f"seeded {count:,} quests in {time.perf_counter() - start:.1f}s")
+
+
+def percentile(samples, pct: float) -> float:
+    # Nearest-rank percentile of a list of samples
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
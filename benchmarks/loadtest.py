@@ -0,0 +1,157 @@
+# benchmarks/loadtest.py
+#
+# Reproducible load test of the API, running the app in-process against a local stand-in database.
+#
+#   python -m benchmarks.loadtest --concurrency 50 --requests 2000 --output results.json
+#   python -m benchmarks.loadtest --baseline benchmarks/baseline.json --threshold 15
+#
+# With --baseline the run fails (exit code 1) when a scenario's throughput drops, or its p95/p99
+# latency grows, by more than --threshold percent.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+from benchmarks.common import use_database, create_schema, percentile
+
+# Scenarios in the order they run; each one is a function of the scenario index i
+SCENARIOS = ("register_user", "create_quest", "list_quests", "delete_user")
+
+
+def synthetic_user(i: int) -> dict:
+    # Deterministic Telegram user payload for the i-th synthetic user
+    return {"id": 5_000_000_000 + i, "first_name": f"Load{i}", "last_name": "Tester", "username": f"load{i}",
+            "language_code": ("en", "uk", "de", "es")[i % 4], "is_premium": i % 5 == 0,
+            "allows_write_to_pm": True}
+
+
+async def run_scenario(client, name: str, requests: int, concurrency: int, payloads: list) -> dict:
+    """
+    Issue `requests` calls of one scenario with at most `concurrency` in flight and summarize them.
+    """
+    latencies, errors = [], 0
+    next_index = iter(range(requests))
+
+    async def call(i: int):
+        if name == "register_user":
+            return await client.post("/api/users", json=payloads[i])
+        if name == "create_quest":
+            return await client.post("/api/quests/", json={"title": f"Load quest {i}", "description": "Generated"})
+        if name == "list_quests":
+            return await client.get("/api/quests/", params={"skip": (i * 10) % 1000, "limit": 10})
+        return await client.delete(f"/api/users/{synthetic_user(i)['id']}")
+
+    async def worker():
+        nonlocal errors
+        for i in next_index:
+            start = time.perf_counter()
+            response = await call(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3),
+        },
+    }
+
+
+async def run(args) -> dict:
+    use_database(args.database_url)
+    os.environ.setdefault("BOT_TOKEN", "123456:loadtest-token")
+    await create_schema()
+
+    import httpx
+    from main import app
+    from app.utils.validate import build_init_data
+
+    # Validly signed initData for every synthetic user, built with the same algorithm the API verifies
+    payloads = [{"initDataRaw": build_init_data(synthetic_user(i), os.environ["BOT_TOKEN"])}
+                for i in range(args.requests)]
+
+    results = {}
+    limits = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                                 limits=limits) as client:
+        for name in args.scenarios:
+            results[name] = await run_scenario(client, name, args.requests, args.concurrency, payloads)
+            summary = results[name]
+            print(f"{name:<14} {summary['throughput_rps']:>9.1f} req/s  p50 {summary['latency_ms']['p50']:.1f} ms  "
+                  f"p95 {summary['latency_ms']['p95']:.1f} ms  p99 {summary['latency_ms']['p99']:.1f} ms  "
+                  f"errors {summary['errors']}", file=sys.stderr)
+
+    return {
+        "config": {"requests": args.requests, "concurrency": args.concurrency,
+                   "database": "sqlite" if args.database_url is None else args.database_url.split(":")[0]},
+        "environment": {"python": platform.python_version(), "machine": platform.machine()},
+        "scenarios": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """
+    Return a description of every regression beyond `threshold` percent against the baseline.
+    """
+    regressions = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        drop = (previous["throughput_rps"] - current["throughput_rps"]) / previous["throughput_rps"] * 100
+        if drop > threshold:
+            regressions.append(f"{name}: throughput down {drop:.1f}% "
+                               f"({previous['throughput_rps']} -> {current['throughput_rps']} req/s)")
+        for key in ("p95", "p99"):
+            before, after = previous["latency_ms"][key], current["latency_ms"][key]
+            if before and (after - before) / before * 100 > threshold:
+                regressions.append(f"{name}: {key} up {(after - before) / before * 100:.1f}% ({before} -> {after} ms)")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors up ({previous['errors']} -> {current['errors']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API in-process")
+    parser.add_argument("--database-url", help="database to use (defaults to a temporary SQLite file)")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight at a time")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", help="write the JSON report to this file (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold}% against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
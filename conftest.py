@@ -0,0 +1,30 @@
+# conftest.py
+
+import os
+import tempfile
+
+import pytest_asyncio
+
+# Always run the tests against a throwaway database, never the one configured in .env.
+# Set TEST_DATABASE_URL to use a dedicated Postgres database instead of the SQLite stand-in.
+os.environ["DATABASE_URL"] = os.getenv(
+    "TEST_DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+)
+os.environ["DB_PROFILE"] = "test"
+os.environ.setdefault("BOT_TOKEN", "123456:test-token")
+
+
+@pytest_asyncio.fixture
+async def db_engine():
+    """
+    Provide the application engine with freshly created tables.
+    """
+    from app.database import engine, Base
+    import app.models  # noqa: F401  Register the models on Base.metadata
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    # Pooled connections are bound to this test's event loop
+    await engine.dispose()
@@ -1,23 +1,144 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager, suppress
+import asyncio
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api.user_routes import router as usesr_router
+from app.api.user_routes import router as usesr_router, build_init_data_verifier
 from app.api.quest_routes import router as quest_router
+from app.api.internal_routes import router as internal_router
+from app.api.metrics_routes import router as metrics_router
+from app import admission, profiler
+from app.admission import build_admission_controller
+from app.catalog import QuestCatalog, MemoryBroker, PostgresBroker
+from app.config import Settings, get_settings
+from app.cache import build_user_cache
+from app.registration import build_registration_batcher
+from app.database import Database, ReplicaRouter, get_database
+from app.metrics import MetricsMiddleware, instrument_engine, registry
+from app.warmup import warm_up
+
+# Periodically ping the read replicas so failed ones leave and recovered ones rejoin the rotation
+async def check_replicas_periodically(replica_router: ReplicaRouter, interval: float):
+    while True:
+        await replica_router.check_health()
+        await asyncio.sleep(interval)
+
+# Build the lifespan handler of an app configured with the given settings and database
+def build_lifespan(settings: Settings, database: Database):
+    # Warm up and start the background tasks on startup; stop them and dispose of the engines on
+    # shutdown so pooled connections are closed cleanly
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        engine, pool_monitor, replica_router = database.engine, database.pool_monitor, database.replica_router
+        if settings.db_warmup_connections:
+            # Connect the pools and prepare the hot queries before the first request arrives
+            app.state.warmup = await warm_up(settings.db_warmup_connections, database)
+        # Everything below lives in app.state, so apps built with different settings stay independent
+        if settings.bot_token:
+            # Derive the initData secret key now rather than on the first login
+            app.state.init_data_verifier = build_init_data_verifier(settings)
+        app.state.user_cache = build_user_cache(settings)
+        health_task = None
+        if replica_router.replicas:
+            health_task = asyncio.create_task(
+                check_replicas_periodically(replica_router, settings.db_replica_health_interval))
+        app.state.quest_catalog = None
+        if settings.catalog_snapshot_enabled:
+            # Load the quest catalog into memory; Postgres notifies every worker of changes, other
+            # databases only have this process's own writes and the periodic version check
+            app.state.quest_catalog = QuestCatalog(database.session_factory, settings.catalog_check_interval,
+                                                   settings.catalog_max_rows)
+            broker = PostgresBroker(engine) if engine.dialect.driver == "asyncpg" else MemoryBroker()
+            await app.state.quest_catalog.start(broker)
+        app.state.registration_batcher = None
+        if settings.registration_batching_enabled:
+            app.state.registration_batcher = build_registration_batcher(settings, database, app.state)
+            app.state.registration_batcher.start()
+        # Size the /api concurrency limit from the primary's pool waits
+        app.state.admission_controller = build_admission_controller(settings)
+        if app.state.admission_controller:
+            pool_monitor.wait_listeners.append(app.state.admission_controller.limit.observe)
+        yield
+        if app.state.admission_controller:
+            pool_monitor.wait_listeners.remove(app.state.admission_controller.limit.observe)
+            app.state.admission_controller = None
+        if app.state.registration_batcher:
+            # Write the registrations still queued before the engine goes away
+            await app.state.registration_batcher.stop()
+            app.state.registration_batcher = None
+        if app.state.quest_catalog:
+            await app.state.quest_catalog.stop()
+            app.state.quest_catalog = None
+        if health_task:
+            health_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await health_task
+        app.state.user_cache = None
+        await database.dispose()
+
+    return lifespan
+
+def create_app(settings: Settings = None) -> FastAPI:
+    """
+    Build the FastAPI application.
+
+    - **settings**: Settings of the app (defaults to the process settings). The engines, pools and
+      replica router are those of `get_database(settings)`, shared by apps with the same database settings.
+
+    Nothing connects to the database until the app's lifespan starts or a request arrives.
+    """
+    settings = settings or get_settings()
+    database = get_database(settings)
+
+    # Create an instance of the FastAPI application; routes get their settings and sessions from app.state
+    app = FastAPI(lifespan=build_lifespan(settings, database))
+    app.state.settings = settings
+    app.state.database = database
+
+    # Add CORS (Cross-Origin Resource Sharing) middleware to allow requests from the specified origins
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Specify the frontend origin allowed to make requests to the backend
+        allow_credentials=True,  # Allow cookies and credentials to be included in requests
+        allow_methods=["*"],  # Allow all HTTP methods (GET, POST, PUT, DELETE, etc.)
+        allow_headers=["*"],  # Allow all headers in requests
+        expose_headers=["X-Next-Cursor", "X-Total-Count"],  # Let the frontend read the pagination headers
+    )
+
+    # Fingerprint every statement, capture plans of slow ones and flag N+1 requests (one profiler per process)
+    if settings.query_profiler_enabled:
+        profiler.query_profiler = profiler.query_profiler or profiler.build_query_profiler(settings)
+        for profiled_engine in (database.engine, *database.replica_router.replicas):
+            profiler.query_profiler.instrument(profiled_engine)
+        app.add_middleware(profiler.QueryProfilerMiddleware, profiler=profiler.query_profiler)
+
+    # Record per-route latency, status codes and DB time for every request (outermost middleware)
+    registry.enabled = settings.metrics_enabled
+    for instrumented_engine in (database.engine, *database.replica_router.replicas):
+        instrument_engine(instrumented_engine)
+    app.add_middleware(MetricsMiddleware, metrics=registry, server_timing=settings.server_timing_enabled)
+
+    # Include the user routes from the user_routes module under the /api prefix with the tag "users"
+    # (/api requests go through admission control, see app/admission.py)
+    app.include_router(usesr_router, prefix="/api", tags=["users"], dependencies=[Depends(admission.admit)])
+
+    # Include the quest routes from the quest_routes module under the /api prefix with the tag "quests"
+    app.include_router(quest_router, prefix="/api", tags=["quests"], dependencies=[Depends(admission.admit)])
 
-# Create an instance of the FastAPI application
-app = FastAPI()
+    # Include the internal routes (pool telemetry, ...) under the /internal prefix with the tag "internal"
+    app.include_router(internal_router, prefix="/internal", tags=["internal"])
 
-# Add CORS (Cross-Origin Resource Sharing) middleware to allow requests from the specified origins
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Specify the frontend origin allowed to make requests to the backend
-    allow_credentials=True,  # Allow cookies and credentials to be included in requests
-    allow_methods=["*"],  # Allow all HTTP methods (GET, POST, PUT, DELETE, etc.)
-    allow_headers=["*"],  # Allow all headers in requests
-)
+    # Include the Prometheus metrics endpoint at /metrics
+    app.include_router(metrics_router, tags=["internal"])
 
-# Include the user routes from the user_routes module under the /api prefix with the tag "users"
-app.include_router(usesr_router, prefix="/api", tags=["users"])
+    return app
 
-# Include the quest routes from the quest_routes module under the /api prefix with the tag "quests"
-app.include_router(quest_router, prefix="/api", tags=["quests"])  # Include quest routes
+# `main.app` (uvicorn main:app, the tests) is built on first access rather than at import;
+# `uvicorn --factory main:create_app` builds it explicitly
+def __getattr__(name):
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,27 +1,328 @@
+# scripts/seed.py
+#
+# Synthetic data generator: python -m scripts.seed --users 10000000 --quests 100000 --workers 4
+#
+# Applies the schema with the Alembic migrations, then streams generated users and quests into the
+# database one batch at a time (COPY on Postgres, multi-row INSERT elsewhere) from parallel worker
+# processes. The data is a pure function of --seed and --batch-size: rerunning with the same values
+# loads the same rows whatever the number of workers.
+
+import argparse
 import asyncio
-from sqlalchemy.future import select
-from sqlalchemy import insert
-from app.database import engine, Base, AsyncSessionLocal
-from app.models import Quest
-
-async def seed_db():
-    # Example data to seed
-    quests_data = [
-        {"title": "First Quest", "description": "Complete your first challenge."},
-        {"title": "Second Quest", "description": "Explore the application."},
-    ]
-
-    # Create tables
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
-    # Insert data into the "quests" table
-    async with AsyncSessionLocal() as session:
-        async with session.begin():
-            for quest_data in quests_data:
-                query = insert(Quest).values(**quest_data)
-                await session.execute(query)
-            await session.commit()
+import functools
+import itertools
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy import column, table as table_clause, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+# The app modules are imported where needed: app.database reads DATABASE_URL, which main() may set
+
+# Names by language code
+FIRST_NAMES = {
+    "en": ["James", "Olivia", "Liam", "Emma", "Noah", "Ava", "Ethan", "Mia", "Lucas", "Grace", "Jack", "Chloe"],
+    "ru": ["Алексей", "Мария", "Дмитрий", "Анна", "Иван", "Елена", "Сергей", "Ольга", "Никита", "Дарья"],
+    "uk": ["Олександр", "Оксана", "Андрій", "Ірина", "Богдан", "Наталія", "Тарас", "Юлія"],
+    "es": ["Mateo", "Lucía", "Santiago", "Sofía", "Diego", "Valentina", "Javier", "Camila"],
+    "pt": ["João", "Ana", "Pedro", "Beatriz", "Gabriel", "Larissa", "Rafael", "Mariana"],
+    "de": ["Lukas", "Hannah", "Felix", "Lea", "Jonas", "Marie", "Paul", "Lena"],
+    "tr": ["Mehmet", "Ayşe", "Mustafa", "Zeynep", "Emre", "Elif", "Burak", "Merve"],
+    "id": ["Budi", "Siti", "Agus", "Dewi", "Rizki", "Putri", "Andi", "Ayu"],
+    "fa": ["Ali", "Zahra", "Reza", "Fatemeh", "Hossein", "Maryam", "Amir", "Sara"],
+}
+LAST_NAMES = {
+    "en": ["Smith", "Johnson", "Brown", "Taylor", "Wilson", "Davies", "Clark", "Walker", "Hall", "Young"],
+    "ru": ["Иванов", "Смирнова", "Кузнецов", "Попова", "Соколов", "Лебедева", "Козлов", "Новикова"],
+    "uk": ["Шевченко", "Коваленко", "Бондаренко", "Ткаченко", "Кравченко", "Мельник"],
+    "es": ["García", "Martínez", "López", "Sánchez", "Pérez", "Gómez", "Fernández"],
+    "pt": ["Silva", "Santos", "Oliveira", "Souza", "Costa", "Pereira", "Almeida"],
+    "de": ["Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Wagner", "Becker"],
+    "tr": ["Yılmaz", "Kaya", "Demir", "Şahin", "Çelik", "Yıldız", "Aydın"],
+    "id": ["Santoso", "Wijaya", "Saputra", "Hidayat", "Kusuma", "Pratama"],
+    "fa": ["Ahmadi", "Hosseini", "Karimi", "Rezaei", "Moradi", "Jafari"],
+}
+HANDLES = ["wolf", "pixel", "nova", "shadow", "lucky", "ninja", "coder", "star", "tiger", "ghost", "sunny", "rider"]
+
+# Share of users per language code (Telegram's audience is far from English-only)
+LANGUAGES = {"en": 30, "ru": 22, "es": 10, "pt": 9, "uk": 7, "id": 7, "tr": 6, "de": 5, "fa": 4}
+LANGUAGE_CODES = list(LANGUAGES)
+LANGUAGE_WEIGHTS = list(itertools.accumulate(LANGUAGES.values()))
+
+QUEST_ADJECTIVES = ["Hidden", "Ancient", "Daily", "Frozen", "Golden", "Lost", "Silent", "Burning", "Secret", "Grand"]
+QUEST_NOUNS = ["dragon", "forest", "castle", "river", "shadow", "crystal", "storm", "ember", "relic", "harbor",
+               "tower", "garden", "market", "library", "summit"]
+QUEST_VERBS = ["Find", "Explore", "Defend", "Collect", "Deliver", "Escort", "Map", "Repair", "Invite", "Visit"]
+
+# Telegram IDs: the i-th user gets TID_BASE + (i * TID_STRIDE + offset) % TID_SPACE. TID_STRIDE is a prime
+# that does not divide TID_SPACE, so the mapping is a bijection: unique, scattered bigint IDs, no lookups
+TID_BASE = 100_000_000
+TID_SPACE = 9_000_000_000
+TID_STRIDE = 6_700_417
+
+# Columns loaded into each table, in the order of the generated tuples (ids come from the sequences)
+USER_COLUMNS = ["tID", "first_name", "last_name", "username", "language_code", "is_premium", "allows_write_to_pm"]
+QUEST_COLUMNS = ["title", "description"]
+
+
+def user_tID(index: int, seed: int) -> int:
+    # Telegram ID of the index-th generated user
+    return TID_BASE + (index * TID_STRIDE + tID_offset(seed)) % TID_SPACE
+
+
+@functools.lru_cache
+def tID_offset(seed: int) -> int:
+    return random.Random(f"{seed}:tID").randrange(TID_SPACE)
+
+
+def generate_users(start: int, count: int, seed: int, premium_ratio: float = 0.05) -> list:
+    """
+    Generate users start .. start + count - 1 as tuples of USER_COLUMNS.
+
+    The same (start, count, seed) always produces the same rows.
+    """
+    rng = random.Random(f"{seed}:users:{start}")
+    offset = tID_offset(seed)
+    languages = rng.choices(LANGUAGE_CODES, cum_weights=LANGUAGE_WEIGHTS, k=count)
+    rows = []
+    for index, language in zip(range(start, start + count), languages):
+        last_names = LAST_NAMES[language]
+        rows.append((
+            TID_BASE + (index * TID_STRIDE + offset) % TID_SPACE,
+            rng.choice(FIRST_NAMES[language]),
+            last_names[rng.randrange(len(last_names))] if rng.random() < 0.6 else None,
+            f"{HANDLES[rng.randrange(len(HANDLES))]}_{index}" if rng.random() < 0.7 else None,
+            language,
+            rng.random() < premium_ratio,
+            rng.random() < 0.9,
+        ))
+    return rows
+
+
+def generate_quests(start: int, count: int, seed: int) -> list:
+    """
+    Generate quests start .. start + count - 1 as tuples of QUEST_COLUMNS.
+    """
+    rng = random.Random(f"{seed}:quests:{start}")
+    rows = []
+    for index in range(start, start + count):
+        noun = rng.choice(QUEST_NOUNS)
+        title = f"{rng.choice(QUEST_ADJECTIVES)} {noun} #{index}"
+        steps = rng.randint(2, 5)
+        description = " then ".join(f"{rng.choice(QUEST_VERBS).lower()} the {rng.choice(QUEST_NOUNS)}"
+                                    for _ in range(steps))
+        rows.append((title, f"{description.capitalize()}. Reward: {rng.randint(1, 100) * 10} points."))
+    return rows
+
+
+def worker_chunks(total: int, batch_size: int, worker: int, workers: int):
+    # The (start, count) batches of a table handled by one worker: batches are dealt round-robin
+    for start in range(worker * batch_size, total, workers * batch_size):
+        yield start, min(batch_size, total - start)
+
+
+async def load_rows(connection, table: str, columns: list, rows: list):
+    # Write one batch: COPY from the in-memory rows on asyncpg, an executemany INSERT elsewhere
+    if connection.dialect.driver == "asyncpg":
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(table, records=rows, columns=columns)
+    else:
+        target = table_clause(table, *(column(name) for name in columns))
+        await connection.execute(target.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+async def load(database_url: str, totals: dict, seed: int, batch_size: int, premium_ratio: float,
+               worker: int = 0, workers: int = 1, report=None):
+    """
+    Load one worker's share of the generated rows, committing batch by batch.
+
+    - **totals**: Rows to generate per table, e.g. {"users": 1000000, "quests": 10000}.
+    - **report**: Called with (table, rows) after every committed batch.
+
+    Only one batch is held in memory at a time.
+    """
+    generators = {
+        "users": (USER_COLUMNS, functools.partial(generate_users, premium_ratio=premium_ratio)),
+        "quests": (QUEST_COLUMNS, generate_quests),
+    }
+    engine = create_async_engine(database_url, poolclass=NullPool)
+    try:
+        async with engine.connect() as connection:
+            for table, total in totals.items():
+                columns, generate = generators[table]
+                for start, count in worker_chunks(total, batch_size, worker, workers):
+                    rows = generate(start, count, seed)
+                    async with connection.begin():
+                        await load_rows(connection, table, columns, rows)
+                    if report:
+                        report(table, count)
+    finally:
+        await engine.dispose()
+
+
+def _run_worker(database_url: str, totals: dict, seed: int, batch_size: int, premium_ratio: float,
+                worker: int, workers: int, progress_queue):
+    # Worker process: load its batches and send the progress to the parent
+    asyncio.run(load(database_url, totals, seed, batch_size, premium_ratio, worker, workers,
+                     lambda table, rows: progress_queue.put((table, rows))))
+
+
+class Progress:
+    """
+    Print the rows loaded per table, the rate and the time left, at most once per `interval` seconds.
+    """
+
+    def __init__(self, totals: dict, interval: float = 1.0):
+        self.totals = totals
+        self.interval = interval
+        self.loaded = dict.fromkeys(totals, 0)
+        self.started = time.perf_counter()
+        self.printed = 0.0
+
+    def update(self, table: str, rows: int):
+        self.loaded[table] += rows
+        if time.perf_counter() - self.printed >= self.interval:
+            self.print()
+
+    def print(self):
+        self.printed = time.perf_counter()
+        elapsed = self.printed - self.started
+        done, total = sum(self.loaded.values()), sum(self.totals.values())
+        rate = done / elapsed if elapsed else 0
+        eta = (total - done) / rate if rate else 0
+        tables = ", ".join(f"{table} {self.loaded[table]:,}/{self.totals[table]:,}" for table in self.totals)
+        print(f"{tables} | {rate:,.0f} rows/s | {elapsed:.0f}s elapsed, ~{eta:.0f}s left", flush=True)
+
+
+def apply_schema(mode: str, database_url: str):
+    # Bring the schema up to date before loading: the Alembic migrations, or create_all from the models
+    if mode == "migrate":
+        from alembic import command
+        from alembic.config import Config
+        root = Path(__file__).resolve().parent.parent
+        config = Config(str(root / "alembic.ini"))
+        config.set_main_option("script_location", str(root / "alembic"))
+        command.upgrade(config, "head")  # alembic/env.py reads DATABASE_URL, set by main()
+    elif mode == "create-all":
+        asyncio.run(create_tables(database_url))
+
+
+async def create_tables(database_url: str):
+    # Create the tables from the models (for databases the migrations do not support)
+    from app.database import Base
+    import app.models  # noqa: F401  Register the models on Base.metadata
+
+    engine = create_async_engine(database_url, poolclass=NullPool)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+async def truncate(database_url: str, tables: list):
+    # Empty the tables to be seeded (and restart their ids on Postgres)
+    engine = create_async_engine(database_url, poolclass=NullPool)
+    async with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            await connection.execute(text(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY"))
+        else:
+            for table in tables:
+                await connection.execute(text(f"DELETE FROM {table}"))
+    await engine.dispose()
+
+
+async def finish(database_url: str, tables: list):
+    """
+    Announce the new quests to the catalog snapshots and refresh the planner statistics of the seeded tables.
+    """
+    from app.crud import bump_catalog_version
+
+    engine = create_async_engine(database_url, poolclass=NullPool)
+    try:
+        if "quests" in tables:
+            async with AsyncSession(engine) as db:
+                await bump_catalog_version(db)
+                await db.commit()
+        async with engine.connect() as connection:
+            await connection.execution_options(isolation_level="AUTOCOMMIT")
+            for table in tables:
+                await connection.execute(text(f"ANALYZE {table}"))
+    finally:
+        await engine.dispose()
+
+
+def seed_database(database_url: str, totals: dict, seed: int = 42, batch_size: int = 10000, workers: int = 1,
+                  premium_ratio: float = 0.05, progress: Progress = None):
+    """
+    Load the generated rows with `workers` processes (in this process when there is only one).
+
+    Raises RuntimeError if a worker fails; the batches it committed stay in the database.
+    """
+    progress = progress or Progress(totals)
+    if workers == 1:
+        asyncio.run(load(database_url, totals, seed, batch_size, premium_ratio, report=progress.update))
+    else:
+        spawn = multiprocessing.get_context("spawn")
+        progress_queue = spawn.Queue()
+        processes = [
+            spawn.Process(target=_run_worker, name=f"seed-{worker}",
+                          args=(database_url, totals, seed, batch_size, premium_ratio, worker, workers, progress_queue))
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        while any(process.is_alive() for process in processes) or not progress_queue.empty():
+            try:
+                progress.update(*progress_queue.get(timeout=0.5))
+            except queue.Empty:
+                pass
+        failed = [process.name for process in processes if process.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"Seeding failed in {', '.join(failed)}")
+    progress.print()
+
+
+def main():
+    from app.config import get_settings
+
+    parser = argparse.ArgumentParser(description="Fill the database with generated users and quests")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--quests", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42, help="the same seed and batch size load the same rows")
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows per COPY/INSERT and per commit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--premium-ratio", type=float, default=0.05, help="share of Telegram Premium users")
+    parser.add_argument("--database-url", help="defaults to DATABASE_URL")
+    parser.add_argument("--schema", choices=["migrate", "create-all", "none"], default="migrate",
+                        help="apply the Alembic migrations (default), create the tables from the models, or neither")
+    parser.add_argument("--truncate", action="store_true", help="empty the users and quests tables first")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url  # Read by Alembic and the worker processes
+    database_url = args.database_url or get_settings().database_url
+    workers = args.workers
+    if database_url.startswith("sqlite") and workers > 1:
+        print("SQLite has a single writer; loading with one worker", flush=True)
+        workers = 1
+
+    totals = {table: total for table, total in (("users", args.users), ("quests", args.quests)) if total > 0}
+    apply_schema(args.schema, database_url)
+    if args.truncate:
+        asyncio.run(truncate(database_url, ["users", "quests"]))
+    started = time.perf_counter()
+    try:
+        seed_database(database_url, totals, args.seed, args.batch_size, workers, args.premium_ratio)
+    except RuntimeError as error:
+        sys.exit(str(error))
+    asyncio.run(finish(database_url, list(totals)))
+    print(f"Seeded {sum(totals.values()):,} rows in {time.perf_counter() - started:.1f}s", flush=True)
+
 
 if __name__ == "__main__":
-    asyncio.run(seed_db())
+    main()
@@ -0,0 +1,145 @@
+# test_admission.py
+
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import Request
+
+from app.admission import AdaptiveLimit, AdmissionController, TokenBuckets
+from app.database import client_key, get_db, open_session, pool_monitor
+from app.utils.validate import build_init_data
+from main import app
+
+USER = {"first_name": "Andrew", "last_name": "Rogue", "username": "rogue",
+        "language_code": "en", "is_premium": False, "allows_write_to_pm": True}
+
+
+@pytest_asyncio.fixture
+async def client(db_engine):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def install_controller(monkeypatch):
+    # Install a controller the way the lifespan does, fed with the primary's pool waits
+    def install(controller):
+        monkeypatch.setattr("app.admission.admission_controller", controller)
+        monkeypatch.setattr(pool_monitor, "wait_listeners", [controller.limit.observe])
+        return controller
+    return install
+
+
+@pytest.fixture
+def slow_db():
+    # Slowed database stand-in: every request holds its pooled connection like a slow query would
+    async def slow_get_db(request: Request):
+        async with await open_session(client_key(request)) as db:
+            await asyncio.sleep(0.2)
+            yield db
+
+    app.dependency_overrides[get_db] = slow_get_db
+    yield
+    app.dependency_overrides.pop(get_db, None)
+
+
+def p99(latencies: list) -> float:
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+
+
+async def overload(client, rate: float, duration: float):
+    # Open-loop load: requests keep arriving at `rate` per second however slow the responses are
+    async def one(n):
+        start = time.perf_counter()
+        response = await client.post("/api/quests/", json={"title": f"Quest {n}", "description": "Load"})
+        return response, time.perf_counter() - start
+
+    tasks = []
+    for n in range(int(rate * duration)):
+        tasks.append(asyncio.create_task(one(n)))
+        await asyncio.sleep(1 / rate)
+    return await asyncio.gather(*tasks)
+
+
+def test_limit_shrinks_on_slow_waits_and_grows_back():
+    limit = AdaptiveLimit(initial=40, min_limit=5, max_limit=100, target_wait=0.0)
+    limit.observe(1.0)
+    assert int(limit.limit) == 28  # Multiplicative decrease
+    for _ in range(100):
+        limit.observe(1.0)
+    assert limit.limit >= 5
+
+    limit = AdaptiveLimit(initial=10, min_limit=5, max_limit=100, target_wait=0.05)
+    limit.in_flight = 10
+    for _ in range(10):
+        limit.observe(0.001)
+    assert 10.9 < limit.limit < 11  # Additive increase, about +1 per limit's worth of waits
+
+    limit.in_flight = 0
+    limit.observe(0.001)
+    assert limit.limit < 11  # An idle limit does not grow
+
+
+def test_token_buckets_refill_per_key():
+    buckets = TokenBuckets(rate=10, burst=2)
+    assert buckets.take(1) == 0 and buckets.take(1) == 0
+    assert 0 < buckets.take(1) <= 0.1
+    assert buckets.take(2) == 0  # Other users are unaffected
+    time.sleep(0.11)
+    assert buckets.take(1) == 0
+    assert buckets.limited == 1
+
+
+@pytest.mark.asyncio
+async def test_login_rate_limited_per_user(client, install_controller):
+    install_controller(AdmissionController(AdaptiveLimit(), user_buckets=TokenBuckets(rate=0.01, burst=2)))
+    init_data = {"initDataRaw": build_init_data({**USER, "id": 7001}, os.environ["BOT_TOKEN"])}
+    assert [(await client.post("/api/users", json=init_data)).status_code for _ in range(2)] == [200, 200]
+
+    response = await client.post("/api/users", json=init_data)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 1
+
+    other = {"initDataRaw": build_init_data({**USER, "id": 7002}, os.environ["BOT_TOKEN"])}
+    assert (await client.post("/api/users", json=other)).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_route_limit_sheds_with_retry_after(client, install_controller, slow_db):
+    controller = install_controller(AdmissionController(AdaptiveLimit(), {"POST /api/quests/": 2}, retry_after=3))
+    responses = await asyncio.gather(*(
+        client.post("/api/quests/", json={"title": f"Quest {n}", "description": "Capped"}) for n in range(6)
+    ))
+    assert sorted(response.status_code for response in responses) == [200, 200, 503, 503, 503, 503]
+    assert {response.headers.get("Retry-After") for response in responses if response.status_code == 503} == {"3"}
+    assert (await client.get("/api/quests/")).status_code == 200  # Other routes only share the global limit
+
+    report = (await client.get("/internal/admission")).json()
+    assert report["routes"]["POST /api/quests/"] == {"limit": 2, "in_flight": 0, "shed": 4}
+    assert report["in_flight"] == 0
+    assert controller.admitted == 3
+
+
+@pytest.mark.asyncio
+async def test_admitted_latency_stays_bounded_under_overload(client, install_controller, slow_db):
+    # 15 connections held 0.2 s each serve 75 requests/s; offer twice that for two seconds
+    baseline = await overload(client, rate=150, duration=2)
+    assert all(response.status_code == 200 for response, latency in baseline)
+    unlimited_p99 = p99([latency for response, latency in baseline])
+
+    controller = install_controller(AdmissionController(
+        AdaptiveLimit(initial=100, min_limit=5, max_limit=100, target_wait=0.05)
+    ))
+    results = await overload(client, rate=150, duration=2)
+    admitted = [latency for response, latency in results if response.status_code == 200]
+    shed = [response for response, latency in results if response.status_code == 503]
+
+    assert shed and all(response.headers["Retry-After"] == "1" for response in shed)
+    assert len(admitted) >= 75  # Still serving about the pool's capacity
+    assert controller.limit.limit < 100  # The limit adapted to the pool
+    assert p99(admitted) < 1.0 < unlimited_p99
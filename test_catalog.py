@@ -0,0 +1,105 @@
+# test_catalog.py
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import event
+
+import app.catalog
+from app.catalog import QuestCatalog, MemoryBroker
+from app.crud import count_quests, get_quests
+from app.database import AsyncSessionLocal
+from main import app as fastapi_app
+
+
+@pytest_asyncio.fixture
+async def client(db_engine):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fastapi_app), base_url="http://test") as client:
+        yield client
+
+
+@pytest_asyncio.fixture
+async def workers(db_engine, monkeypatch):
+    # Two workers' catalogs sharing a broker; the first one serves the app under test
+    broker = MemoryBroker()
+    catalogs = [QuestCatalog(AsyncSessionLocal, check_interval=3600) for _ in range(2)]
+    for catalog in catalogs:
+        await catalog.start(broker)
+    monkeypatch.setattr(app.catalog, "quest_catalog", catalogs[0])
+    yield catalogs
+    for catalog in catalogs:
+        await catalog.stop()
+
+
+async def settle(catalog):
+    # Wait for a background reload to finish
+    if catalog._reload_task:
+        await catalog._reload_task
+
+
+@pytest.mark.asyncio
+async def test_snapshot_pages_match_the_database(client):
+    for n in range(25):
+        await client.post("/api/quests/", json={"title": f"Quest {n}", "description": "Snapshot"})
+    catalog = QuestCatalog(AsyncSessionLocal)
+    await catalog.reload()
+    snapshot = catalog.snapshot
+
+    async with AsyncSessionLocal() as db:
+        assert snapshot.page(5, 10) == list(await get_quests(db, 5, 10))
+        assert snapshot.page(0, 10, after_id=20) == list(await get_quests(db, 0, 10, "id", (20,)))
+        assert len(snapshot) == await count_quests(db)  # X-Total-Count agrees with or without a snapshot
+    assert snapshot.page(100, 10) == []
+    assert len(snapshot) == 25
+    assert snapshot.nbytes > 0
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate_every_worker(client, workers, db_engine):
+    serving, other = workers
+    await client.post("/api/quests/", json={"title": "First", "description": "Snapshot"})
+    await settle(serving)
+    await settle(other)
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = await client.get("/api/quests/")
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", listener)
+    assert [quest["title"] for quest in response.json()] == ["First"]
+    assert statements == []  # Served from memory
+
+    # A write drops both snapshots at once and both reload the new version
+    version = other.loaded_version
+    await client.post("/api/quests/", json={"title": "Second", "description": "Snapshot"})
+    response = await client.get("/api/quests/")  # Never the stale snapshot, the database until reloaded
+    assert [quest["title"] for quest in response.json()] == ["First", "Second"]
+
+    await settle(serving)
+    await settle(other)
+    assert other.loaded_version > version
+    assert [row.title for row in other.snapshot.page(0, 10)] == ["First", "Second"]
+    assert other.notifications >= 1
+
+    report = (await client.get("/internal/catalog")).json()
+    assert report["enabled"] and report["ready"]
+    assert report["rows"] == 2
+    assert report["version"] == report["latest_version"]
+    assert report["bytes"] > 0
+
+
+@pytest.mark.asyncio
+async def test_version_check_catches_missed_notifications(client):
+    catalog = QuestCatalog(AsyncSessionLocal)
+    await catalog.start(broker=None)  # No notifications reach this worker
+    try:
+        await client.post("/api/quests/", json={"title": "Unannounced", "description": "Snapshot"})
+        assert catalog.snapshot.page(0, 10) == []  # Stale until the next check
+
+        await catalog.check_version()
+        await settle(catalog)
+        assert [row.title for row in catalog.snapshot.page(0, 10)] == ["Unannounced"]
+    finally:
+        await catalog.stop()
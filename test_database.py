@@ -0,0 +1,228 @@
+# test_database.py
+
+import os
+import subprocess
+import sys
+import tempfile
+
+import httpx
+import pytest
+import pytest_asyncio
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import Settings, get_settings
+from app.database import Base, ReplicaRouter, engine_options, get_database, open_read_session
+from app.models import Quest
+from main import app as fastapi_app, create_app
+
+
+def test_profiles_fill_unset_engine_options():
+    prod = Settings(database_url="postgresql+asyncpg://u:p@db/app", db_profile="prod", db_pool_size=3)
+    options = engine_options(prod)
+    assert options["echo"] is False
+    assert options["pool_size"] == 3  # Explicit settings win over the profile
+    assert options["max_overflow"] == 5
+    assert options["connect_args"]["prepared_statement_cache_size"] == 500
+
+    test = Settings(_env_file=None, database_url=None, db_profile="test")
+    assert test.database_url.startswith("sqlite+aiosqlite")
+    assert "connect_args" not in engine_options(test)
+
+    memory = Settings(database_url="sqlite+aiosqlite://", db_profile="dev")
+    assert "pool_size" not in engine_options(memory)  # Static pool cannot be sized
+
+
+@pytest.mark.asyncio
+async def test_pool_endpoint_reports_usage(db_engine):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fastapi_app), base_url="http://test") as client:
+        await client.get("/api/quests/")
+        stats = (await client.get("/internal/pool")).json()
+
+    assert stats["pool"] == "AsyncAdaptedQueuePool"
+    assert stats["checked_out"] == 0
+    assert stats["idle"] >= 1
+    assert stats["wait_ms"]["count"] >= 1
+
+
+async def make_replica(name: str, titles=()):
+    # A separate SQLite database standing in for a read replica
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/{name}.db")
+    async with replica.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for title in titles:
+            await conn.execute(Quest.__table__.insert().values(title=title, description=name))
+    return replica
+
+
+@pytest_asyncio.fixture
+async def replicas(db_engine, monkeypatch):
+    engines = [await make_replica("replica-a", ["From replica"]), await make_replica("replica-b", ["From replica"])]
+    router = ReplicaRouter(db_engine, engines, read_your_writes=60)
+    monkeypatch.setattr(get_database(), "replica_router", router)
+    yield router
+    await router.dispose()
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replicas_round_robin(replicas):
+    served = []
+    for _ in range(4):
+        async with await open_read_session() as session:
+            served.append(session.info["engine"])
+    assert served == ["replica-0", "replica-1", "replica-0", "replica-1"]
+
+    replicas.strategy = "least_busy"
+    async with await open_read_session() as held:
+        await held.connection()
+        async with await open_read_session() as session:
+            assert session.info["engine"] != held.info["engine"]
+
+
+@pytest.mark.asyncio
+async def test_read_your_writes_window(replicas):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fastapi_app), base_url="http://test") as client:
+        writer, reader = {"X-Client-Id": "writer"}, {"X-Client-Id": "reader"}
+        assert [q["title"] for q in (await client.get("/api/quests/", headers=writer)).json()] == ["From replica"]
+
+        await client.post("/api/quests/", json={"title": "Fresh", "description": "primary"}, headers=writer)
+
+        # The writer now reads from the primary and sees its quest; other clients still use replicas
+        assert [q["title"] for q in (await client.get("/api/quests/", headers=writer)).json()] == ["Fresh"]
+        assert [q["title"] for q in (await client.get("/api/quests/", headers=reader)).json()] == ["From replica"]
+
+
+@pytest.mark.asyncio
+async def test_failing_replica_falls_back(replicas):
+    directory = os.path.join(tempfile.mkdtemp(), "not-created-yet")
+    broken = create_async_engine(f"sqlite+aiosqlite:///{directory}/replica.db")
+    replicas.replicas = [broken]
+    replicas.names[broken] = "replica-broken"
+
+    async with await open_read_session() as session:
+        assert session.info["engine"] == "primary"
+    assert replicas.healthy_replicas() == []
+
+    # A health check puts the replica back into rotation once it answers again
+    os.makedirs(directory)
+    await replicas.check_health()
+    assert replicas.healthy_replicas() == [broken]
+    await broken.dispose()
+
+
+@pytest.mark.asyncio
+async def test_lifespan_warms_the_pool_before_serving(db_engine):
+    warm_app = create_app(get_settings().model_copy(update={"db_warmup_connections": 3}))
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        async with warm_app.router.lifespan_context(warm_app):
+            assert warm_app.state.warmup["primary"]["connections"] == 3
+            assert db_engine.sync_engine.pool.checkedin() == 3  # Connected, idle and ready
+            assert sum("catalog_versions" in statement for statement in statements) == 3  # Primed on each
+
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=warm_app), base_url="http://test") as client:
+                assert (await client.get("/api/quests/")).status_code == 200
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", listener)
+    assert db_engine.sync_engine.pool.checkedin() == 0  # Disposed on shutdown
+
+
+@pytest.mark.asyncio
+async def test_apps_use_the_database_of_their_settings(db_engine, tmp_path):
+    other_app = create_app(get_settings().model_copy(update={"database_url": f"sqlite+aiosqlite:///{tmp_path}/other.db"}))
+    other = other_app.state.database
+    assert other is not fastapi_app.state.database
+    assert create_app(get_settings()).state.database is fastapi_app.state.database  # Same settings, same engines
+    async with other.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(Quest.__table__.insert().values(title="Other", description="other"))
+
+    async with other_app.router.lifespan_context(other_app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=other_app), base_url="http://test") as client:
+            assert [q["title"] for q in (await client.get("/api/quests/")).json()] == ["Other"]
+            assert (await client.get("/internal/pool")).json()["checkouts"] >= 1
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fastapi_app), base_url="http://test") as client:
+            assert (await client.get("/api/quests/")).json() == []
+    assert other.engine.sync_engine.pool.checkedin() == 0  # Disposed by the app's lifespan
+
+
+@pytest.mark.asyncio
+async def test_apps_keep_their_own_state(db_engine):
+    # Two apps on one database with different settings: each lifespan builds its own cache, limits, ...
+    cached = create_app(get_settings().model_copy(update={"user_cache_enabled": True, "user_lookup_max_ids": 2}))
+    plain = create_app(get_settings().model_copy(update={"catalog_cache_control": "max-age=60"}))
+    async with cached.router.lifespan_context(cached), plain.router.lifespan_context(plain):
+        assert cached.state.user_cache is not None and plain.state.user_cache is None
+        assert cached.state.init_data_verifier is not plain.state.init_data_verifier
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=cached), base_url="http://test") as client:
+            assert (await client.get("/api/users?tids=1,2,3")).status_code == 422
+            await client.get("/api/users?tids=1,2")
+            assert (await client.get("/internal/user-cache")).json()["misses"] == 2
+            assert (await client.get("/api/quests/")).headers["Cache-Control"] == "no-cache"
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=plain), base_url="http://test") as client:
+            assert (await client.get("/api/users?tids=1,2,3")).status_code == 200
+            assert (await client.get("/internal/user-cache")).json() == {"enabled": False}
+            assert (await client.get("/api/quests/")).headers["Cache-Control"] == "max-age=60"
+
+
+def test_importing_the_app_builds_no_engine():
+    # Engines, pools and caches are created by create_app, not as a side effect of importing
+    code = "import main, app.database, app.cache; assert not app.database._databases and app.cache.user_cache is None"
+    environment = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+    subprocess.run([sys.executable, "-c", code], env={**environment, "DB_PROFILE": "prod"}, check=True)
+
+
+def test_migrations_build_and_remove_the_schema(tmp_path):
+    # An empty database: a throwaway SQLite file, or the Postgres database in TEST_MIGRATION_DATABASE_URL
+    database_url = os.getenv("TEST_MIGRATION_DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path}/migrated.db")
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", database_url)
+    sync_url = database_url.replace("+aiosqlite", "").replace("+asyncpg", "+psycopg")
+
+    command.upgrade(config, "head")
+    engine = create_engine(sync_url)
+    try:
+        with engine.connect() as connection:
+            tables = set(inspect(connection).get_table_names())
+            assert {"users", "quests", "catalog_versions", "row_counts", "alembic_version"} <= tables
+            tID = next(column for column in inspect(connection).get_columns("users") if column["name"] == "tID")
+            assert "BIGINT" in str(tID["type"]).upper()
+            assert tID["nullable"]  # As in the model, on every dialect
+            version, updated_at = connection.execute(
+                text("SELECT version, updated_at FROM catalog_versions WHERE name = 'quests'")).one()
+            assert version == 1 and updated_at is not None
+
+            # The triggers created by the migrations keep the quest count
+            connection.execute(text("INSERT INTO quests (title, description) VALUES ('Migrated', 'Counted')"))
+            assert connection.execute(text("SELECT count FROM row_counts WHERE name = 'quests'")).scalar() == 1
+            connection.rollback()
+
+        command.downgrade(config, "base")
+        with engine.connect() as connection:
+            assert set(inspect(connection).get_table_names()) <= {"alembic_version"}
+    finally:
+        engine.dispose()
+
+
+def test_migrations_keep_tables_created_before_them(tmp_path):
+    # A database whose tables were created with create_all while the migrations were still empty
+    database_url = f"sqlite+aiosqlite:///{tmp_path}/legacy.db"
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", database_url)
+    engine = create_engine(database_url.replace("+aiosqlite", ""))
+    try:
+        with engine.begin() as connection:
+            connection.execute(text('CREATE TABLE users (id INTEGER PRIMARY KEY, "tID" INTEGER, username VARCHAR)'))
+            connection.execute(text("CREATE TABLE quests (id INTEGER PRIMARY KEY, title VARCHAR, description VARCHAR)"))
+            connection.execute(text('INSERT INTO users ("tID", username) VALUES (42, \'kept\')'))
+        command.stamp(config, "dfb2a01958f0")
+
+        command.upgrade(config, "4b8e2f6a9c31")
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT username FROM users WHERE \"tID\" = 42")).scalar() == "kept"
+    finally:
+        engine.dispose()
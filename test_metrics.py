@@ -0,0 +1,33 @@
+# test_metrics.py
+
+import httpx
+import pytest
+
+from app.metrics import Histogram, registry
+from main import app
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in [0.005] * 50 + [0.05] * 45 + [0.5] * 5:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) <= 0.01
+    assert 0.01 < histogram.quantile(0.95) <= 0.1
+    assert 0.1 < histogram.quantile(0.99) <= 1.0
+
+
+@pytest.mark.asyncio
+async def test_requests_are_instrumented(db_engine):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/quests/", json={"title": "Timed", "description": "Quest"})
+        assert 'desc="2 queries"' in response.headers["Server-Timing"]  # Insert + catalog version bump
+
+        await client.get("/api/quests/", params={"cursor": "broken"})
+        metrics = (await client.get("/metrics")).text
+
+    assert 'http_requests_total{method="POST",route="/api/quests/",status="200"}' in metrics
+    assert 'http_requests_total{method="GET",route="/api/quests/",status="400"}' in metrics
+    assert 'http_request_duration_seconds_quantile{method="POST",route="/api/quests/",quantile="0.99"}' in metrics
+    assert 'db_queries_total{method="POST",route="/api/quests/"}' in metrics
+    assert "http_requests_in_flight 1" in metrics  # The /metrics request itself
+    assert registry.in_flight == 0
@@ -0,0 +1,149 @@
+# test_profiler.py
+
+import asyncio
+import json
+import logging
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import Depends
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.crud import select_user_by_tID
+from app.database import get_db
+from app.profiler import QueryProfiler, explain_prefix, normalize
+from main import create_app
+
+
+def test_fingerprints_ignore_literals_and_list_lengths():
+    assert normalize("SELECT * FROM users WHERE id IN (?, ?, ?) AND name = 'it''s'") == \
+        normalize("SELECT *  FROM users\nWHERE id IN (?) AND name = 'x'") == \
+        "SELECT * FROM users WHERE id IN (...) AND name = ?"
+    assert normalize("INSERT INTO quests (title) VALUES ($1::VARCHAR), ($2::VARCHAR)") == \
+        "INSERT INTO quests (title) VALUES (...)"
+    assert normalize("SELECT t1.a::text FROM t1 LIMIT 10 OFFSET :param_1") == "SELECT t1.a::text FROM t1 LIMIT ? OFFSET ?"
+
+    assert explain_prefix("postgresql", "SELECT 1") == "EXPLAIN (FORMAT JSON) "  # Never runs the statement
+    assert explain_prefix("postgresql", "SELECT count(*) FROM quests", analyze=True).startswith("EXPLAIN (ANALYZE, BUFFERS")
+    for unsafe in ("WITH x AS (DELETE FROM users RETURNING id) SELECT * FROM x",
+                   "SELECT nextval('quests_id_seq') FROM generate_series(1, $1)",
+                   "SELECT id FROM quests WHERE id = $1 FOR UPDATE",
+                   "SELECT refresh_stats()"):
+        assert "ANALYZE" not in explain_prefix("postgresql", unsafe, analyze=True)
+    assert explain_prefix("sqlite", "DELETE FROM users") == "EXPLAIN QUERY PLAN "
+    assert explain_prefix("sqlite", "COMMIT") is None
+
+
+@pytest_asyncio.fixture
+async def profiled(db_engine, monkeypatch):
+    # An app profiling every statement as slow, with one plan captured per statement shape
+    profiler = QueryProfiler(slow_threshold=0, explain_sample_rate=1, explain_interval=3600, n_plus_one_threshold=5,
+                             log=True)
+    monkeypatch.setattr("app.profiler.query_profiler", profiler)
+    app = create_app(get_settings().model_copy(update={"query_profiler_enabled": True}))
+
+    # An endpoint with an N+1: one lookup per user
+    @app.get("/n-plus-one")
+    async def look_up_one_by_one(db: AsyncSession = Depends(get_db)):
+        return [await select_user_by_tID(db, tID) for tID in range(8)]
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield profiler, client
+    profiler.uninstrument(db_engine)
+
+
+async def wait_for_plan(profiler, client, table: str):
+    # One plan is captured at a time: request pages until the page query of `table` has been explained
+    for _ in range(100):
+        if any(table in stats.statement and stats.plan for stats in profiler.stats.values()):
+            return
+        await client.get("/api/quests/")
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{profiler.explains} plans captured, none for {table}")
+
+
+@pytest.mark.asyncio
+async def test_slow_statements_are_explained(profiled):
+    profiler, client = profiled
+    for page in range(3):
+        assert (await client.get("/api/quests/", params={"skip": page * 10})).status_code == 200
+    report = (await client.get("/internal/queries", params={"sort": "calls"})).json()
+    assert report["enabled"] and report["statements"] >= 6
+    page_query = next(query for query in report["queries"] if "FROM quests" in query["statement"])
+    assert page_query["calls"] == 3  # Three pages, one shape
+    assert "LIMIT ? OFFSET ?" in page_query["statement"]
+    assert page_query["slow"] == 3
+
+    await wait_for_plan(profiler, client, "FROM quests")
+    report = (await client.get("/internal/queries")).json()
+    page_query = next(query for query in report["queries"] if "FROM quests" in query["statement"])
+    assert any("quests" in step for step in page_query["plan"])  # EXPLAIN QUERY PLAN on SQLite
+
+
+@pytest.mark.asyncio
+async def test_repeated_lookups_are_flagged(profiled, caplog):
+    profiler, client = profiled
+    with caplog.at_level(logging.WARNING, logger="app.queries"):
+        assert (await client.get("/n-plus-one")).status_code == 200
+        assert (await client.get("/api/users", params={"tids": "1,2,3,4,5,6,7"})).status_code == 200  # Batched
+
+    report = (await client.get("/internal/queries")).json()
+    assert [(entry["route"], entry["max_repeats"]) for entry in report["n_plus_one"]] == [("GET /n-plus-one", 8)]
+    assert 'users."tID" = ?' in report["n_plus_one"][0]["statement"]
+
+    events = [json.loads(record.getMessage()) for record in caplog.records if record.name == "app.queries"]
+    assert {"event": "n_plus_one", "route": "GET /n-plus-one", "repeats": 8}.items() <= \
+        next(event for event in events if event["event"] == "n_plus_one").items()
+
+
+@pytest.mark.asyncio
+async def test_sampling_keeps_only_slow_statements(db_engine):
+    profiler = QueryProfiler(slow_threshold=10, sample_rate=0)
+    profiler.instrument(db_engine)
+    try:
+        async with db_engine.connect() as connection:
+            for _ in range(5):
+                await connection.exec_driver_sql("SELECT 1")
+    finally:
+        profiler.uninstrument(db_engine)
+    assert profiler.statements == 5
+    assert profiler.sampled == 0 and profiler.report()["queries"] == []
+
+
+@pytest.mark.asyncio
+async def test_sampled_plans_do_not_run_volatile_statements(db_engine):
+    # nextval() of a real sequence on Postgres, a counting stand-in registered on each SQLite connection
+    calls = []
+    if db_engine.dialect.name == "sqlite":
+        await db_engine.dispose()
+        register = lambda dbapi_connection, record: dbapi_connection.create_function(
+            "nextval", 1, lambda name: calls.append(name) or len(calls))
+        event.listen(db_engine.sync_engine, "connect", register)
+    else:
+        async with db_engine.begin() as connection:
+            await connection.execute(text("DROP SEQUENCE IF EXISTS profiled_seq"))
+            await connection.execute(text("CREATE SEQUENCE profiled_seq"))
+
+    profiler = QueryProfiler(slow_threshold=0, explain_sample_rate=1, explain_analyze=True)
+    profiler.instrument(db_engine)
+    try:
+        async with db_engine.begin() as connection:
+            assert (await connection.execute(text("SELECT nextval('profiled_seq')"))).scalar() == 1
+        for _ in range(100):
+            if profiler.explains:
+                break
+            await asyncio.sleep(0.01)
+        assert profiler.explains == 1
+
+        async with db_engine.connect() as connection:
+            if db_engine.dialect.name == "sqlite":
+                assert calls == ["profiled_seq"]  # Planned, not run again
+            else:
+                assert (await connection.execute(text("SELECT last_value FROM profiled_seq"))).scalar() == 1
+    finally:
+        profiler.uninstrument(db_engine)
+        if db_engine.dialect.name == "sqlite":
+            event.remove(db_engine.sync_engine, "connect", register)
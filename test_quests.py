@@ -0,0 +1,306 @@
+# test_quests.py
+
+import asyncio
+import csv
+import io
+import json
+import os
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, text
+
+from main import app
+
+
+@pytest_asyncio.fixture
+async def client(db_engine):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+async def create_quests(client, titles):
+    for title in titles:
+        response = await client.post("/api/quests/", json={"title": title, "description": f"About {title}"})
+        assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_keyset_pagination_walks_every_quest_once(client):
+    titles = [f"Quest {n % 7}" for n in range(25)]  # Duplicate titles exercise the id tie-breaker
+    await create_quests(client, titles)
+
+    for sort in ("id", "title"):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 10, "sort": sort, **({"cursor": cursor} if cursor else {})}
+            response = await client.get("/api/quests/", params=params)
+            assert response.status_code == 200
+            seen += response.json()
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        key = (lambda q: q["id"]) if sort == "id" else (lambda q: (q["title"], q["id"]))
+        assert len(seen) == 25
+        assert seen == sorted(seen, key=key)
+
+
+@pytest.mark.asyncio
+async def test_offset_pagination_is_deterministic(client):
+    await create_quests(client, ["b", "a", "c"])
+    response = await client.get("/api/quests/", params={"skip": 1, "limit": 1, "sort": "title"})
+    assert [q["title"] for q in response.json()] == ["b"]
+
+    response = await client.get("/api/quests/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_bulk_insert_json_and_ndjson(client):
+    quests = [{"title": f"Bulk {n}", "description": "Imported"} for n in range(7)]
+    response = await client.post("/api/quests/bulk", params={"batch_size": 3}, json=quests)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["inserted"] == 7
+    assert [batch["size"] for batch in body["batches"]] == [3, 3, 1]
+    assert body["ids"] == sorted(body["ids"])
+
+    ndjson = "\n".join(f'{{"title": "Stream {n}", "description": "Imported"}}' for n in range(4)) + "\n"
+    response = await client.post("/api/quests/bulk", content=ndjson,
+                                 headers={"Content-Type": "application/x-ndjson"})
+    assert response.json()["inserted"] == 4
+
+    listed = await client.get("/api/quests/", params={"limit": 100})
+    assert [q["id"] for q in listed.json()] == body["ids"] + response.json()["ids"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_insert_failure_semantics(client):
+    quests = [{"title": "Good", "description": "Imported"}] * 4 + [{"title": "Bad"}]
+
+    # All-or-nothing: one invalid item rolls back every batch
+    response = await client.post("/api/quests/bulk", params={"batch_size": 2}, json=quests)
+    assert response.status_code == 422
+    assert response.json()["detail"]["batch"] == 2
+    assert (await client.get("/api/quests/")).json() == []
+
+    # Per-batch: only the batch with the invalid item is dropped
+    response = await client.post("/api/quests/bulk", params={"batch_size": 2, "atomic": False}, json=quests)
+    assert response.status_code == 200
+    assert [batch["status"] for batch in response.json()["batches"]] == ["committed", "committed", "failed"]
+    assert len((await client.get("/api/quests/")).json()) == 4
+
+
+@pytest.mark.asyncio
+async def test_bulk_insert_reports_committed_batches_before_invalid_json(client):
+    lines = [f'{{"title": "Stream {n}", "description": "Imported"}}' for n in range(5)]
+    ndjson = "\n".join(lines[:5] + ["{not json"] + lines[:1]) + "\n"
+    headers = {"Content-Type": "application/x-ndjson"}
+
+    # All-or-nothing: the unreadable line rolls everything back
+    response = await client.post("/api/quests/bulk", params={"batch_size": 2}, content=ndjson, headers=headers)
+    assert response.status_code == 400
+    assert (await client.get("/api/quests/")).json() == []
+
+    # Per-batch: the committed batches are kept and reported, the upload stops at the unreadable line
+    response = await client.post("/api/quests/bulk", params={"batch_size": 2, "atomic": False}, content=ndjson,
+                                 headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert [(batch["status"], batch["size"]) for batch in body["batches"]] == \
+        [("committed", 2), ("committed", 2), ("failed", 1)]
+    assert body["batches"][2]["error"].startswith("item 5: ")
+    assert body["inserted"] == 4
+    assert [q["id"] for q in (await client.get("/api/quests/")).json()] == body["ids"]
+
+
+@pytest.mark.asyncio
+async def test_export_formats(client):
+    await create_quests(client, ["Alpha", 'Beta, "quoted"'])
+
+    response = await client.get("/api/quests/export", params={"format": "ndjson", "chunk_size": 1})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == ["Alpha", 'Beta, "quoted"']
+
+    response = await client.get("/api/quests/export", params={"format": "csv"})
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["id", "title", "description"]
+    assert [row[1] for row in rows[1:]] == ["Alpha", 'Beta, "quoted"']
+
+
+@pytest.mark.asyncio
+async def test_search_ranks_and_paginates(client):
+    await create_quests(client, ["Dragon hunt", "Forest walk", "Dragon egg", "River crossing"])
+    await client.post("/api/quests/", json={"title": "Mountain trip", "description": "Beware of the dragon"})
+
+    # Title matches rank above description matches, prefixes match whole words
+    response = await client.get("/api/quests/search", params={"q": "drag"})
+    assert response.status_code == 200
+    hits = response.json()
+    assert [hit["title"] for hit in hits][-1] == "Mountain trip"
+    assert {hit["title"] for hit in hits[:2]} == {"Dragon hunt", "Dragon egg"}
+    assert hits == sorted(hits, key=lambda hit: (-hit["rank"], hit["id"]))
+
+    # Every term must match
+    response = await client.get("/api/quests/search", params={"q": "dragon egg"})
+    assert [hit["title"] for hit in response.json()] == ["Dragon egg"]
+
+    # The cursor walks the ranked results without repeats
+    seen, cursor = [], None
+    while True:
+        params = {"q": "dragon", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/quests/search", params=params)
+        seen += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [hit["id"] for hit in seen] == [hit["id"] for hit in hits]
+
+    # Cursors of the listing endpoint are not accepted by search and vice versa
+    listing = await client.get("/api/quests/", params={"limit": 1})
+    response = await client.get("/api/quests/search", params={"q": "dragon", "cursor": listing.headers["X-Next-Cursor"]})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_search_index_follows_writes(client):
+    assert (await client.get("/api/quests/search", params={"q": "crystal"})).json() == []
+
+    await client.post("/api/quests/bulk", json=[{"title": "Crystal cave", "description": "Imported"}])
+    assert [hit["title"] for hit in (await client.get("/api/quests/search", params={"q": "crystal"})).json()] == [
+        "Crystal cave"]
+
+    # Query syntax characters are treated as plain text
+    response = await client.get("/api/quests/search", params={"q": '"crystal* OR ('})
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_conditional_get_skips_the_catalog(client, db_engine):
+    await create_quests(client, ["Alpha", "Beta"])
+    first = await client.get("/api/quests/", params={"limit": 1})
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "no-cache"
+    assert "Last-Modified" in first.headers
+
+    # Other pages of the same catalog version have their own tags
+    second = await client.get("/api/quests/", params={"limit": 1, "skip": 1})
+    assert second.headers["ETag"] != etag
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = await client.get("/api/quests/", params={"limit": 1}, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+        response = await client.get("/api/quests/", params={"limit": 1},
+                                    headers={"If-Modified-Since": first.headers["Last-Modified"]})
+        assert response.status_code == 304
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", listener)
+    assert statements and not any("FROM quests" in statement for statement in statements)
+
+    # A new quest invalidates the tag immediately, through the single and the bulk endpoint
+    await create_quests(client, ["Gamma"])
+    response = await client.get("/api/quests/", params={"limit": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    etag = response.headers["ETag"]
+    await client.post("/api/quests/bulk", json=[{"title": "Delta", "description": "Imported"}])
+    response = await client.get("/api/quests/", params={"limit": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+async def total_count(client, mode: str = "exact") -> int:
+    response = await client.get("/api/quests/", params={"limit": 1, "count": mode})
+    return int(response.headers["X-Total-Count"])
+
+
+@pytest.mark.asyncio
+async def test_total_count_stays_exact_under_concurrent_writes(client, db_engine):
+    assert await total_count(client) == 0
+    assert "X-Total-Count" not in (await client.get("/api/quests/")).headers  # Only counted on request
+
+    # Concurrent single creates and bulk inserts, plus a bulk insert that is rolled back
+    bulk = [{"title": f"Bulk {n}", "description": "Imported"} for n in range(10)]
+    responses = await asyncio.gather(
+        *(client.post("/api/quests/", json={"title": f"Quest {n}", "description": "New"}) for n in range(40)),
+        *(client.post("/api/quests/bulk", params={"batch_size": 4}, json=bulk) for _ in range(3)),
+        client.post("/api/quests/bulk", json=bulk + [{"title": "Invalid"}]),
+    )
+    assert [response.status_code for response in responses] == [200] * 43 + [422]
+
+    async with db_engine.connect() as conn:
+        scanned = (await conn.execute(text("SELECT COUNT(*) FROM quests"))).scalar()
+    assert scanned == 70
+    assert await total_count(client) == 70
+    assert await total_count(client, "estimated") == 70  # No planner estimate on SQLite: the exact count
+
+    # Deletes are counted too, whoever issues them
+    async with db_engine.begin() as conn:
+        await conn.execute(text("DELETE FROM quests WHERE id <= 5"))
+    assert await total_count(client) == 65
+
+    # The counter is read in the page's session, never by scanning quests
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        await total_count(client)
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", listener)
+    assert not any("count(" in statement.lower() for statement in statements)
+
+
+def current_rss() -> int:
+    # Resident set size of this process in bytes
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="needs /proc to read RSS")
+async def test_export_memory_stays_flat(db_engine):
+    rows = int(os.getenv("EXPORT_TEST_ROWS", 1_000_000))
+    budget = 64 * 1024 * 1024  # Materializing 1M quests would take several hundred MB
+
+    # Generate the rows inside the database so seeding does not inflate this process
+    async with db_engine.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO quests (title, description) "
+            "WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < :rows) "
+            "SELECT 'Quest ' || n, 'A fairly ordinary description of quest number ' || n FROM seq"
+        ), {"rows": rows})
+
+    # Drive the ASGI app directly: httpx's ASGITransport buffers the whole body
+    baseline, peak, lines = current_rss(), 0, 0
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": "/api/quests/export", "raw_path": b"/api/quests/export",
+             "query_string": b"format=ndjson", "headers": [], "server": ("test", 80), "client": ("test", 1),
+             "root_path": ""}
+
+    request_sent, response_done = False, asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_done.wait()  # The client stays connected until the body is complete
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal peak, lines
+        if message["type"] == "http.response.body":
+            lines += message.get("body", b"").count(b"\n")
+            peak = max(peak, current_rss() - baseline)
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    assert lines == rows
+    assert peak < budget, f"export grew RSS by {peak / 2**20:.1f} MB"
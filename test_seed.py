@@ -0,0 +1,74 @@
+# test_seed.py
+
+import os
+import subprocess
+import sys
+
+import pytest
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, func, select, text
+
+from app.crud import get_catalog_version
+from app.database import AsyncSessionLocal
+from app.models import Quest, User
+from scripts.seed import Progress, generate_quests, generate_users, load, finish, user_tID, worker_chunks
+
+
+def test_generation_is_deterministic():
+    assert generate_users(0, 500, seed=7) == generate_users(0, 500, seed=7)
+    assert generate_users(0, 500, seed=7) != generate_users(0, 500, seed=8)
+    assert generate_quests(100, 50, seed=7) == generate_quests(100, 50, seed=7)
+
+    # Every worker count deals the same batches, and Telegram IDs never collide
+    batches = {workers: sorted(chunk for worker in range(workers) for chunk in worker_chunks(10_050, 1000, worker, workers))
+               for workers in (1, 3, 4)}
+    assert batches[1] == batches[3] == batches[4] and batches[1][-1] == (10_000, 50)
+    tIDs = [row[0] for start, count in batches[1] for row in generate_users(start, count, seed=7)]
+    assert len(set(tIDs)) == 10_050 and tIDs[1234] == user_tID(1234, seed=7)
+    assert max(tIDs) > 2**31  # Bigint IDs, like Telegram's
+
+    users = generate_users(0, 10_000, seed=7, premium_ratio=0.2)
+    assert 0.17 < sum(row[5] for row in users) / len(users) < 0.23
+    assert len({row[4] for row in users}) == 9  # Every language
+
+
+@pytest.mark.asyncio
+async def test_seeding_loads_batches_and_bumps_the_catalog(db_engine):
+    database_url = os.environ["DATABASE_URL"]
+    totals = {"users": 2500, "quests": 120}
+    progress = Progress(totals, interval=3600)
+    await load(database_url, totals, seed=7, batch_size=1000, premium_ratio=0.05, report=progress.update)
+    await finish(database_url, list(totals))
+    assert progress.loaded == totals
+
+    async with AsyncSessionLocal() as db:
+        assert (await db.execute(select(func.count()).select_from(User))).scalar() == 2500
+        assert (await db.execute(select(func.count(func.distinct(User.tID))))).scalar() == 2500
+        assert (await db.execute(select(func.count()).select_from(Quest))).scalar() == 120
+        tID = (await db.execute(select(User.tID).where(User.id == 2000))).scalar()
+        assert tID == user_tID(1999, seed=7)
+        assert (await get_catalog_version(db))[0] == 1
+
+
+def test_cli_applies_the_schema_and_seeds(tmp_path):
+    database_url = f"sqlite+aiosqlite:///{tmp_path}/seed.db"
+    result = subprocess.run(
+        [sys.executable, "-m", "scripts.seed", "--users", "3000", "--quests", "50", "--batch-size", "1000",
+         "--workers", "2", "--database-url", database_url, "--truncate"],
+        env={**os.environ, "DB_PROFILE": "test"}, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "users 3,000/3,000, quests 50/50" in result.stdout
+    assert "Seeded 3,050 rows" in result.stdout
+
+    # The schema came from the migrations (--schema migrate is the default): at head, with the triggers
+    # keeping the quest count
+    engine = create_engine(database_url.replace("+aiosqlite", ""))
+    try:
+        with engine.connect() as connection:
+            head = ScriptDirectory.from_config(Config("alembic.ini")).get_current_head()
+            assert connection.execute(text("SELECT version_num FROM alembic_version")).scalar() == head
+            assert connection.execute(text("SELECT count FROM row_counts WHERE name = 'quests'")).scalar() == 50
+    finally:
+        engine.dispose()
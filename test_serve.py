@@ -0,0 +1,89 @@
+# test_serve.py
+
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from app.serve import pool_budget
+
+
+def test_budget_is_split_between_workers():
+    assert pool_budget(60, 4) == (10, 5)
+    assert pool_budget(7, 3) == (1, 1)  # The remainder is left unused
+    assert pool_budget(3, 3) == (1, 0)
+    with pytest.raises(ValueError):
+        pool_budget(2, 3)
+
+
+def read_stats(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def wait_for(predicate, path: str, timeout: float = 30):
+    # Poll the supervisor's stats file until `predicate(stats)` holds
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            stats = read_stats(path)
+            if predicate(stats):
+                return stats
+        time.sleep(0.1)
+    raise AssertionError(f"Timed out waiting for the workers: {read_stats(path) if os.path.exists(path) else None}")
+
+
+async def get_quests(client):
+    # A worker reaching --max-requests closes the connections it accepted but has not read yet;
+    # the request was never served, so it is sent again
+    for attempt in range(3):
+        try:
+            return await client.get("/api/quests/")
+        except httpx.RemoteProtocolError:
+            if attempt == 2:
+                raise
+
+
+@pytest.mark.asyncio
+async def test_workers_respect_the_connection_budget(db_engine, tmp_path):
+    stats_file = str(tmp_path / "stats.json")
+    # A read replica (the same SQLite file): every worker has a pool per database, each within the budget
+    supervisor = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--host", "127.0.0.1", "--port", "0", "--workers", "3",
+         "--db-connections", "6", "--max-requests", "60", "--stats-interval", "0.2", "--stats-file", stats_file],
+        env={**os.environ, "DB_PROFILE": "test", "METRICS_ENABLED": "false",
+             "DATABASE_REPLICA_URLS": os.environ["DATABASE_URL"]},
+    )
+    try:
+        stats = wait_for(lambda stats: all(p and "pools" in p for p in stats["processes"].values()), stats_file)
+        assert stats["budget"] == {"connections": 6, "pool_size": 1, "max_overflow": 1, "databases": 2, "total": 12}
+        for process in stats["processes"].values():
+            assert set(process["pools"]) == {"primary", "replica-0"}
+            assert all(pool["size"] == 1 and pool["max_overflow"] == 1 for pool in process["pools"].values())
+
+        # Far more concurrent requests than connections, and enough for workers to hit --max-requests
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{stats['port']}",
+                                     limits=httpx.Limits(max_connections=60, max_keepalive_connections=0),
+                                     timeout=60) as client:  # A restarting worker closes its idle connections
+            for round in range(4):
+                responses = await asyncio.gather(*(get_quests(client) for _ in range(60)))
+                assert all(response.status_code == 200 for response in responses)
+            response = await client.post("/api/quests/", json={"title": "Served", "description": "By a worker"})
+            assert response.status_code == 200
+
+        stats = wait_for(lambda stats: stats["requests"] >= 241 and stats["restarts"] >= 1, stats_file)
+        assert set(stats["peak_connections"]) == {"primary", "replica-0"}
+        for name, peaks in stats["peak_connections"].items():
+            assert all(peak <= 2 for peak in peaks.values())  # 1 pooled + 1 overflow each
+            assert stats["peak_connections_total"][name] <= 6  # The budget holds for each database
+        assert stats["peak_connections_total"]["replica-0"] >= 1  # The page reads went to the replica
+        assert len({process["pid"] for process in stats["processes"].values()}) == 3
+    finally:
+        supervisor.send_signal(signal.SIGTERM)
+        assert supervisor.wait(timeout=30) == 0
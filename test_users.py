@@ -0,0 +1,462 @@
+# test_users.py
+
+import asyncio
+import os
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, func, select
+
+from app.cache import LocalCache, MemoryStore, SharedCache, UserCache, build_user_cache
+from app.config import Settings
+from app.crud import create_user, delete_user_by_id, get_user_by_tID, select_user_by_tID, upsert_users
+from app.registration import build_registration_batcher
+from app.utils.batcher import WriteBatcher
+from app.database import AsyncSessionLocal
+from app.models import User
+from app.schemas import UserCreate, User as UserSchema
+from app.utils.validate import build_init_data
+from main import app
+
+USER = {"first_name": "Andrew", "last_name": "Rogue", "username": "rogue",
+        "language_code": "en", "is_premium": False, "allows_write_to_pm": True}
+
+
+def init_data_for(tID: int, **overrides) -> dict:
+    return {"initDataRaw": build_init_data({**USER, **overrides, "id": tID}, os.environ["BOT_TOKEN"])}
+
+
+async def count_users() -> int:
+    async with AsyncSessionLocal() as session:
+        return await session.scalar(select(func.count()).select_from(User))
+
+
+@pytest.mark.asyncio
+async def test_login_registers_then_refreshes_profile(db_engine):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        first = await client.post("/api/users", json=init_data_for(1001))
+        assert first.status_code == 200
+        assert first.json()["redirect"] == "/choose-role"
+        assert first.json()["user"]["tID"] == 1001  # The stored user, as for returning users
+        assert first.json()["user"]["id"] == 1001  # The key new users were always reported under
+
+        second = await client.post("/api/users", json=init_data_for(1001, username="renamed", is_premium=True))
+        assert second.status_code == 200
+        assert second.json()["redirect"] == "/profile"
+        assert second.json()["user"]["username"] == "renamed"
+        assert second.json()["user"]["is_premium"] is True
+
+    assert await count_users() == 1
+
+
+@pytest.mark.asyncio
+async def test_login_with_an_incomplete_user_is_rejected(db_engine):
+    payload = {key: value for key, value in USER.items() if key != "first_name"}
+    invalid = [
+        {"initDataRaw": build_init_data(payload, os.environ["BOT_TOKEN"])},  # Neither an id nor a first name
+        {"initDataRaw": build_init_data({**payload, "id": 1002}, os.environ["BOT_TOKEN"])},
+    ]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        responses = [await client.post("/api/users", json=body) for body in invalid]
+    assert [r.status_code for r in responses] == [422, 422]
+    assert "first_name" in str(responses[1].json()["detail"])
+    assert await count_users() == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_logins(db_engine):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        # Hundreds of simultaneous first logins for the same tID: exactly one registration, no errors
+        same = await asyncio.gather(*(client.post("/api/users", json=init_data_for(2002)) for _ in range(200)))
+        assert [r.status_code for r in same] == [200] * 200
+        redirects = [r.json()["redirect"] for r in same]
+        assert redirects.count("/choose-role") == 1
+        assert redirects.count("/profile") == 199
+
+        # Hundreds of simultaneous first logins for different tIDs: each one is new
+        different = await asyncio.gather(*(client.post("/api/users", json=init_data_for(3000 + i)) for i in range(200)))
+        assert all(r.status_code == 200 and r.json()["redirect"] == "/choose-role" for r in different)
+
+    assert await count_users() == 201
+
+
+@pytest_asyncio.fixture
+async def user_cache(db_engine, monkeypatch):
+    # A fresh cache per test, small enough to watch evictions
+    fresh = UserCache(LocalCache(maxsize=100), negative_maxsize=10)
+    monkeypatch.setattr("app.cache.user_cache", fresh)
+    return fresh
+
+
+@pytest.mark.asyncio
+async def test_cold_key_lookups_are_coalesced(user_cache, db_engine):
+    async with AsyncSessionLocal() as db:
+        await create_user(db, UserCreate(id=4004, **USER))
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        async with AsyncSessionLocal() as db:
+            users = await asyncio.gather(*(get_user_by_tID(db, 4004) for _ in range(1000)))
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", listener)
+
+    assert len([s for s in statements if "FROM users" in s]) == 1
+    assert {user.username for user in users} == {"rogue"}
+    assert user_cache.stats()["misses"] == 1
+    assert user_cache.stats()["coalesced"] == 999
+
+
+@pytest.mark.asyncio
+async def test_unknown_tids_and_invalidation(user_cache):
+    async with AsyncSessionLocal() as db:
+        await create_user(db, UserCreate(id=5005, **USER))
+        assert (await get_user_by_tID(db, 5005)).tID == 5005
+
+        # Unknown tIDs are remembered, in their own LRU: a flood of them never evicts real users
+        assert await get_user_by_tID(db, 6006) is None
+        assert await get_user_by_tID(db, 6006) is None
+        for tID in range(7000, 7500):
+            await get_user_by_tID(db, tID)
+        stats = user_cache.stats()
+        assert stats["negative_hits"] == 1
+        assert stats["size"] == 1 and stats["negative_size"] == 10
+        assert stats["evictions"] == 491
+        assert (await get_user_by_tID(db, 5005)).tID == 5005
+
+        # Registering and deleting invalidate the cached entries
+        await create_user(db, UserCreate(id=7499, **USER))
+        assert (await get_user_by_tID(db, 7499)).tID == 7499
+        assert await delete_user_by_id(db, 5005)
+        assert await get_user_by_tID(db, 5005) is None
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        await client.post("/api/users", json=init_data_for(7499, username="renamed"))
+        stats = (await client.get("/internal/user-cache")).json()
+    async with AsyncSessionLocal() as db:
+        assert (await get_user_by_tID(db, 7499)).username == "renamed"
+    assert stats["enabled"] and stats["invalidations"] == 4
+
+
+@pytest.mark.asyncio
+async def test_shared_backend_is_seen_by_every_worker(db_engine):
+    store = MemoryStore()
+    workers = [UserCache(SharedCache(store, UserSchema, prefix="user:")) for _ in range(2)]
+    async with AsyncSessionLocal() as db:
+        await create_user(db, UserCreate(id=8008, **USER))
+        await workers[0].get_or_load(8008, lambda: select_user_by_tID(db, 8008))
+
+        async def unexpected_load():
+            raise AssertionError("served from the shared store")
+
+        assert (await workers[1].get_or_load(8008, unexpected_load)).username == "rogue"
+        await workers[1].invalidate(8008)
+        assert await store.get("user:8008") is None
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate_every_worker(db_engine, monkeypatch):
+    # Two workers' caches over one shared store: a write through either is seen by both
+    settings = Settings(user_cache_enabled=True, web_workers=2)
+    store = MemoryStore()
+    workers = [build_user_cache(settings, client=store) for _ in range(2)]
+    assert all(isinstance(worker.negative, SharedCache) for worker in workers)
+
+    async def lookup(worker, tID):
+        monkeypatch.setattr("app.cache.user_cache", worker)
+        async with AsyncSessionLocal() as db:
+            return await get_user_by_tID(db, tID)
+
+    async def write(worker, action):
+        monkeypatch.setattr("app.cache.user_cache", worker)
+        async with AsyncSessionLocal() as db:
+            return await action(db)
+
+    await write(workers[1], lambda db: create_user(db, UserCreate(id=9009, **USER)))
+    assert (await lookup(workers[0], 9009)).tID == 9009
+    assert await lookup(workers[0], 9010) is None  # Remembered as unknown
+
+    await write(workers[1], lambda db: delete_user_by_id(db, 9009))
+    await write(workers[1], lambda db: create_user(db, UserCreate(id=9010, **USER)))
+    assert await lookup(workers[0], 9009) is None
+    assert (await lookup(workers[0], 9010)).tID == 9010
+    assert workers[0].stats()["misses"] == 4
+
+
+@pytest.mark.asyncio
+async def test_load_started_before_another_workers_write_is_not_stored(db_engine):
+    # Worker A loads the old profile, worker B commits a new one and invalidates before A stores its copy
+    settings = Settings(user_cache_enabled=True, web_workers=2)
+    store = MemoryStore()
+    worker_a, worker_b = [build_user_cache(settings, client=store) for _ in range(2)]
+    async with AsyncSessionLocal() as db:
+        await create_user(db, UserCreate(id=9100, **USER))
+
+    loading, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_load():
+        async with AsyncSessionLocal() as db:
+            user = await select_user_by_tID(db, 9100)
+        loading.set()
+        await release.wait()
+        return user
+
+    lookup = asyncio.create_task(worker_a.get_or_load(9100, slow_load))
+    await loading.wait()
+    async with AsyncSessionLocal() as db:
+        await db.execute(User.__table__.update().where(User.tID == 9100).values(username="renamed"))
+        await db.commit()
+    await worker_b.invalidate(9100)
+    release.set()
+    assert (await lookup).username == "rogue"  # The caller gets what it loaded...
+    assert await store.get("user:9100") is None  # ...but the stale copy is not shared
+
+    async with AsyncSessionLocal() as db:
+        assert (await worker_b.get_or_load(9100, lambda: select_user_by_tID(db, 9100))).username == "renamed"
+        assert (await worker_a.get_or_load(9100, lambda: select_user_by_tID(db, 9100))).username == "renamed"
+    assert worker_a.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_lookup_does_not_cancel_the_coalesced_ones():
+    cache = UserCache(LocalCache())
+    release = asyncio.Event()
+
+    async def slow_load():
+        await release.wait()
+        return UserSchema(tID=9300, **USER)
+
+    owner = asyncio.create_task(cache.get_or_load(9300, slow_load))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load(9300, slow_load))
+    await asyncio.sleep(0)
+    owner.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert (await waiter).tID == 9300
+    assert owner.cancelled()
+    assert cache.stats()["coalesced"] == 1 and cache.stats()["size"] == 1  # The load finished and was kept
+
+
+@pytest.mark.asyncio
+async def test_users_without_optional_names_are_cached(db_engine, monkeypatch):
+    # Seeded and real Telegram users may have no last name or username
+    monkeypatch.setattr("app.cache.user_cache", build_user_cache(Settings(user_cache_enabled=True, web_workers=2),
+                                                                 client=MemoryStore()))
+    async with AsyncSessionLocal() as db:
+        await db.execute(User.__table__.insert().values(tID=9200, first_name="Anna", language_code="uk",
+                                                        is_premium=False, allows_write_to_pm=True))
+        await db.commit()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        responses = [await client.get("/api/users/9200") for _ in range(2)]  # Loaded, then from the cache
+        login = await client.post("/api/users", json=init_data_for(9201, last_name=None, username=None))
+    assert [r.status_code for r in responses] == [200, 200]
+    assert responses[1].json()["username"] is None and responses[1].json()["last_name"] is None
+    assert login.status_code == 200 and login.json()["user"]["username"] is None
+
+
+def test_local_cache_is_single_worker_only():
+    assert build_user_cache(Settings()) is None  # Off by default
+    assert isinstance(build_user_cache(Settings(user_cache_enabled=True)).backend, LocalCache)
+    with pytest.raises(ValueError):
+        build_user_cache(Settings(user_cache_enabled=True, user_cache_backend="local", web_workers=2))
+    with pytest.raises(ValueError):
+        build_user_cache(Settings(user_cache_enabled=True, web_workers=2))  # Shared, without USER_CACHE_URL
+
+
+@pytest.mark.asyncio
+async def test_read_user_route(user_cache):
+    async with AsyncSessionLocal() as db:
+        await create_user(db, UserCreate(id=9100, **USER))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        found = [await client.get("/api/users/9100") for _ in range(2)]
+        missing = await client.get("/api/users/9101")
+    assert [r.status_code for r in found] == [200, 200]
+    assert found[0].json()["tID"] == 9100 and found[0].json()["username"] == "rogue"
+    assert missing.status_code == 404
+    assert user_cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batched_lookup(user_cache, db_engine):
+    async with AsyncSessionLocal() as db:
+        for tID in (9001, 9002, 9003):
+            await create_user(db, UserCreate(id=tID, **{**USER, "username": f"user{tID}"}))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/api/users", params={"tids": "9003,1,9001,9003"})
+        assert response.status_code == 200
+        assert [user["tID"] for user in response.json()["users"]] == [9003, 9001]
+        assert response.json()["missing"] == [1]
+
+        response = await client.post("/api/users/lookup", json={"tids": [9002, 9001, 2]})
+        assert [user["username"] for user in response.json()["users"]] == ["user9002", "user9001"]
+        assert response.json()["missing"] == [2]
+
+        assert (await client.get("/api/users", params={"tids": "1,x"})).status_code == 422
+        too_many = await client.post("/api/users/lookup", json={"tids": list(range(1001))})
+        assert too_many.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_query(db_engine, monkeypatch):
+    monkeypatch.setattr("app.cache.user_cache", None)  # Every lookup reaches the loader
+    async with AsyncSessionLocal() as db:
+        for tID in range(10_000, 10_050):
+            await create_user(db, UserCreate(id=tID, **USER))
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        async with AsyncSessionLocal() as db:
+            users = await asyncio.gather(*(get_user_by_tID(db, tID) for tID in range(10_000, 10_060)))
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", listener)
+
+    assert len([s for s in statements if "FROM users" in s]) == 1
+    assert [user.tID for user in users[:50]] == list(range(10_000, 10_050))
+    assert users[50:] == [None] * 10
+
+
+@pytest.mark.asyncio
+async def test_lookups_see_the_callers_transaction(user_cache):
+    async with AsyncSessionLocal() as db:
+        assert await get_user_by_tID(db, 11_011) is None  # Remembered as unknown by the cache
+
+        # An uncommitted registration is visible in its own session, never to the cache or other sessions
+        await db.execute(User.__table__.insert().values(tID=11_011, **USER))
+        assert (await asyncio.gather(get_user_by_tID(db, 11_011), get_user_by_tID(db, 11_011)))[0].tID == 11_011
+        async with AsyncSessionLocal() as other:
+            assert await get_user_by_tID(other, 11_011) is None
+        await db.rollback()
+        assert await get_user_by_tID(db, 11_011) is None
+    assert user_cache.stats()["size"] == 0
+
+
+@pytest_asyncio.fixture
+async def batcher(db_engine, monkeypatch):
+    batcher = build_registration_batcher(Settings(database_url="sqlite+aiosqlite://", registration_batch_size=50,
+                                                  registration_batch_delay=0.05))
+    batcher.start()
+    monkeypatch.setattr("app.registration.registration_batcher", batcher)
+    yield batcher
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_registration_bursts_are_batched(batcher):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        # 150 users, each one logging in twice within the burst
+        payloads = [init_data_for(20_000 + i % 150, username=f"burst{i}") for i in range(300)]
+        responses = await asyncio.gather(*(client.post("/api/users", json=payload) for payload in payloads))
+
+    assert [r.status_code for r in responses] == [200] * 300
+    redirects = [r.json()["redirect"] for r in responses]
+    assert redirects.count("/choose-role") == 150
+    assert await count_users() == 150
+    assert batcher.flushes <= 10
+    assert batcher.size_histogram.count == batcher.flushes
+
+
+@pytest.mark.asyncio
+async def test_full_registration_queue_sheds_load(db_engine, monkeypatch):
+    async def flush(users):
+        return [(user, True) for user in users]
+
+    batcher = WriteBatcher(flush, max_size=10, max_delay=0, max_queue=2)
+    monkeypatch.setattr("app.registration.registration_batcher", batcher)
+    # Not started yet, so the queue fills up
+    queued = [asyncio.create_task(batcher.submit(UserCreate(id=30_000 + i, **USER))) for i in range(2)]
+    await asyncio.sleep(0)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/api/users", json=init_data_for(30_002))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert batcher.rejected == 1
+
+    batcher.start()
+    assert [created for user, created in await asyncio.gather(*queued)] == [True, True]
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_upsert_users_reports_each_tid_once(db_engine):
+    async with AsyncSessionLocal() as db:
+        await create_user(db, UserCreate(id=40_000, **USER))
+        results = await upsert_users(db, [UserCreate(id=40_000, **{**USER, "username": "a"}),
+                                          UserCreate(id=40_001, **{**USER, "username": "b"}),
+                                          UserCreate(id=40_001, **{**USER, "username": "c"})])
+    assert [(user.username, created) for user, created in results] == [("a", False), ("c", True), ("c", False)]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_login_writes_nothing(user_cache, db_engine):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        assert (await client.post("/api/users", json=init_data_for(41_000))).status_code == 200
+        assert (await client.get("/api/users/41000")).status_code == 200  # Now cached
+
+        same = await client.post("/api/users", json=init_data_for(41_000))
+        assert same.json()["redirect"] == "/profile"
+        assert same.json()["user"]["username"] == USER["username"]
+        assert user_cache.stats()["invalidations"] == 1  # Only the registration, the cached copy is kept
+
+        renamed = await client.post("/api/users", json=init_data_for(41_000, username="renamed"))
+        assert renamed.json()["user"]["username"] == "renamed"
+        assert user_cache.stats()["invalidations"] == 2
+        assert (await client.get("/api/users/41000")).json()["username"] == "renamed"
+
+    async with AsyncSessionLocal() as db:
+        results = await upsert_users(db, [UserCreate(id=41_000, **{**USER, "username": "renamed"}),
+                                          UserCreate(id=41_001, **USER)])
+    assert [(user.username, created) for user, created in results] == [("renamed", False), (USER["username"], True)]
+    assert user_cache.stats()["invalidations"] == 3  # Only the new user
+
+
+@pytest.mark.asyncio
+async def test_delete_is_a_single_statement(user_cache, db_engine):
+    async with AsyncSessionLocal() as db:
+        await create_user(db, UserCreate(id=50_000, **USER))
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            assert (await client.delete("/api/users/50000")).status_code == 200
+            assert (await client.delete("/api/users/50000")).status_code == 404
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", listener)
+    assert [s.split()[0] for s in statements] == ["DELETE", "DELETE"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_commits_per_chunk(user_cache):
+    async with AsyncSessionLocal() as db:
+        for tID in range(60_000, 60_010):
+            await create_user(db, UserCreate(id=tID, **USER))
+        assert (await get_user_by_tID(db, 60_000)) is not None  # Cached, must be invalidated
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        tids = [60_000, 1, 60_001, 60_002, 60_001, 2, 60_003]
+        response = await client.post("/api/users/bulk-delete", params={"chunk_size": 3, "commit_every": 2}, json=tids)
+        body = response.json()
+        assert body["deleted"] == [60_000, 60_001, 60_002, 60_003]
+        assert body["not_found"] == [1, 60_001, 2]  # 60_001 was already deleted by the first chunk
+        assert (body["chunks"], body["commits"]) == (3, 2)
+
+        ndjson = "".join(f"{tID}\n" for tID in range(60_004, 60_010))
+        response = await client.post("/api/users/bulk-delete", params={"chunk_size": 4, "commit_every": 0},
+                                     content=ndjson, headers={"Content-Type": "application/x-ndjson"})
+        assert (response.json()["chunks"], response.json()["commits"]) == (2, 1)
+        assert len(response.json()["deleted"]) == 6
+
+        response = await client.post("/api/users/bulk-delete", json=[1, "two"])
+        assert response.status_code == 422
+
+    assert await count_users() == 0
+    async with AsyncSessionLocal() as db:
+        assert await get_user_by_tID(db, 60_000) is None
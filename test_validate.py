@@ -0,0 +1,65 @@
+# test_validate.py
+
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.validate import InitDataVerifier, build_init_data, validate_init_data
+
+BOT_TOKEN = "123456:test-token"
+USER = {"id": 99281932, "first_name": "Andrew", "last_name": "Rogue", "username": "rogue",
+        "language_code": "en", "is_premium": True, "allows_write_to_pm": True}
+
+
+def test_verify_returns_parsed_user():
+    init_data_raw = build_init_data(USER, BOT_TOKEN, chat_type="sender")
+    result = InitDataVerifier(BOT_TOKEN).verify(init_data_raw)
+    assert result.user == USER
+    # The legacy helper keeps returning the parsed params
+    assert validate_init_data(init_data_raw, BOT_TOKEN)["chat_type"] == "sender"
+
+
+def test_verify_rejects_tampered_and_outdated_data():
+    verifier = InitDataVerifier(BOT_TOKEN)
+    init_data_raw = build_init_data(USER, BOT_TOKEN)
+    with pytest.raises(HTTPException) as exc:
+        verifier.verify(init_data_raw.replace("Andrew", "Mallory"))
+    assert exc.value.detail == "Invalid hash"
+
+    outdated = build_init_data(USER, BOT_TOKEN, auth_date=int(time.time()) - 90000)
+    with pytest.raises(HTTPException) as exc:
+        verifier.verify(outdated)
+    assert exc.value.detail == "Outdated data"
+
+
+def test_cache_is_keyed_on_hash_and_raw_payload():
+    verifier = InitDataVerifier(BOT_TOKEN, cache_size=2)
+    init_data_raw = build_init_data(USER, BOT_TOKEN)
+    first = verifier.verify(init_data_raw)
+    assert verifier.verify(init_data_raw) is first
+
+    # Reusing a known hash with a different payload must not hit the cache, nor evict the genuine entry
+    forged = init_data_raw.replace("rogue", "admin")
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            verifier.verify(forged)
+    assert len(verifier._cache) == 1
+    secret_keys, verifier._secret_keys = verifier._secret_keys, []  # Only the cache can answer now
+    assert verifier.verify(init_data_raw) is first
+    verifier._secret_keys = secret_keys
+
+    # The cache stays bounded
+    for i in range(3):
+        verifier.verify(build_init_data({**USER, "id": i}, BOT_TOKEN))
+    assert len(verifier._cache) == 2
+
+
+def test_key_rotation_accepts_previous_token():
+    old_payload = build_init_data(USER, "old-token")
+    verifier = InitDataVerifier(BOT_TOKEN, previous_tokens=["old-token"])
+    assert verifier.verify(old_payload).user == USER
+
+    verifier.rotate(BOT_TOKEN)
+    with pytest.raises(HTTPException):
+        verifier.verify(old_payload)